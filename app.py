@@ -1,20 +1,47 @@
 import os
 import sys
-import json
-from flask import Flask, request, abort, jsonify
+import click
+from flask import Flask, request, abort, Response, stream_with_context
+from flask.cli import ScriptInfo
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import exc
 from flask_cors import CORS
-from flask_migrate import Migrate
 
-from models import db, setup_db, Actor, Movie
-from auth import AuthError, requires_auth
+from models import db, setup_db, Actor, Movie, select_fields, format_rows, bulk_insert, export_chunks, \
+  parse_link_operations, update_links, parse_ids, delete_rows, catalog_stats
+from auth import AuthError, requires_auth, local_only
+from pagination import page_params, split_page
+from fieldsets import fieldset_params
+from filters import filter_params, sort_page
+from cache import response_cache
+from etags import conditional
+from search import search_model
+from graph import find_costars, find_path, labels
+from pool import pool_stats
+from metrics import metrics
+from queries import query_log
+from serialization import json_responses, jsonify
+
+'''
+is_flask_cli()
+    returns True when the app is created by the flask command (i.e. flask db upgrade)
+'''
+def is_flask_cli():
+  context = click.get_current_context(silent=True)
+  return context is not None and context.find_object(ScriptInfo) is not None
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
   setup_db(app)
-  migrate = Migrate(app, db)
+  # alembic is only imported by the commands managing the migrations, manage.py registers its own Migrate
+  if is_flask_cli():
+    from flask_migrate import Migrate
+    migrate = Migrate(app, db)
+  response_cache.init_app(app)
+  metrics.init_app(app)
+  query_log.init_app(app)
+  json_responses.init_app(app)
   CORS(app)
 
   # CORS Headers
@@ -33,20 +60,38 @@ def create_app(test_config=None):
   GET /actors
     it should be an endpoint accesible for all roles
     it should require the 'get:actors' permission
-  returns status code 200 and json {'success': True, 'actors': actors} where actors is the list of actors
+    it should respond with a 304 if If-None-Match matches the ETag of the page
+    it should only return the actors matching the ?age=, ?age_min=, ?age_max= and ?gender= filters
+    it should return a page of at most limit actors ordered by the ?sort= key (id, age or name, '-' for descending)
+      and then by id, after the given cursor (or id when sorting by id)
+    it should respond with a 400 if the sort key index can't serve the filters (i.e. ?gender=F&sort=name)
+    it should only return the requested ?fields= (i.e. 'id,name') and ?include= (i.e. 'movies') relations, all of them by default
+  returns status code 200 and json {'success': True, 'actors': actors, 'next_cursor': cursor} where actors is the page of actors
+    and cursor is the value to pass as ?cursor= for the next page, or null on the last page
     or appropriate status code indicating reason for failure
   '''
   @app.route('/actors', methods=['GET'])
   @requires_auth('get:actors')
+  @conditional('Actor', 'Movie', 'movies')
+  @response_cache.cached('Actor', 'Movie', 'movies')
   def retrieve_all_actors(jwt):
     if jwt:
-      actors_data = Actor.query.order_by(Actor.id).all()
-      actors = [actor.format() for actor in actors_data]
+      criteria, sort = filter_params(Actor)
+      limit, after = page_params(sort)
+      fields, include = fieldset_params(Actor)
+
+      # the sort field is selected for the cursor even when it is not requested
+      query = select_fields(Actor, fields + (sort.lstrip('-'),)).filter(*criteria)
+      query = sort_page(query, Actor, sort, after)
+
+      actors_data, next_cursor = split_page(query.limit(limit + 1).all(), limit, sort)
+      actors = format_rows(Actor, actors_data, fields, include)
 
       if len(actors_data):
         return jsonify({
           'success': True,
-          'actors': actors
+          'actors': actors,
+          'next_cursor': next_cursor
         })
       else:
         abort(404)
@@ -57,20 +102,38 @@ def create_app(test_config=None):
   GET /movies
     it should be an endpoint accesible for all roles
     it should require the 'get:movies' permission
-  returns status code 200 and json {'success': True, 'movies': movies} where movies is the list of movies
+    it should respond with a 304 if If-None-Match matches the ETag of the page
+    it should only return the movies matching the ?release_year=, ?release_year_min= and ?release_year_max= filters (years)
+    it should return a page of at most limit movies ordered by the ?sort= key (id or release_year, '-' for descending)
+      and then by id, after the given cursor (or id when sorting by id)
+    it should respond with a 400 if the sort key index can't serve the filters (i.e. ?release_year=2020&sort=id)
+    it should only return the requested ?fields= (i.e. 'id,title') and ?include= (i.e. 'actors') relations, all of them by default
+  returns status code 200 and json {'success': True, 'movies': movies, 'next_cursor': cursor} where movies is the page of movies
+    and cursor is the value to pass as ?cursor= for the next page, or null on the last page
     or appropriate status code indicating reason for failure
   '''
   @app.route('/movies', methods=['GET'])
   @requires_auth('get:movies')
+  @conditional('Actor', 'Movie', 'movies')
+  @response_cache.cached('Actor', 'Movie', 'movies')
   def retrieve_all_movies(jwt):
     if jwt:
-      movies_data = Movie.query.order_by(Movie.id).all()
-      movies = [movie.format() for movie in movies_data]
+      criteria, sort = filter_params(Movie)
+      limit, after = page_params(sort)
+      fields, include = fieldset_params(Movie)
+
+      # the sort field is selected for the cursor even when it is not requested
+      query = select_fields(Movie, fields + (sort.lstrip('-'),)).filter(*criteria)
+      query = sort_page(query, Movie, sort, after)
+
+      movies_data, next_cursor = split_page(query.limit(limit + 1).all(), limit, sort)
+      movies = format_rows(Movie, movies_data, fields, include)
 
       if len(movies_data):
         return jsonify({
           'success': True,
-          'movies': movies
+          'movies': movies,
+          'next_cursor': next_cursor
         })
       else:
         abort(404)
@@ -78,47 +141,226 @@ def create_app(test_config=None):
       abort(401)
 
   '''
-  POST /actors
-    it should create a new row in the actors table
-    it should require the 'post:actors' permission
-  returns status code 200 and json {'success': True, 'actors': actor} where actor is an array containing only the newly created actor
+  GET /actors/export
+    it should require the 'get:actors' permission
+    it should stream every actor after the ?after= id (to resume an export), ordered by id, as newline delimited json
+    it should read EXPORT_CHUNK_SIZE actors at a time so the memory stays flat regardless of the table size
+  returns status code 200 and one json actor, in the GET /actors format, per line
     or appropriate status code indicating reason for failure
   '''
-  @app.route('/actors', methods=['POST'])
-  @requires_auth('post:actors')
-  def add_actor(jwt):
+  @app.route('/actors/export', methods=['GET'])
+  @requires_auth('get:actors')
+  def export_actors(jwt):
     if jwt:
-      body = request.get_json()
+      return export(Actor)
+    else:
+      abort(401)
 
-      new_name = body.get('name', None)
-      new_age = body.get('age', None)
-      new_gender = body.get('gender', None)
-      new_movies = body.get('movies', None)
+  '''
+  GET /movies/export
+    it should require the 'get:movies' permission
+    it should stream every movie after the ?after= id (to resume an export), ordered by id, as newline delimited json
+    it should read EXPORT_CHUNK_SIZE movies at a time so the memory stays flat regardless of the table size
+  returns status code 200 and one json movie, in the GET /movies format, per line
+    or appropriate status code indicating reason for failure
+  '''
+  @app.route('/movies/export', methods=['GET'])
+  @requires_auth('get:movies')
+  def export_movies(jwt):
+    if jwt:
+      return export(Movie)
+    else:
+      abort(401)
 
-      try:
-        actor = Actor(name=new_name, age=new_age, gender=new_gender)
-        movies = Movie.query.filter(Movie.id.in_(new_movies)).order_by(Movie.id).all()
+  def export(model):
+    after = None
+    if 'after' in request.args:
+      after = request.args.get('after', type=int)
+      if after is None:
+        abort(400)
 
-        if len(movies):
-          for movie in movies:
-            actor.movies.append(Movie.query.get(movie))
+    def generate():
+      for chunk in export_chunks(model, after, app.config['EXPORT_CHUNK_SIZE']):
+        yield json_responses.dumps_lines(chunk)
 
-        actor.insert()
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-        return jsonify({
-          'success': True,
-          'actors': [actor.format()],
-        })
+  '''
+  GET /search
+    it should require the 'get:actors' permission, movies are only searched with the 'get:movies' permission
+    it should rank the actors by name and the movies by title starting with ?q= first, then by trigram similarity
+    it should return at most ?limit= (SEARCH_LIMIT by default, capped to MAX_SEARCH_LIMIT) actors and movies
+  returns status code 200 and json {'success': True, 'actors': actors, 'movies': movies} where actors is the list of
+    {'id': id, 'name': name, 'score': similarity} and movies the list of {'id': id, 'title': title, 'score': similarity}
+    or status code 400 if q is missing, or appropriate status code indicating reason for failure
+  '''
+  @app.route('/search', methods=['GET'])
+  @requires_auth('get:actors')
+  def search_catalog(jwt):
+    if jwt:
+      q = request.args.get('q', '').strip()
+      limit = request.args.get('limit', app.config['SEARCH_LIMIT'], type=int)
+      if not q or limit is None or limit < 1:
+        abort(400)
+      limit = min(limit, app.config['MAX_SEARCH_LIMIT'])
+
+      result = {
+        'success': True,
+        'actors': [{'id': actor_id, 'name': name, 'score': round(score, 3)}
+          for actor_id, name, score in search_model(Actor, q, limit)]
+      }
+      if 'get:movies' in jwt.get('permissions', []):
+        result['movies'] = [{'id': movie_id, 'title': title, 'score': round(score, 3)}
+          for movie_id, title, score in search_model(Movie, q, limit)]
+
+      return jsonify(result)
+    else:
+      abort(401)
 
-      except:
-        print(sys.exc_info())
-        abort(422)
+  '''
+  GET /actors/<actor_id>/costars
+    it should require the 'get:actors' permission
+    it should rank the actors who played in a movie with the actor by number of shared movies, then by id
+    it should return at most ?limit= (COSTARS_LIMIT by default, capped to MAX_COSTARS_LIMIT) of them
+  returns status code 200 and json {'success': True, 'actor': actor_id, 'total': total, 'costars': costars} where
+    costars is the list of {'id': id, 'name': name, 'shared_movies': count} and total the number of co-stars
+    or status code 404 if the actor doesn't exist, or appropriate status code indicating reason for failure
+  '''
+  @app.route('/actors/<int:actor_id>/costars', methods=['GET'])
+  @requires_auth('get:actors')
+  def retrieve_costars(jwt, actor_id):
+    if jwt:
+      limit = request.args.get('limit', app.config['COSTARS_LIMIT'], type=int)
+      if limit is None or limit < 1:
+        abort(400)
+      limit = min(limit, app.config['MAX_COSTARS_LIMIT'])
+      if not labels(Actor, [actor_id]):
+        abort(404)
+
+      total, costars = find_costars(actor_id, limit)
+      names = labels(Actor, [costar_id for costar_id, _ in costars])
+      return jsonify({
+        'success': True,
+        'actor': actor_id,
+        'total': total,
+        'costars': [{'id': costar_id, 'name': names.get(costar_id), 'shared_movies': count}
+          for costar_id, count in costars]
+      })
+    else:
+      abort(401)
+
+  '''
+  GET /actors/<source_id>/path/<target_id>
+    it should require the 'get:actors' permission, the movie titles are only returned with the 'get:movies' permission
+    it should find a shortest chain of actors from the source to the target where each one played in a movie with
+    the next one, of at most ?max_depth= links (GRAPH_MAX_DEPTH by default and at most)
+  returns status code 200 and json {'success': True, 'degrees': degrees, 'path': path} where path is the list of
+    {'id': id, 'name': name, 'movie': {'id': id, 'title': title}} from the source to the target, movie being the one
+    shared with the next actor (None for the target), or degrees and path None if they are further apart
+    or status code 404 if an actor doesn't exist, or appropriate status code indicating reason for failure
+  '''
+  @app.route('/actors/<int:source_id>/path/<int:target_id>', methods=['GET'])
+  @requires_auth('get:actors')
+  def retrieve_path(jwt, source_id, target_id):
+    if jwt:
+      max_depth = request.args.get('max_depth', app.config['GRAPH_MAX_DEPTH'], type=int)
+      if max_depth is None or max_depth < 1:
+        abort(400)
+      max_depth = min(max_depth, app.config['GRAPH_MAX_DEPTH'])
+      if len(labels(Actor, {source_id, target_id})) < len({source_id, target_id}):
+        abort(404)
+
+      found = find_path(source_id, target_id, max_depth)
+      if found is None:
+        return jsonify({'success': True, 'degrees': None, 'path': None})
+
+      actors, movie_ids = found
+      names = labels(Actor, actors)
+      movies = [{'id': movie_id} for movie_id in movie_ids]
+      if 'get:movies' in jwt.get('permissions', []):
+        titles = labels(Movie, movie_ids)
+        for movie in movies:
+          movie['title'] = titles.get(movie['id'])
+      return jsonify({
+        'success': True,
+        'degrees': len(movie_ids),
+        'path': [{'id': actor_id, 'name': names.get(actor_id), 'movie': movie}
+          for actor_id, movie in zip(actors, movies + [None])]
+      })
+    else:
+      abort(401)
+
+  '''
+  GET /stats
+    it should require the 'get:actors' permission, the movies and cast sizes are only returned with the 'get:movies' permission
+    it should be read from the catalog stats summary table with a single query, whatever the size of the catalog
+  returns status code 200 and json {'success': True, 'actors': actors, 'movies': movies, 'links': links,
+    'average_cast_size': size} where actors is {'total': count, 'by_gender_and_age': [{'gender', 'age_min', 'age_max',
+    'count'}]} and movies is {'total': count, 'by_release_year': [{'release_year', 'count'}]}
+    or appropriate status code indicating reason for failure
+  '''
+  @app.route('/stats', methods=['GET'])
+  @requires_auth('get:actors')
+  def retrieve_stats(jwt):
+    if jwt:
+      stats = catalog_stats()
+      result = {
+        'success': True,
+        'actors': stats['actors']
+      }
+      if 'get:movies' in jwt.get('permissions', []):
+        result.update(movies=stats['movies'], links=stats['links'], average_cast_size=stats['average_cast_size'])
+
+      return jsonify(result)
+    else:
+      abort(401)
+
+  '''
+  GET /internal/pool
+    it should only be reachable from the INTERNAL_ADDRESSES, it doesn't require a token
+  returns status code 200 and json {'success': True, 'pool': stats} where stats are the live statistics of the
+    database pool (checked out and overflow connections, checkout timeouts and wait time histogram)
+  '''
+  @app.route('/internal/pool', methods=['GET'])
+  @local_only
+  def retrieve_pool_stats():
+    return jsonify({
+      'success': True,
+      'pool': pool_stats(db.engine.pool)
+    })
+
+  '''
+  GET /metrics
+    it should only be reachable from the INTERNAL_ADDRESSES, it doesn't require a token
+  returns status code 200 and the Prometheus text format of the request durations, auth, db and serialize stage
+    timings, status codes and in flight requests per route, aggregated over every gunicorn worker
+  '''
+  @app.route('/metrics', methods=['GET'])
+  @local_only
+  def retrieve_metrics():
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
+
+  '''
+  POST /actors
+    it should create a new row in the actors table and its movies links
+    it should respond with a 422 error listing the unknown movie ids, if any
+    it should require the 'post:actors' permission
+  returns status code 200 and json {'success': True, 'actors': actor} where actor is an array containing only the newly created actor
+    or appropriate status code indicating reason for failure
+  '''
+  @app.route('/actors', methods=['POST'])
+  @requires_auth('post:actors')
+  def add_actor(jwt):
+    if jwt:
+      return create_one(Actor, 'actors')
     else:
       abort(401)
 
   '''
   POST /movies
-    it should create a new row in the movies table
+    it should create a new row in the movies table and its actors links
+    it should respond with a 422 error listing the unknown actor ids, if any
     it should require the 'post:movies' permission
   returns status code 200 and json {'success': True, 'movies': movie} where movie is an array containing only the newly created movie
     or appropriate status code indicating reason for failure
@@ -127,38 +369,92 @@ def create_app(test_config=None):
   @requires_auth('post:movies')
   def add_movie(jwt):
     if jwt:
-      body = request.get_json()
-
-      new_title = body.get('title', None)
-      new_release_year = body.get('release_year', None)
-      new_actors = body.get('actors', None)
-
-      try:
-        movie = Movie(title=new_title, release_year=new_release_year)
-        actors = Actor.query.filter(Actor.id.in_(new_actors)).order_by(Actor.id).all()
+      return create_one(Movie, 'movies')
+    else:
+      abort(401)
 
-        if len(actors):
-          for actor in actors:
-            movie.actors.append(actor)
+  def create_one(model, key):
+    # the row and its links are written like a batch of one, in a constant number of statements
+    try:
+      created, errors = bulk_insert(model, [request.get_json()])
+    except:
+      print(sys.exc_info())
+      abort(422)
+
+    if errors:
+      return jsonify({
+        'success': False,
+        'error': 422,
+        'message': errors[0][1]
+      }), 422
 
-        movie.insert()
+    response_cache.invalidate(model.__tablename__, 'movies')
+    return jsonify({
+      'success': True,
+      key: [model.query.get(created[0][1]).format()],
+    })
 
-        return jsonify({
-          'success': True,
-          'movies': [movie.format()],
-        })
+  '''
+  POST /actors/batch
+    it should create up to BATCH_MAX_SIZE new rows in the actors table and their movies links in a single transaction
+    it should require the 'post:actors' permission
+    it should report the invalid actors and the unknown movie ids per item, and create the valid ones
+  returns status code 200 and json {'success': True, 'created': created, 'errors': errors} where created is the list of
+    {'index': index, 'id': id} of the new actors and errors the list of {'index': index, 'message': message}
+    or status code 422 if no actor is valid, or appropriate status code indicating reason for failure
+  '''
+  @app.route('/actors/batch', methods=['POST'])
+  @requires_auth('post:actors')
+  def add_actors_batch(jwt):
+    if jwt:
+      return create_batch(Actor, 'actors')
+    else:
+      abort(401)
 
-      except:
-        print(sys.exc_info())
-        abort(422)
+  '''
+  POST /movies/batch
+    it should create up to BATCH_MAX_SIZE new rows in the movies table and their actors links in a single transaction
+    it should require the 'post:movies' permission
+    it should report the invalid movies and the unknown actor ids per item, and create the valid ones
+  returns status code 200 and json {'success': True, 'created': created, 'errors': errors} where created is the list of
+    {'index': index, 'id': id} of the new movies and errors the list of {'index': index, 'message': message}
+    or status code 422 if no movie is valid, or appropriate status code indicating reason for failure
+  '''
+  @app.route('/movies/batch', methods=['POST'])
+  @requires_auth('post:movies')
+  def add_movies_batch(jwt):
+    if jwt:
+      return create_batch(Movie, 'movies')
     else:
       abort(401)
 
+  def create_batch(model, key):
+    body = request.get_json()
+    records = body.get(key, None) if isinstance(body, dict) else None
+    if not isinstance(records, list) or not records or len(records) > app.config['BATCH_MAX_SIZE']:
+      abort(400)
+
+    try:
+      created, errors = bulk_insert(model, records)
+    except:
+      print(sys.exc_info())
+      abort(422)
+
+    if created:
+      response_cache.invalidate(model.__tablename__, 'movies')
+
+    return jsonify({
+      'success': bool(created),
+      'created': [{'index': index, 'id': row_id} for index, row_id in created],
+      'errors': [{'index': index, 'message': message} for index, message in errors]
+    }), 200 if created else 422
+
   '''
   PATCH /actors/<id>
     where <id> is the existing model id
     it should respond with a 404 error if <id> is not found
     it should update the corresponding row for <id>
+    it should add the 'movies' ids given as a list, or apply an object of 'add' and 'remove' lists or a 'replace' list
     it should require the 'patch:actors' permission
   returns status code 200 and json {'success': True, 'actors': actor} where actor is an array containing only the updated actor
     or appropriate status code indicating reason for failure
@@ -184,13 +480,10 @@ def create_app(test_config=None):
           actor.gender = body.get('gender', None)
 
         if 'movies' in body:
-          new_movies = body.get('movies', None)
-          movies = Movie.query.filter(Movie.id.in_(new_movies)).order_by(Movie.id).all()
-
-          for movie in movies:
-            actor.movies.append(movie)
+          update_links(Actor, actor.id, parse_link_operations(body['movies'], 'Movies'))
         
         actor.update()
+        response_cache.invalidate('Actor', 'movies')
 
         return jsonify({
           'success': True,
@@ -208,6 +501,7 @@ def create_app(test_config=None):
       where <id> is the existing model id
       it should respond with a 404 error if <id> is not found
       it should update the corresponding row for <id>
+      it should add the 'actors' ids given as a list, or apply an object of 'add' and 'remove' lists or a 'replace' list
       it should require the 'patch:movies' permission
     returns status code 200 and json {'success': True, 'movies': movie} where movie is an array containing only the updated movie
       or appropriate status code indicating reason for failure
@@ -230,13 +524,10 @@ def create_app(test_config=None):
           movie.release_year = body.get('release_year', None)
 
         if 'actors' in body:
-          new_actors = body.get('actors', None)
-          actors = Actor.query.filter(Actor.id.in_(new_actors)).order_by(Actor.id).all()
-
-          for actor in actors:
-            movie.actors.append(actor)
+          update_links(Movie, movie.id, parse_link_operations(body['actors'], 'Actors'))
         
         movie.update()
+        response_cache.invalidate('Movie', 'movies')
 
         return jsonify({
           'success': True,
@@ -253,7 +544,7 @@ def create_app(test_config=None):
   DELETE /actors/<id>
     where <id> is the existing model id
     it should respond with a 404 error if <id> is not found
-    it should delete the corresponding row for <id>
+    it should delete the corresponding row for <id>, its movies links are deleted by the database without being loaded
     it should require the 'delete:actors' permission
   returns status code 200 and json {'success': True, 'delete': id} where id is the id of the deleted record
     or appropriate status code indicating reason for failure
@@ -262,21 +553,7 @@ def create_app(test_config=None):
   @requires_auth('delete:actors')
   def delete_actor(jwt, actor_id):
     if jwt:
-      try:
-        actor = Actor.query.filter(Actor.id == actor_id).one_or_none()
-
-        if actor is None:
-          abort(404)
-
-        actor.delete()
-
-        return jsonify({
-          'success': True,
-          'delete': actor.id
-        })
-
-      except:
-        abort(422)
+      return delete_one(Actor, actor_id)
     else:
       abort(401)
 
@@ -284,7 +561,7 @@ def create_app(test_config=None):
   DELETE /movies/<id>
     where <id> is the existing model id
     it should respond with a 404 error if <id> is not found
-    it should delete the corresponding row for <id>
+    it should delete the corresponding row for <id>, its actors links are deleted by the database without being loaded
     it should require the 'delete:movies' permission
   returns status code 200 and json {'success': True, 'delete': id} where id is the id of the deleted record
     or appropriate status code indicating reason for failure
@@ -293,24 +570,83 @@ def create_app(test_config=None):
   @requires_auth('delete:movies')
   def delete_movie(jwt, movie_id):
     if jwt:
-      try:
-        movie = Movie.query.filter(Movie.id == movie_id).one_or_none()
+      return delete_one(Movie, movie_id)
+    else:
+      abort(401)
 
-        if movie is None:
-          abort(404)
+  def delete_one(model, row_id):
+    try:
+      deleted = delete_rows(model, [row_id])
+    except:
+      print(sys.exc_info())
+      abort(422)
 
-        movie.delete()
+    if not deleted:
+      abort(422)
+    response_cache.invalidate(model.__tablename__, 'movies')
 
-        return jsonify({
-          'success': True,
-          'delete': movie.id
-        })
+    return jsonify({
+      'success': True,
+      'delete': row_id
+    })
 
-      except:
-        abort(422)
+  '''
+  DELETE /actors?ids=<ids>
+    where <ids> is a comma separated list of up to BATCH_MAX_SIZE actor ids (i.e. '1,2,3')
+    it should delete the existing actors and their movies links in a single transaction, skipping the unknown ids
+    it should respond with a 400 error if <ids> is missing or invalid, and a 422 error if no actor was deleted
+    it should require the 'delete:actors' permission
+  returns status code 200 and json {'success': True, 'deleted': ids} where ids is the list of the deleted ids
+    or appropriate status code indicating reason for failure
+  '''
+  @app.route('/actors', methods=['DELETE'])
+  @requires_auth('delete:actors')
+  def delete_actors(jwt):
+    if jwt:
+      return delete_many(Actor)
     else:
       abort(401)
 
+  '''
+  DELETE /movies?ids=<ids>
+    where <ids> is a comma separated list of up to BATCH_MAX_SIZE movie ids (i.e. '1,2,3')
+    it should delete the existing movies and their actors links in a single transaction, skipping the unknown ids
+    it should respond with a 400 error if <ids> is missing or invalid, and a 422 error if no movie was deleted
+    it should require the 'delete:movies' permission
+  returns status code 200 and json {'success': True, 'deleted': ids} where ids is the list of the deleted ids
+    or appropriate status code indicating reason for failure
+  '''
+  @app.route('/movies', methods=['DELETE'])
+  @requires_auth('delete:movies')
+  def delete_movies(jwt):
+    if jwt:
+      return delete_many(Movie)
+    else:
+      abort(401)
+
+  def delete_many(model):
+    try:
+      ids = parse_ids(request.args.get('ids', '').split(','), 'Ids')
+    except ValueError:
+      abort(400)
+    if len(ids) > app.config['BATCH_MAX_SIZE']:
+      abort(400)
+
+    try:
+      deleted = delete_rows(model, ids)
+    except:
+      print(sys.exc_info())
+      abort(422)
+
+    if not deleted:
+      abort(422)
+    response_cache.invalidate(model.__tablename__, 'movies')
+
+    return jsonify({
+      'success': True,
+      'deleted': deleted
+    })
+
   ## Error Handling
   '''
   Error handling for unprocessable entity
@@ -386,7 +722,18 @@ def create_app(test_config=None):
 
   return app
 
-app = create_app()
+'''
+app
+    the application served by gunicorn (app:app) and used by manage.py and asgi.py
+    it is created on first access, so importing create_app (i.e. from the tests and benchmarks) doesn't create one
+'''
+def __getattr__(name):
+  if name == 'app':
+    global app
+    app = create_app()
+    return app
+  raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 if __name__ == '__main__':
+    app = create_app()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
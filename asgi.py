@@ -0,0 +1,112 @@
+'''
+ASGI entry point, serving the routes of create_app from an asyncio event loop
+
+  uvicorn asgi:app --workers 4
+
+The event loop holds the client connections, so thousands of idle or slow clients don't need a worker each.
+Every request runs the unchanged Flask app (same routes, hooks and error handlers) through asgiref's WSGI
+adapter, on a pool of ASGI_THREADS threads, which defaults to DB_POOL_SIZE + DB_MAX_OVERFLOW so a running
+request never waits for a database connection. The app and its database driver are still synchronous: a request
+holds its thread until it is answered, so the requests running at once in a worker are bounded by ASGI_THREADS
+like the threads of a gunicorn gthread worker. The signing keys are fetched on the thread pool at startup,
+without blocking the event loop.
+'''
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from auth import jwks_store
+from app import app as flask_app
+
+'''
+ThreadPoolWsgiToAsgi
+asgiref's WsgiToAsgi running the WSGI application on a bounded thread pool, with the lifespan events
+  asgiref runs every request of the process on a single thread
+'''
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+  def __init__(self, wsgi_app, threads):
+    super().__init__(wsgi_app)
+    self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+
+  async def __call__(self, scope, receive, send):
+    if scope['type'] == 'lifespan':
+      await self.lifespan(receive, send)
+    elif scope['type'] == 'http':
+      await ThreadPoolWsgiToAsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+  async def lifespan(self, receive, send):
+    loop = asyncio.get_running_loop()
+    while True:
+      message = await receive()
+      if message['type'] == 'lifespan.startup':
+        await loop.run_in_executor(self.executor, jwks_store.refresh)
+        await send({'type': 'lifespan.startup.complete'})
+      elif message['type'] == 'lifespan.shutdown':
+        self.executor.shutdown(wait=True)
+        await send({'type': 'lifespan.shutdown.complete'})
+        return
+
+'''
+ThreadPoolWsgiToAsgiInstance
+Request of ThreadPoolWsgiToAsgi, asgiref builds the environ and handles start_response (and its exc_info)
+  the response is streamed back chunk by chunk, so a streaming response (i.e. /actors/export) keeps a flat
+  memory and waits for the client like under gunicorn, and stops at the next chunk once the client is gone
+  the response iterable is closed, which asgiref doesn't do
+'''
+class ThreadPoolWsgiToAsgiInstance(WsgiToAsgiInstance):
+  def __init__(self, wsgi_application, executor):
+    super().__init__(wsgi_application)
+    self.executor = executor
+    self.disconnected = False
+
+  async def __call__(self, scope, receive, send):
+    self.receive = receive
+    await super().__call__(scope, receive, send)
+
+  def build_environ(self, scope, body):
+    environ = super().build_environ(scope, body)
+    # the body was read in full, so it ends even for a chunked request
+    environ['wsgi.input_terminated'] = True
+    return environ
+
+  async def run_wsgi_app(self, body):
+    watcher = asyncio.ensure_future(self.watch_disconnect())
+    try:
+      await sync_to_async(self.run, thread_sensitive=False, executor=self.executor)(body)
+    finally:
+      watcher.cancel()
+
+  async def watch_disconnect(self):
+    while (await self.receive())['type'] != 'http.disconnect':
+      pass
+    self.disconnected = True
+
+  def run(self, body):
+    # runs on the thread pool, sync_send hands the messages to the event loop
+    result = self.wsgi_application(self.build_environ(self.scope, body), self.start_response)
+    try:
+      for output in result:
+        if self.disconnected:
+          return
+        if not self.response_started:
+          self.response_started = True
+          self.sync_send(self.response_start)
+        self.sync_send({'type': 'http.response.body', 'body': output, 'more_body': True})
+      if not self.response_started:
+        self.response_started = True
+        self.sync_send(self.response_start)
+      self.sync_send({'type': 'http.response.body'})
+    finally:
+      if hasattr(result, 'close'):
+        result.close()
+
+'''
+create_asgi_app(flask_app)
+    returns the ASGI application serving flask_app on ASGI_THREADS threads
+'''
+def create_asgi_app(flask_app):
+  return ThreadPoolWsgiToAsgi(flask_app, flask_app.config['ASGI_THREADS'])
+
+
+app = create_asgi_app(flask_app)
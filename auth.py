@@ -1,14 +1,37 @@
 import os
+import sys
 import json
-from flask import request, _request_ctx_stack, abort, jsonify
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import request, _request_ctx_stack, abort, jsonify, current_app
 from functools import wraps
-from jose import jwt
+from jose import jwt, jwk
+from jose.utils import base64url_decode
 from urllib.request import urlopen
 
+from metrics import stage
+
+'''
+parse_algorithms(value)
+    returns the list of the algorithms of ALGORITHMS, a list as in "['RS256']" (or [RS256] once the shell removed
+    the quotes) or comma separated names
+'''
+def parse_algorithms(value):
+  return [name.strip(' \'"') for name in value.strip().strip('[]').split(',') if name.strip(' \'"')]
+
 AUTH0_DOMAIN = os.environ['AUTH0_DOMAIN']
-ALGORITHMS = os.environ['ALGORITHMS']
+ALGORITHMS = parse_algorithms(os.environ['ALGORITHMS'])
 API_AUDIENCE = os.environ['API_AUDIENCE']
 
+# JWKS_URL may point to a local file (file:///path/jwks.json) or stub server in tests
+JWKS_URL = os.environ.get('JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+JWKS_TTL = int(os.environ.get('JWKS_TTL', 600))
+JWKS_MIN_REFETCH_INTERVAL = int(os.environ.get('JWKS_MIN_REFETCH_INTERVAL', 30))
+JWKS_FETCH_TIMEOUT = float(os.environ.get('JWKS_FETCH_TIMEOUT', 5))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -20,6 +43,185 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+## JWKS Key Store
+'''
+JWKSKeyStore
+Process-wide cache of the identity provider signing keys
+  keys are parsed once into verifier objects indexed by kid
+  after ttl seconds the keys are refreshed in a background thread while the current ones keep being served
+  an unknown kid triggers a synchronous refetch, at most once every min_refetch_interval seconds: the concurrent
+  requests wait for the one that fetches and read its keys
+  if a refresh fails the last good keys are kept
+'''
+class JWKSKeyStore:
+  def __init__(self, url, ttl=JWKS_TTL, min_refetch_interval=JWKS_MIN_REFETCH_INTERVAL,
+               timeout=JWKS_FETCH_TIMEOUT):
+    self.url = url
+    self.ttl = ttl
+    self.min_refetch_interval = min_refetch_interval
+    self.timeout = timeout
+    self._keys = {}
+    self._fetched_at = None
+    self._attempted_at = None
+    self._lock = threading.Lock()
+    self._fetch_lock = threading.Lock()
+    self._refreshing = False
+
+  def fetch(self):
+    with urlopen(self.url, timeout=self.timeout) as response:
+      return json.loads(response.read())
+
+  def parse(self, jwks):
+    keys = {}
+    for key in jwks.get('keys', []):
+      if key.get('use', 'sig') != 'sig' or 'kid' not in key:
+        continue
+      try:
+        keys[key['kid']] = jwk.construct(key, key.get('alg', 'RS256'))
+      except Exception:
+        print(sys.exc_info())
+    return keys
+
+  def refresh(self):
+    self._attempted_at = time.monotonic()
+    try:
+      keys = self.parse(self.fetch())
+    except Exception:
+      # keep serving the last good keys
+      print(sys.exc_info())
+      return False
+
+    if not keys:
+      return False
+
+    with self._lock:
+      self._keys = keys
+      self._fetched_at = time.monotonic()
+    return True
+
+  def _refresh_in_background(self):
+    with self._lock:
+      if self._refreshing:
+        return
+      self._refreshing = True
+
+    def run():
+      try:
+        self.refresh()
+      finally:
+        self._refreshing = False
+
+    threading.Thread(target=run, name='jwks-refresh', daemon=True).start()
+
+  def _refetch(self):
+    # one caller per min_refetch_interval fetches, the ones arriving meanwhile wait for it on the fetch lock
+    with self._fetch_lock:
+      with self._lock:
+        if self._attempted_at is not None and \
+            time.monotonic() - self._attempted_at < self.min_refetch_interval:
+          return
+        self._attempted_at = time.monotonic()
+      self.refresh()
+
+  def get_key(self, kid):
+    if self._fetched_at is None:
+      self._refetch()
+    elif time.monotonic() - self._fetched_at >= self.ttl:
+      self._refresh_in_background()
+
+    key = self._keys.get(kid)
+    if key is None and self._fetched_at is not None:
+      # the signing keys may have been rotated
+      self._refetch()
+      key = self._keys.get(kid)
+    return key
+
+jwks_store = JWKSKeyStore(JWKS_URL)
+
+## Verified Token Cache
+'''
+VerifiedToken
+A decoded and verified jwt payload with its permissions precomputed as a frozenset
+  permissions is None when the payload has no permissions claim
+'''
+class VerifiedToken:
+  __slots__ = ('payload', 'permissions', 'expires_at')
+
+  def __init__(self, payload):
+    self.payload = payload
+    self.permissions = frozenset(payload['permissions']) if 'permissions' in payload else None
+    self.expires_at = payload.get('exp')
+
+  def expired(self, now=None):
+    return self.expires_at is not None and (now or time.time()) >= self.expires_at
+
+'''
+TokenCache
+Bounded LRU cache of verified tokens keyed by the sha256 of the token
+  entries expire at the token exp claim, tokens without exp are not cached
+  stats() returns the hit, miss, eviction and expiration counters used to size the cache
+'''
+class TokenCache:
+  def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+    self.maxsize = maxsize
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.expirations = 0
+
+  @staticmethod
+  def key(token):
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+  def get(self, token):
+    key = self.key(token)
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        self.misses += 1
+        return None
+
+      if entry.expired():
+        del self._entries[key]
+        self.expirations += 1
+        self.misses += 1
+        return None
+
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return entry
+
+  def put(self, token, entry):
+    if self.maxsize <= 0 or entry.expires_at is None or entry.expired():
+      return
+
+    key = self.key(token)
+    with self._lock:
+      self._entries[key] = entry
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+        self.evictions += 1
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def stats(self):
+    with self._lock:
+      return {
+        'size': len(self._entries),
+        'maxsize': self.maxsize,
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions,
+        'expirations': self.expirations
+      }
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
 ## Auth Header
 '''
 get_token_auth_header() method
@@ -46,24 +248,27 @@ def get_token_auth_header():
   #  raise Exception('Not Implemented')
 
 '''
-check_permissions(permission, payload) method
+check_permissions(permission, payload, permissions=None) method
   @INPUTS
     permission: string permission (i.e. 'post:drink')
     payload: decoded jwt payload
+    permissions: optional precomputed frozenset of the payload permissions
 
   it should raise an AuthError if permissions are not included in the payload
     !!NOTE check your RBAC settings in Auth0
   it should raise an AuthError if the requested permission string is not in the payload permissions array
   return true otherwise
 '''
-def check_permissions(permission, payload):
-  if 'permissions' not in payload:
-    raise AuthError({
-        'code': 'invalid_claims',
-        'description': 'Permissions not included in JWT.'
-    }, 400)
+def check_permissions(permission, payload, permissions=None):
+  if permissions is None:
+    if 'permissions' not in payload:
+      raise AuthError({
+          'code': 'invalid_claims',
+          'description': 'Permissions not included in JWT.'
+      }, 400)
+    permissions = frozenset(payload['permissions'])
 
-  if permission not in payload['permissions']:
+  if permission not in permissions:
       raise AuthError({
           'code': 'unauthorized',
           'description': 'Permissions not found.'
@@ -76,7 +281,7 @@ verify_decode_jwt(token) method
     token: a json web token (string)
 
   it should be an Auth0 token with key id (kid)
-  it should verify the token using Auth0 /.well-known/jwks.json
+  it should verify the token using the cached Auth0 /.well-known/jwks.json keys
   it should decode the payload from the token
   it should validate the claims
   return the decoded payload
@@ -84,45 +289,50 @@ verify_decode_jwt(token) method
   !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-  # GET THE PUBLIC KEY FROM AUTH0
-  jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-  jwks = json.loads(jsonurl.read())
-  
   # GET THE DATA IN THE HEADER
   unverified_header = jwt.get_unverified_header(token)
   
   # CHOOSE OUR KEY
-  rsa_key = {}
   if 'kid' not in unverified_header:
     raise AuthError({
         'code': 'invalid_header',
         'description': 'Authorization malformed.'
     }, 401)
 
-  for key in jwks['keys']:
-    if key['kid'] == unverified_header['kid']:
-      rsa_key = {
-        'kty': key['kty'],
-        'kid': key['kid'],
-        'use': key['use'],
-        'n': key['n'],
-        'e': key['e']
-      }
+  rsa_key = jwks_store.get_key(unverified_header['kid'])
   
   # Finally, verify!!!
   if rsa_key:
     try:
-      # USE THE KEY TO VALIDATE THE JWT
+      # USE THE PARSED KEY TO VALIDATE THE SIGNATURE
+      if unverified_header.get('alg') not in ALGORITHMS:
+        raise AuthError({
+          'code': 'invalid_header',
+          'description': 'Unable to parse authentication token.'
+        }, 400)
+
+      signing_input, signature = token.rsplit('.', 1)
+      if not rsa_key.verify(signing_input.encode('utf-8'), base64url_decode(signature.encode('utf-8'))):
+        raise AuthError({
+          'code': 'invalid_signature',
+          'description': 'Unable to verify authentication token.'
+        }, 401)
+
+      # VALIDATE THE CLAIMS
       payload = jwt.decode(
         token,
-        rsa_key,
+        None,
         algorithms=ALGORITHMS,
         audience=API_AUDIENCE,
-        issuer='https://' + AUTH0_DOMAIN + '/'
+        issuer='https://' + AUTH0_DOMAIN + '/',
+        options={'verify_signature': False}
       )
 
       return payload
 
+    except AuthError:
+      raise
+
     except jwt.ExpiredSignatureError:
       raise AuthError({
         'code': 'token_expired',
@@ -150,7 +360,7 @@ def verify_decode_jwt(token):
     permission: string permission (i.e. 'post:drink')
 
   it should use the get_token_auth_header method to get the token
-  it should use the verify_decode_jwt method to decode the jwt
+  it should reuse the token_cache entry of the token, or use the verify_decode_jwt method to decode the jwt
   it should use the check_permissions method validate claims and check the requested permission
   return the decorator which passes the decoded payload to the decorated method
 '''
@@ -158,14 +368,31 @@ def requires_auth(permission=''):
   def requires_auth_decorator(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-      jwt = get_token_auth_header()
-      try:
-        payload = verify_decode_jwt(jwt)
-      except:
-        abort(401)
+      with stage('auth'):
+        token = get_token_auth_header()
+        verified = token_cache.get(token)
+        if verified is None:
+          try:
+            verified = VerifiedToken(verify_decode_jwt(token))
+          except:
+            abort(401)
+          token_cache.put(token, verified)
 
-      check_permissions(permission, payload)
+        check_permissions(permission, verified.payload, verified.permissions)
 
-      return f(payload, *args, **kwargs)
+      return f(verified.payload, *args, **kwargs)
     return wrapper
   return requires_auth_decorator
+
+'''
+@local_only decorator method
+  it should respond with a 403 error if the client address is not in the INTERNAL_ADDRESSES config
+  used for the internal endpoints, which don't require a token
+'''
+def local_only(f):
+  @wraps(f)
+  def wrapper(*args, **kwargs):
+    if request.remote_addr not in current_app.config['INTERNAL_ADDRESSES']:
+      abort(403)
+    return f(*args, **kwargs)
+  return wrapper
@@ -0,0 +1,152 @@
+'''
+Throughput and connection counts of the ASGI entry point against gunicorn sync workers at high concurrency
+
+  BENCHMARK_DATABASE_URL=postgresql://localhost/capstone_bench python benchmarks/bench_asgi.py \
+    --clients 1000 --workers 4 --duration 30
+
+It needs an empty scratch database (a temporary SQLite file by default) and loads a synthetic catalog. The
+same read workload (list, filter and search requests) is then sent by --clients concurrent connections, first
+to gunicorn with --workers sync workers (app:app), then to uvicorn with --workers workers (asgi:app). For each
+server it prints the req/s, p50/p95/p99 latencies, failed requests, the threads serving requests and, on
+PostgreSQL, the peak number of database connections.
+'''
+import sys
+import time
+import random
+import asyncio
+import argparse
+import resource
+import threading
+
+from common import setup_environment, load_catalog, start_server, stop_server, report
+
+
+def paths(rng, actors, movies):
+  return [
+    '/actors?limit=20&after={}'.format(rng.randint(0, actors)),
+    '/actors?gender=F&age_min={}&age_max=60&limit=20'.format(rng.randint(18, 50)),
+    '/movies?limit=20&after={}'.format(rng.randint(0, movies)),
+    '/search?q=Actor%20{}'.format(rng.randint(1, actors))
+  ]
+
+
+async def fetch(port, path, token, timeout):
+  reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+  try:
+    writer.write('GET {} HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Bearer {}\r\nConnection: close\r\n\r\n'
+      .format(path, token).encode('latin-1'))
+    await writer.drain()
+    data = await asyncio.wait_for(reader.read(), timeout)
+    return int(data.split(b' ', 2)[1])
+  finally:
+    writer.close()
+
+
+async def client(port, token, args, seed, deadline, samples):
+  rng = random.Random(seed)
+  loop = asyncio.get_running_loop()
+  while loop.time() < deadline:
+    start = time.perf_counter()
+    try:
+      status = await fetch(port, rng.choice(paths(rng, args.actors, args.movies)), token, args.timeout)
+    except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+      status = None
+    samples.append((time.perf_counter() - start, status))
+
+
+async def drive(port, token, args):
+  samples = []
+  deadline = asyncio.get_running_loop().time() + args.duration
+  await asyncio.gather(*(client(port, token, args, seed, deadline, samples) for seed in range(args.clients)))
+  return samples
+
+
+def count_connections(engine, stop, peaks):
+  # connections of the server processes to the benchmark database, the sampling one excluded
+  with engine.connect() as connection:
+    while not stop.wait(0.1):
+      count = connection.execute('SELECT count(*) - 1 FROM pg_stat_activity WHERE datname = current_database()') \
+        .scalar()
+      peaks['db_connections'] = max(peaks.get('db_connections', 0), count)
+
+
+def percentile(values, fraction):
+  return values[min(int(len(values) * fraction), len(values) - 1)] if values else None
+
+
+def measure(command, token, args, engine, threads):
+  server, _ = start_server(command, args.port)
+  stop, peaks = threading.Event(), {}
+  sampler = None
+  if engine.dialect.name == 'postgresql':
+    sampler = threading.Thread(target=count_connections, args=(engine, stop, peaks), daemon=True)
+    sampler.start()
+  try:
+    samples = asyncio.run(drive(args.port, token, args))
+  finally:
+    stop.set()
+    if sampler is not None:
+      sampler.join()
+    stop_server(server)
+
+  latencies = sorted(seconds * 1000 for seconds, status in samples if status is not None)
+  return {
+    'requests': len(latencies),
+    'requests_per_second': len(latencies) / args.duration,
+    'failed': sum(1 for _, status in samples if status is None or status >= 500),
+    'p50_ms': percentile(latencies, 0.5),
+    'p95_ms': percentile(latencies, 0.95),
+    'p99_ms': percentile(latencies, 0.99),
+    'serving_threads': threads,
+    'db_connections_peak': peaks.get('db_connections')
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--clients', type=int, default=1000, help='concurrent client connections')
+  parser.add_argument('--workers', type=int, default=4, help='server processes of both servers')
+  parser.add_argument('--duration', type=float, default=30, help='seconds of load per server')
+  parser.add_argument('--timeout', type=float, default=60, help='seconds before a request is failed')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--actors', type=int, default=10000)
+  parser.add_argument('--movies', type=int, default=2000)
+  parser.add_argument('--links', type=int, default=50000, help='association rows')
+  parser.add_argument('--database-url', help='empty database to run against, a temporary SQLite file by default')
+  args = parser.parse_args()
+
+  # one file descriptor per client connection
+  soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+  resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, args.clients * 2 + 256)), hard))
+
+  local_auth = setup_environment(args.database_url)
+
+  from app import create_app
+  from models import db
+
+  app = create_app()
+  with app.app_context():
+    load_catalog(db, args.actors, args.movies, args.links)
+    db.session.remove()
+    engine = db.engine
+  asgi_threads = app.config['ASGI_THREADS']
+
+  token = local_auth.token()
+  bind = '127.0.0.1:{}'.format(args.port)
+  results = {
+    'database': engine.dialect.name,
+    'clients': args.clients,
+    'workers': args.workers,
+    'gunicorn_sync': measure([sys.executable, '-m', 'gunicorn.app.wsgiapp', 'app:app', '--preload',
+      '--workers', str(args.workers), '--bind', bind, '--backlog', str(args.clients * 2)],
+      token, args, engine, args.workers),
+    'uvicorn_asgi': measure([sys.executable, '-m', 'uvicorn', 'asgi:app', '--workers', str(args.workers),
+      '--port', str(args.port), '--backlog', str(args.clients * 2), '--no-access-log'],
+      token, args, engine, args.workers * asgi_threads)
+  }
+  engine.dispose()
+  report(results)
+
+
+if __name__ == '__main__':
+  main()
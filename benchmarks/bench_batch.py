@@ -0,0 +1,66 @@
+'''
+Benchmark of POST /actors/batch against the single-row POST /actors path
+
+  python benchmarks/bench_batch.py --rows 2000 --batch-size 1000 --links 2
+
+It runs in process with the Flask test client against BENCHMARK_DATABASE_URL (a temporary SQLite
+database by default) and prints the rows/sec of both paths as JSON.
+'''
+import time
+import argparse
+import datetime
+
+from common import setup_environment, report
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--rows', type=int, default=2000, help='actors created by each path')
+  parser.add_argument('--batch-size', type=int, default=1000, help='actors per batch request')
+  parser.add_argument('--links', type=int, default=0, help='movies linked to each actor')
+  parser.add_argument('--database-url', help='database to run against, a temporary SQLite file by default')
+  args = parser.parse_args()
+
+  local_auth = setup_environment(args.database_url)
+
+  from app import create_app
+  from models import db, Movie
+
+  app = create_app()
+  client = app.test_client()
+  headers = {'Authorization': 'Bearer ' + local_auth.token()}
+
+  with app.app_context():
+    movies = [Movie(title=f'Movie {i}', release_year=datetime.datetime(2000, 1, 1)) for i in range(args.links)]
+    db.session.add_all(movies)
+    db.session.commit()
+    movie_ids = [movie.id for movie in movies]
+
+  def record(i):
+    return {'name': f'Actor {i}', 'age': 20 + i % 50, 'gender': 'F' if i % 2 else 'M', 'movies': movie_ids}
+
+  results = {'rows': args.rows, 'batch_size': args.batch_size, 'links': args.links}
+
+  start = time.perf_counter()
+  failures = 0
+  for i in range(args.rows):
+    res = client.post('/actors', headers=headers, json=record(i))
+    failures += res.status_code != 200
+  elapsed = time.perf_counter() - start
+  results['single'] = {'seconds': elapsed, 'rows_per_sec': args.rows / elapsed, 'failures': failures}
+
+  start = time.perf_counter()
+  failures = 0
+  for offset in range(0, args.rows, args.batch_size):
+    batch = [record(i) for i in range(offset, min(offset + args.batch_size, args.rows))]
+    res = client.post('/actors/batch', headers=headers, json={'actors': batch})
+    failures += len(res.get_json()['errors'])
+  elapsed = time.perf_counter() - start
+  results['batch'] = {'seconds': elapsed, 'rows_per_sec': args.rows / elapsed, 'failures': failures}
+
+  results['speedup'] = results['batch']['rows_per_sec'] / results['single']['rows_per_sec']
+  report(results)
+
+
+if __name__ == '__main__':
+  main()
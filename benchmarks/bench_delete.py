@@ -0,0 +1,85 @@
+'''
+Benchmark of DELETE /actors?ids= against DELETE /actors/<id> and the ORM delete of a loaded actor
+
+  BENCHMARK_DATABASE_URL=postgresql://localhost/capstone_bench python benchmarks/bench_delete.py \
+    --rows 2000 --density 50 --batch-size 500
+
+It needs an empty scratch database (a temporary SQLite file by default) and loads a synthetic catalog with
+--density movies per actor. Each path then deletes --rows different actors, with their links:
+  - orm: loads each actor and its movies, then session.delete(), the association rows are deleted by the ORM
+  - single: DELETE /actors/<id> for each actor, the links are deleted by ON DELETE CASCADE
+  - bulk: DELETE /actors?ids= with --batch-size ids per request
+It runs in process with the Flask test client and prints the rows/sec and SQL statements per deleted actor of
+each path as JSON.
+'''
+import time
+import argparse
+
+from common import setup_environment, load_catalog, report
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--rows', type=int, default=2000, help='actors deleted by each path')
+  parser.add_argument('--density', type=int, default=50, help='movies per actor')
+  parser.add_argument('--movies', type=int, default=2000)
+  parser.add_argument('--batch-size', type=int, default=500, help='ids per bulk request')
+  parser.add_argument('--database-url', help='empty database to run against, a temporary SQLite file by default')
+  args = parser.parse_args()
+
+  local_auth = setup_environment(args.database_url)
+
+  from app import create_app
+  from models import db, Actor
+  from queries import record_queries
+
+  app = create_app()
+  client = app.test_client()
+  headers = {'Authorization': 'Bearer ' + local_auth.token()}
+
+  actors = args.rows * 3
+  with app.app_context():
+    load_catalog(db, actors, args.movies, actors * args.density)
+    database = db.engine.dialect.name
+    db.session.remove()
+
+  def orm(ids):
+    with app.app_context():
+      for actor_id in ids:
+        actor = Actor.query.get(actor_id)
+        actor.movies
+        db.session.delete(actor)
+        db.session.commit()
+    return len(ids)
+
+  def single(ids):
+    return sum(client.delete(f'/actors/{actor_id}', headers=headers).status_code == 200 for actor_id in ids)
+
+  def bulk(ids):
+    deleted = 0
+    for start in range(0, len(ids), args.batch_size):
+      chunk = ids[start:start + args.batch_size]
+      res = client.delete('/actors?ids=' + ','.join(map(str, chunk)), headers=headers)
+      deleted += len(res.get_json().get('deleted', []))
+    return deleted
+
+  results = {'database': database, 'rows': args.rows, 'density': args.density, 'batch_size': args.batch_size}
+  for index, (name, path) in enumerate((('orm', orm), ('single', single), ('bulk', bulk))):
+    ids = list(range(index * args.rows + 1, (index + 1) * args.rows + 1))
+    with record_queries() as recorder:
+      start = time.perf_counter()
+      deleted = path(ids)
+      elapsed = time.perf_counter() - start
+    results[name] = {
+      'seconds': elapsed,
+      'rows_per_sec': args.rows / elapsed,
+      'statements_per_row': recorder.count / args.rows,
+      'failures': args.rows - deleted
+    }
+
+  results['bulk_speedup'] = results['bulk']['rows_per_sec'] / results['orm']['rows_per_sec']
+  report(results)
+
+
+if __name__ == '__main__':
+  main()
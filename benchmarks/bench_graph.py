@@ -0,0 +1,121 @@
+'''
+Co-star graph queries: in process graph against the database fallback, and the cost of keeping the graph synced
+
+  BENCHMARK_DATABASE_URL=postgresql://localhost/capstone_bench python benchmarks/bench_graph.py \
+    --actors 100000 --movies 19997 --links 1000000
+
+It needs an empty scratch database (a temporary SQLite file by default) and loads a synthetic catalog with
+--links association rows. It then prints as JSON:
+  - build: seconds to load the graph from the movies table and the bytes of its arrays
+  - costars and path: mean and p95 milliseconds of --queries random co-stars and degrees of separation queries
+    answered by the graph, and of --database-queries of them answered by the database, with the mismatches
+  - sync: milliseconds to apply --changes PATCH link changes to the graph, against a full rebuild
+'''
+import time
+import random
+import argparse
+import statistics
+
+from common import setup_environment, load_catalog, report
+
+
+def timed(function, *args):
+  start = time.perf_counter()
+  result = function(*args)
+  return (time.perf_counter() - start) * 1000, result
+
+
+def summarize(milliseconds):
+  milliseconds = sorted(milliseconds)
+  return {
+    'mean_ms': statistics.mean(milliseconds),
+    'p95_ms': milliseconds[min(int(len(milliseconds) * 0.95), len(milliseconds) - 1)]
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--actors', type=int, default=100000)
+  # coprime with --actors, so the synthetic links don't repeat
+  parser.add_argument('--movies', type=int, default=19997)
+  parser.add_argument('--links', type=int, default=1000000, help='association rows')
+  parser.add_argument('--queries', type=int, default=200, help='queries answered by the graph')
+  parser.add_argument('--database-queries', type=int, default=20, help='queries answered by the database')
+  parser.add_argument('--max-depth', type=int, default=6)
+  parser.add_argument('--changes', type=int, default=1000, help='link changes applied by the sync')
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--database-url', help='empty database to run against, a temporary SQLite file by default')
+  args = parser.parse_args()
+
+  setup_environment(args.database_url)
+
+  from app import create_app
+  from models import db, Actor, update_links
+  from graph import GraphIndex, shortest_path, database_expand, database_costars
+
+  app = create_app()
+  rng = random.Random(args.seed)
+  with app.app_context():
+    load_catalog(db, args.actors, args.movies, args.links)
+    results = {'database': db.engine.dialect.name, 'actors': args.actors, 'movies': args.movies,
+      'links': args.links}
+
+    index = GraphIndex(app)
+    build_ms, _ = timed(index.build)
+    graph = index.graph
+    arrays = (graph.actor_offsets, graph.actor_movies, graph.movie_offsets, graph.movie_actors)
+    results['build'] = {
+      'seconds': build_ms / 1000,
+      'array_bytes': sum(len(values) * values.itemsize for values in arrays),
+      'graph_links': graph.links
+    }
+
+    def graph_costars(actor_id):
+      counts = graph.costars(actor_id)
+      return len(counts)
+
+    def pairs(count):
+      return [(rng.randint(1, args.actors), rng.randint(1, args.actors)) for _ in range(count)]
+
+    for name, queries, answer in (
+        ('costars', [(actor_id,) for actor_id, _ in pairs(args.queries)], graph_costars),
+        ('path', pairs(args.queries), lambda a, b: shortest_path(graph.expand, a, b, args.max_depth))):
+      results[name] = {'graph': summarize([timed(answer, *query)[0] for query in queries])}
+
+    database_answers = {
+      'costars': lambda actor_id: database_costars(actor_id, 1)[0],
+      'path': lambda a, b: shortest_path(database_expand, a, b, args.max_depth)
+    }
+    for name, queries in (('costars', [(actor_id,) for actor_id, _ in pairs(args.database_queries)]),
+        ('path', pairs(args.database_queries))):
+      samples, mismatches = [], 0
+      for query in queries:
+        milliseconds, answer = timed(database_answers[name], *query)
+        samples.append(milliseconds)
+        if name == 'costars':
+          mismatches += answer != graph_costars(*query)
+        else:
+          expected = shortest_path(graph.expand, *query, args.max_depth)
+          # the chains may differ, not their length
+          mismatches += (answer and len(answer[1])) != (expected and len(expected[1]))
+      results[name]['database'] = dict(summarize(samples), mismatches=mismatches)
+      results[name]['speedup'] = results[name]['database']['mean_ms'] / results[name]['graph']['mean_ms']
+
+    for _ in range(args.changes):
+      update_links(Actor, rng.randint(1, args.actors), {'add': [rng.randint(1, args.movies)]})
+    db.session.commit()
+    with index.lock:
+      sync_ms, _ = timed(index.synced)
+    results['sync'] = {
+      'changes': args.changes,
+      'sync_ms': sync_ms,
+      'rebuild_ms': build_ms,
+      'graph_links': index.graph.links
+    }
+    db.session.remove()
+
+  report(results)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,103 @@
+'''
+Benchmark of the relationship loads and list queries before and after the association and filter indexes
+
+  BENCHMARK_DATABASE_URL=postgresql://localhost/capstone_bench python benchmarks/bench_indexes.py --links 1000000
+
+It needs an empty scratch database (a temporary SQLite file by default). It creates the schema, drops
+the indexes added by the 323f335568b4 migration, loads a synthetic catalog, times the queries, creates
+the indexes again and times the same queries. The median and p95 milliseconds are printed as JSON.
+'''
+import time
+import random
+import argparse
+import datetime
+import statistics
+
+from common import setup_environment, load_catalog, report
+
+# indexes added by the 323f335568b4 migration
+INDEXES = ['ix_movies_actor_id_movie_id', 'ix_actor_name_id', 'ix_actor_age_id', 'ix_actor_gender_age_id',
+  'ix_movie_release_year_id']
+
+
+def analyze(db):
+  db.session.execute('ANALYZE')
+  db.session.commit()
+
+
+def measure(db, samples, actors):
+  from models import Actor, Movie, select_fields, load_related
+
+  rng = random.Random(42)
+  queries = {
+    # GET /actors page of 20 with its movies
+    'relationship_load': lambda: load_related(Actor, 'movies', [rng.randint(1, actors) for _ in range(20)]),
+    'actors_by_name': lambda: select_fields(Actor, Actor.FIELDS)
+      .filter(Actor.name > 'Actor {}'.format(rng.randint(1, actors)))
+      .order_by(Actor.name, Actor.id).limit(21).all(),
+    'actors_by_gender_and_age': lambda: select_fields(Actor, Actor.FIELDS)
+      .filter(Actor.gender == 'F', Actor.age.between(20, 30), Actor.id > rng.randint(1, actors))
+      .order_by(Actor.age, Actor.id).limit(21).all(),
+    'movies_by_release_year': lambda: select_fields(Movie, Movie.FIELDS)
+      .filter(Movie.release_year >= datetime.datetime(1950 + rng.randint(0, 69), 1, 1))
+      .order_by(Movie.release_year, Movie.id).limit(21).all()
+  }
+
+  results = {}
+  for name, query in queries.items():
+    timings = []
+    for _ in range(samples):
+      start = time.perf_counter()
+      query()
+      timings.append((time.perf_counter() - start) * 1000)
+      db.session.rollback()
+    timings.sort()
+    results[name] = {
+      'median_ms': statistics.median(timings),
+      'p95_ms': timings[int(len(timings) * 0.95) - 1]
+    }
+  return results
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--actors', type=int, default=100000)
+  parser.add_argument('--movies', type=int, default=20000)
+  parser.add_argument('--links', type=int, default=1000000, help='association rows')
+  parser.add_argument('--samples', type=int, default=200, help='runs of each query')
+  parser.add_argument('--database-url', help='empty database to run against, a temporary SQLite file by default')
+  args = parser.parse_args()
+
+  setup_environment(args.database_url)
+
+  from app import create_app
+  from models import db
+
+  app = create_app()
+  with app.app_context():
+    indexes = [index for table in db.metadata.tables.values() for index in table.indexes if index.name in INDEXES]
+    for index in indexes:
+      index.drop(bind=db.engine)
+
+    start = time.perf_counter()
+    load_catalog(db, args.actors, args.movies, args.links)
+    analyze(db)
+    results = {
+      'database': db.engine.dialect.name,
+      'actors': args.actors,
+      'movies': args.movies,
+      'links': args.links,
+      'load_seconds': time.perf_counter() - start
+    }
+
+    results['before'] = measure(db, args.samples, args.actors)
+    for index in indexes:
+      index.create(bind=db.engine)
+    analyze(db)
+    results['after'] = measure(db, args.samples, args.actors)
+
+  report(results)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,80 @@
+'''
+Serialization of the list responses: the JSON providers against Flask's jsonify
+
+  python benchmarks/bench_json.py --page-size 100 --pages 50
+
+It loads a synthetic catalog in a scratch database (a temporary SQLite file by default) and formats --pages
+pages of --page-size actors (with their movie titles) and movies (with their actor names and release_year
+datetimes) the way GET /actors and GET /movies do. Each page is then turned into a response --repeat times by
+flask.jsonify and by serialization.jsonify with each provider (stdlib, orjson when installed), compact and
+indented (DEBUG). It prints the microseconds per page, the MB/s of response body and the speedup over
+flask.jsonify as JSON.
+'''
+import time
+import argparse
+
+import flask
+
+from common import setup_environment, load_catalog, report
+
+
+def measure(encode, pages, repeat):
+  size = sum(len(encode(page).get_data()) for page in pages)
+  start = time.perf_counter()
+  for _ in range(repeat):
+    for page in pages:
+      encode(page).get_data()
+  elapsed = time.perf_counter() - start
+  return {
+    'us_per_page': elapsed / (repeat * len(pages)) * 1e6,
+    'mb_per_sec': size * repeat / elapsed / 1e6,
+    'bytes_per_page': size / len(pages)
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--page-size', type=int, default=100)
+  parser.add_argument('--pages', type=int, default=50, help='pages of each model')
+  parser.add_argument('--repeat', type=int, default=20, help='encodings of each page')
+  parser.add_argument('--density', type=int, default=5, help='movies per actor')
+  parser.add_argument('--database-url', help='empty database to run against, a temporary SQLite file by default')
+  args = parser.parse_args()
+
+  setup_environment(args.database_url)
+
+  from app import create_app
+  from models import db, Actor, Movie, RELATIONS, select_fields, format_rows
+  from serialization import PROVIDERS, json_responses, orjson
+
+  app = create_app()
+  rows = args.page_size * args.pages
+  with app.app_context():
+    load_catalog(db, rows, rows, rows * args.density)
+    pages = []
+    for model, key in ((Actor, 'actors'), (Movie, 'movies')):
+      for start in range(0, rows, args.page_size):
+        page = select_fields(model, model.FIELDS).filter(model.id > start).order_by(model.id) \
+          .limit(args.page_size).all()
+        pages.append({'success': True, key: format_rows(model, page, model.FIELDS, tuple(RELATIONS[model])),
+          'next_cursor': 'eyJpZCI6IDEwMH0'})
+    db.session.remove()
+
+  providers = {name: provider(app.config['JSON_SORT_KEYS'], app.config['JSON_LEGACY_DATES'])
+    for name, provider in PROVIDERS.items() if name != 'orjson' or orjson is not None}
+  results = {'page_size': args.page_size, 'pages': len(pages), 'orjson_installed': orjson is not None}
+  with app.test_request_context():
+    for mode, pretty in (('compact', False), ('indented', True)):
+      app.debug = pretty
+      results[mode] = {'flask_jsonify': measure(flask.jsonify, pages, args.repeat)}
+      for name, provider in providers.items():
+        app.extensions['json_provider'] = provider
+        results[mode][name] = measure(json_responses.jsonify, pages, args.repeat)
+        results[mode][name]['speedup'] = \
+          results[mode]['flask_jsonify']['us_per_page'] / results[mode][name]['us_per_page']
+
+  report(results)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,220 @@
+'''
+Load test of the casting API under gunicorn, with a mixed read and write workload
+
+  BENCHMARK_DATABASE_URL=postgresql://localhost/capstone_bench python benchmarks/bench_load.py \
+    --actors 100000 --movies 20000 --density 10 --workers 4 --concurrency 32 --duration 60 \
+    --output results.json --baseline baseline.json
+
+It needs an empty scratch database (a temporary SQLite file by default, which serializes the writes of the
+workers). It loads a synthetic catalog of --actors and --movies with --density movies per actor, starts
+gunicorn with the repository gunicorn.conf.py and QUERY_RECORDER_ENABLED, and runs --concurrency clients for
+--duration seconds. Each client picks GET, POST, PATCH or DELETE requests with the weights of --mix, and
+only deletes the actors it created so the catalog keeps its size.
+
+The req/s, p50/p95/p99 latencies and SQL queries per request (from the X-Debug-Queries header), overall and
+per operation, are printed as JSON and written to --output. With --baseline, the req/s and p95 are compared
+to a previous output and the script exits with status 1 if either regressed by more than --tolerance.
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+
+from common import setup_environment, load_catalog, start_server, stop_server, report
+
+OPERATIONS = ('get', 'post', 'patch', 'delete')
+
+
+def parse_mix(value):
+  mix = dict.fromkeys(OPERATIONS, 0.0)
+  for item in value.split(','):
+    name, _, weight = item.partition('=')
+    if name not in mix:
+      raise argparse.ArgumentTypeError('unknown operation ' + name)
+    mix[name] = float(weight)
+  return mix
+
+
+def send(base_url, token, method, path, body=None):
+  data = json.dumps(body).encode('utf-8') if body is not None else None
+  http_request = urllib.request.Request(base_url + path, data=data, method=method, headers={
+    'Authorization': 'Bearer ' + token,
+    'Content-Type': 'application/json'
+  })
+  try:
+    with urllib.request.urlopen(http_request, timeout=30) as response:
+      return response.status, response.headers.get('X-Debug-Queries'), response.read()
+  except urllib.error.HTTPError as error:
+    return error.code, error.headers.get('X-Debug-Queries'), error.read()
+
+
+def query_count(header):
+  # i.e. count=3; time_ms=1.52; max_repeats=1
+  if not header:
+    return None
+  return int(header.split(';')[0].split('=')[1])
+
+
+'''
+Client
+Sends the requests of one simulated user until the deadline and keeps their (operation, seconds, status, queries)
+'''
+class Client(threading.Thread):
+  def __init__(self, base_url, token, args, seed, deadline):
+    super().__init__(daemon=True)
+    self.base_url = base_url
+    self.token = token
+    self.args = args
+    self.rng = random.Random(seed)
+    self.deadline = deadline
+    self.created = []
+    self.samples = []
+
+  def next_request(self):
+    args, rng = self.args, self.rng
+    operation = rng.choices(OPERATIONS, weights=[args.mix[name] for name in OPERATIONS])[0]
+    if operation == 'delete' and not self.created:
+      operation = 'post'
+
+    if operation == 'get':
+      return operation, 'GET', rng.choice([
+        '/actors?limit=20&after={}'.format(rng.randint(0, args.actors)),
+        '/actors?gender=F&age_min={}&age_max=60&limit=20'.format(rng.randint(18, 50)),
+        '/movies?limit=20&after={}'.format(rng.randint(0, args.movies)),
+        '/search?q=Actor%20{}'.format(rng.randint(1, args.actors))
+      ]), None
+    if operation == 'post':
+      return operation, 'POST', '/actors', {
+        'name': 'Load Actor {}'.format(rng.randint(1, 10 ** 9)),
+        'age': rng.randint(18, 77),
+        'gender': rng.choice('FM'),
+        'movies': rng.sample(range(1, args.movies + 1), min(args.density, args.movies))
+      }
+    if operation == 'patch':
+      return operation, 'PATCH', '/actors/{}'.format(rng.randint(1, args.actors)), {'age': rng.randint(18, 77)}
+    return operation, 'DELETE', '/actors/{}'.format(self.created.pop()), None
+
+  def run(self):
+    while time.perf_counter() < self.deadline:
+      operation, method, path, body = self.next_request()
+      start = time.perf_counter()
+      status, header, data = send(self.base_url, self.token, method, path, body)
+      self.samples.append((operation, time.perf_counter() - start, status, query_count(header)))
+      if operation == 'post' and status == 200:
+        self.created.append(json.loads(data)['actors'][0]['id'])
+
+
+def percentile(values, fraction):
+  return values[min(int(len(values) * fraction), len(values) - 1)] if values else None
+
+
+def summarize(samples, duration):
+  latencies = sorted(seconds * 1000 for _, seconds, _, _ in samples)
+  queries = [count for _, _, _, count in samples if count is not None]
+  return {
+    'requests': len(samples),
+    'requests_per_second': len(samples) / duration,
+    'errors': sum(1 for _, _, status, _ in samples if status >= 500),
+    'p50_ms': percentile(latencies, 0.5),
+    'p95_ms': percentile(latencies, 0.95),
+    'p99_ms': percentile(latencies, 0.99),
+    'queries_per_request': sum(queries) / len(queries) if queries else None
+  }
+
+
+def compare(results, baseline, tolerance):
+  regressions = []
+  current, previous = results['results'], baseline['results']
+  if current['requests_per_second'] < previous['requests_per_second'] * (1 - tolerance):
+    regressions.append('requests_per_second')
+  if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+    regressions.append('p95_ms')
+  return {
+    'requests_per_second_change': current['requests_per_second'] / previous['requests_per_second'] - 1,
+    'p95_ms_change': current['p95_ms'] / previous['p95_ms'] - 1,
+    'regressions': regressions
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--actors', type=int, default=10000)
+  parser.add_argument('--movies', type=int, default=2000)
+  parser.add_argument('--density', type=int, default=5, help='movies per actor')
+  parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+  parser.add_argument('--threads', type=int, default=1, help='threads per gunicorn worker')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+  parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+  parser.add_argument('--mix', type=parse_mix, default='get=85,post=5,patch=5,delete=5',
+    help='weights of the get, post, patch and delete operations')
+  parser.add_argument('--seed', type=int, default=42)
+  parser.add_argument('--output', help='file to write the results to')
+  parser.add_argument('--baseline', help='results of a previous run to compare to')
+  parser.add_argument('--tolerance', type=float, default=0.1, help='allowed regression, 0.1 is 10%%')
+  parser.add_argument('--database-url', help='empty database to run against, a temporary SQLite file by default')
+  args = parser.parse_args()
+
+  local_auth = setup_environment(args.database_url)
+
+  from app import create_app
+  from models import db
+
+  app = create_app()
+  with app.app_context():
+    load_catalog(db, args.actors, args.movies, args.actors * args.density)
+    database = db.engine.dialect.name
+    db.session.remove()
+    db.engine.dispose()
+
+  server, base_url = start_server([sys.executable, '-m', 'gunicorn.app.wsgiapp', 'app:app', '--preload',
+    '--workers', str(args.workers), '--threads', str(args.threads), '--bind', '127.0.0.1:{}'.format(args.port)],
+    args.port, dict(os.environ, QUERY_RECORDER_ENABLED='true'))
+  try:
+    token = local_auth.token()
+    deadline = time.perf_counter() + args.duration
+    clients = [Client(base_url, token, args, args.seed + index, deadline) for index in range(args.concurrency)]
+    for client in clients:
+      client.start()
+    for client in clients:
+      client.join()
+  finally:
+    stop_server(server)
+
+  samples = [sample for client in clients for sample in client.samples]
+  results = {
+    'config': {
+      'database': database,
+      'actors': args.actors,
+      'movies': args.movies,
+      'density': args.density,
+      'workers': args.workers,
+      'threads': args.threads,
+      'concurrency': args.concurrency,
+      'duration': args.duration,
+      'mix': args.mix
+    },
+    'results': summarize(samples, args.duration),
+    'operations': {operation: summarize([sample for sample in samples if sample[0] == operation], args.duration)
+      for operation in OPERATIONS if any(sample[0] == operation for sample in samples)}
+  }
+
+  if args.baseline:
+    with open(args.baseline) as baseline_file:
+      results['baseline'] = compare(results, json.load(baseline_file), args.tolerance)
+  if args.output:
+    with open(args.output, 'w') as output_file:
+      json.dump(results, output_file, indent=2, sort_keys=True)
+  report(results)
+
+  if args.baseline and results['baseline']['regressions']:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,116 @@
+'''
+Load test of the database connection pool at the target concurrency
+
+  BENCHMARK_DATABASE_URL=postgresql://localhost/capstone_bench DB_POOL_SIZE=10 DB_MAX_OVERFLOW=10 \
+    python benchmarks/bench_pool.py --concurrency 32 --duration 30
+
+It needs an empty scratch database (a temporary SQLite file by default) and loads a synthetic catalog.
+Each of the --concurrency threads plays a gunicorn worker thread sending list, filter and search requests
+for --duration seconds, with the response cache disabled so every request checks out a connection, while
+the pool is sampled every 10 ms. It prints the latencies, the peak checked out and overflow connections and
+the checkout wait histogram as JSON, and exits with status 1 if a checkout timed out (pool exhaustion).
+The DB_POOL_* settings only apply to PostgreSQL, SQLite files open a connection per checkout.
+'''
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+from common import setup_environment, load_catalog, report
+
+
+def paths(rng, actors, movies):
+  return [
+    '/actors?limit=20&after={}'.format(rng.randint(0, actors)),
+    '/actors?gender=F&age_min={}&age_max=60&limit=20'.format(rng.randint(18, 50)),
+    '/movies?limit=20&after={}'.format(rng.randint(0, movies)),
+    '/search?q=Actor%20{}'.format(rng.randint(1, actors))
+  ]
+
+
+def worker(app, headers, args, deadline, seed, results):
+  rng = random.Random(seed)
+  client = app.test_client()
+  while time.perf_counter() < deadline:
+    path = rng.choice(paths(rng, args.actors, args.movies))
+    start = time.perf_counter()
+    status = client.get(path, headers=headers).status_code
+    results.append((time.perf_counter() - start, status))
+
+
+def monitor(engine, stop, peaks):
+  from pool import pool_stats
+
+  while not stop.wait(0.01):
+    stats = pool_stats(engine.pool)
+    for name in ('checked_out', 'overflow'):
+      if name in stats:
+        peaks[name] = max(peaks.get(name, 0), stats[name])
+
+
+def percentile(values, fraction):
+  return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--concurrency', type=int, default=32, help='concurrent requests')
+  parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+  parser.add_argument('--actors', type=int, default=10000)
+  parser.add_argument('--movies', type=int, default=2000)
+  parser.add_argument('--links', type=int, default=50000, help='association rows')
+  parser.add_argument('--database-url', help='empty database to run against, a temporary SQLite file by default')
+  args = parser.parse_args()
+
+  local_auth = setup_environment(args.database_url)
+  os.environ['RESPONSE_CACHE_ENABLED'] = 'false'
+
+  from app import create_app
+  from models import db
+  from pool import pool_stats
+
+  app = create_app()
+  headers = {'Authorization': 'Bearer {}'.format(local_auth.token())}
+  with app.app_context():
+    load_catalog(db, args.actors, args.movies, args.links)
+    db.session.remove()
+    engine = db.engine
+
+  stop, peaks, results = threading.Event(), {}, []
+  sampler = threading.Thread(target=monitor, args=(engine, stop, peaks), daemon=True)
+  sampler.start()
+
+  deadline = time.perf_counter() + args.duration
+  threads = [threading.Thread(target=worker, args=(app, headers, args, deadline, seed, results))
+    for seed in range(args.concurrency)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  stop.set()
+  sampler.join()
+
+  latencies = sorted(seconds * 1000 for seconds, _ in results)
+  stats = pool_stats(engine.pool)
+  report({
+    'database': engine.dialect.name,
+    'concurrency': args.concurrency,
+    'requests': len(results),
+    'requests_per_second': len(results) / args.duration,
+    'errors': sum(1 for _, status in results if status >= 500),
+    'median_ms': percentile(latencies, 0.5),
+    'p95_ms': percentile(latencies, 0.95),
+    'p99_ms': percentile(latencies, 0.99),
+    'peak_checked_out': peaks.get('checked_out'),
+    'peak_overflow': peaks.get('overflow'),
+    'pool': stats
+  })
+
+  if stats.get('timeouts'):
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
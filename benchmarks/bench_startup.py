@@ -0,0 +1,96 @@
+'''
+Cold start of the app: import, create_app and first request latency in fresh processes
+
+  BENCHMARK_DATABASE_URL=postgresql://localhost/capstone_bench python benchmarks/bench_startup.py --runs 10
+
+It needs an empty scratch database (a temporary SQLite file by default), where a small catalog is loaded once.
+Each run starts a new interpreter which imports app, calls create_app and sends a first GET /actors through the
+test client, with DB_CREATE_ALL on (the tables are checked at every start) and off (the schema is left to the
+migrations). For each mode it prints the median and worst boot time (process start to first response), the
+import, create_app and first request times, the SQL statements run by create_app and whether alembic was
+imported.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from common import ROOT, setup_environment, load_catalog, report
+
+# runs in the fresh interpreter, prints its timings as JSON
+PROBE = '''
+import sys, json, time
+start = time.perf_counter()
+from queries import record_queries
+from app import create_app
+imported = time.perf_counter()
+with record_queries() as recorder:
+  app = create_app()
+created = time.perf_counter()
+response = app.test_client().get('/actors', headers={'Authorization': 'Bearer ' + sys.argv[1]})
+answered = time.perf_counter()
+print(json.dumps({
+  'status': response.status_code,
+  'import_ms': (imported - start) * 1000,
+  'create_app_ms': (created - imported) * 1000,
+  'first_request_ms': (answered - created) * 1000,
+  'create_app_statements': recorder.count,
+  'alembic_imported': 'alembic' in sys.modules
+}))
+'''
+
+
+def probe(token, create_all):
+  env = dict(os.environ, DB_CREATE_ALL='true' if create_all else 'false')
+  start = time.perf_counter()
+  output = subprocess.run([sys.executable, '-c', PROBE, token], cwd=ROOT, env=env, check=True,
+    stdout=subprocess.PIPE).stdout
+  sample = json.loads(output)
+  sample['boot_ms'] = (time.perf_counter() - start) * 1000
+  return sample
+
+
+def summarize(samples):
+  summary = {}
+  for name in ('boot_ms', 'import_ms', 'create_app_ms', 'first_request_ms'):
+    values = [sample[name] for sample in samples]
+    summary[name] = {'median': statistics.median(values), 'max': max(values)}
+  summary['create_app_statements'] = max(sample['create_app_statements'] for sample in samples)
+  summary['alembic_imported'] = any(sample['alembic_imported'] for sample in samples)
+  summary['statuses'] = sorted({sample['status'] for sample in samples})
+  return summary
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--runs', type=int, default=10, help='fresh processes per mode')
+  parser.add_argument('--actors', type=int, default=1000)
+  parser.add_argument('--movies', type=int, default=200)
+  parser.add_argument('--links', type=int, default=5000, help='association rows')
+  parser.add_argument('--database-url', help='empty database to run against, a temporary SQLite file by default')
+  args = parser.parse_args()
+
+  local_auth = setup_environment(args.database_url)
+
+  from app import create_app
+  from models import db
+
+  app = create_app()
+  with app.app_context():
+    load_catalog(db, args.actors, args.movies, args.links)
+    database = db.engine.dialect.name
+    db.session.remove()
+    db.engine.dispose()
+
+  token = local_auth.token()
+  results = {'database': database, 'runs': args.runs}
+  for mode, create_all in (('create_all', True), ('migrations_only', False)):
+    results[mode] = summarize([probe(token, create_all) for _ in range(args.runs)])
+  report(results)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+import signal
+import datetime
+import tempfile
+import subprocess
+import urllib.request
+
+from jose import jwt
+from jose.utils import base64url_encode
+from Crypto.PublicKey import RSA
+
+# the benchmarks import the app modules from the repository root
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+  sys.path.insert(0, ROOT)
+
+ALL_PERMISSIONS = [
+  'get:actors', 'post:actors', 'patch:actors', 'delete:actors',
+  'get:movies', 'post:movies', 'patch:movies', 'delete:movies'
+]
+
+'''
+LocalAuth
+Signs tokens with a local RSA key and serves the matching JWKS from a file, so no Auth0 tenant is needed
+  configure() sets the environment read by auth.py, it must run before the app modules are imported
+'''
+class LocalAuth:
+  def __init__(self, directory, domain='benchmark.local', audience='capstone', kid='benchmark'):
+    self.domain = domain
+    self.audience = audience
+    self.kid = kid
+    self.key = RSA.generate(2048)
+    self.jwks_path = os.path.join(directory, 'jwks.json')
+
+    def encode_int(value):
+      return base64url_encode(value.to_bytes((value.bit_length() + 7) // 8, 'big')).decode('utf-8')
+
+    with open(self.jwks_path, 'w') as jwks_file:
+      json.dump({'keys': [{
+        'kty': 'RSA',
+        'kid': kid,
+        'use': 'sig',
+        'alg': 'RS256',
+        'n': encode_int(self.key.n),
+        'e': encode_int(self.key.e)
+      }]}, jwks_file)
+
+  def configure(self):
+    os.environ['AUTH0_DOMAIN'] = self.domain
+    os.environ['API_AUDIENCE'] = self.audience
+    os.environ['ALGORITHMS'] = "['RS256']"
+    os.environ['JWKS_URL'] = 'file://' + self.jwks_path
+
+  def token(self, permissions=ALL_PERMISSIONS, ttl=3600):
+    claims = {
+      'iss': 'https://' + self.domain + '/',
+      'aud': self.audience,
+      'exp': int(time.time()) + ttl,
+      'permissions': list(permissions)
+    }
+    return jwt.encode(claims, self.key.export_key('PEM').decode('utf-8'), algorithm='RS256',
+      headers={'kid': self.kid})
+
+'''
+setup_environment(database_url=None)
+    configures the local auth and the database, a temporary SQLite file by default
+    returns the LocalAuth, the app modules must be imported after calling it
+'''
+def setup_environment(database_url=None):
+  directory = tempfile.mkdtemp(prefix='capstone-benchmark-')
+  local_auth = LocalAuth(directory)
+  local_auth.configure()
+  os.environ['DATABASE_URL'] = database_url or os.environ.get('BENCHMARK_DATABASE_URL') or \
+    'sqlite:///' + os.path.join(directory, 'benchmark.db')
+  return local_auth
+
+'''
+load_catalog(db, actors, movies, links)
+    loads a synthetic catalog of sequential ids into empty tables, with generate_series on PostgreSQL
+    the links are spread over the actors and movies, links / actors per actor
+'''
+def load_catalog(db, actors, movies, links):
+  from models import Actor, Movie, movies as movies_table
+
+  connection = db.session.connection()
+  if connection.dialect.name == 'postgresql':
+    connection.execute('''INSERT INTO "Actor" (id, name, age, gender)
+      SELECT g, 'Actor ' || g, 18 + g %% 60, CASE WHEN g %% 2 = 0 THEN 'F' ELSE 'M' END
+      FROM generate_series(1, %s) g''', actors)
+    connection.execute('''INSERT INTO "Movie" (id, title, release_year)
+      SELECT g, 'Movie ' || g, timestamp '1950-01-01' + (g %% 70) * interval '1 year'
+      FROM generate_series(1, %s) g''', movies)
+    connection.execute('''INSERT INTO movies (movie_id, actor_id)
+      SELECT 1 + (g * 7919) %% %s, 1 + g %% %s FROM generate_series(1, %s) g
+      ON CONFLICT DO NOTHING''', (movies, actors, links))
+    # the ids were given, move the sequences past them for the rows created by the endpoints
+    for table in ('Actor', 'Movie'):
+      connection.execute(f'''SELECT setval(pg_get_serial_sequence('"{table}"', 'id'), max(id)) FROM "{table}"''')
+  else:
+    chunk = 10000
+    for start in range(1, actors + 1, chunk):
+      connection.execute(Actor.__table__.insert(), [
+        {'id': g, 'name': f'Actor {g}', 'age': 18 + g % 60, 'gender': 'F' if g % 2 == 0 else 'M'}
+        for g in range(start, min(start + chunk, actors + 1))])
+    for start in range(1, movies + 1, chunk):
+      connection.execute(Movie.__table__.insert(), [
+        {'id': g, 'title': f'Movie {g}', 'release_year': datetime.datetime(1950 + g % 70, 1, 1)}
+        for g in range(start, min(start + chunk, movies + 1))])
+    pairs = dict.fromkeys((1 + (g * 7919) % movies, 1 + g % actors) for g in range(1, links + 1))
+    pairs = list(pairs)
+    for start in range(0, len(pairs), chunk):
+      connection.execute(movies_table.insert(), [
+        {'movie_id': movie_id, 'actor_id': actor_id} for movie_id, actor_id in pairs[start:start + chunk]])
+  db.session.commit()
+
+'''
+start_server(command, port, env=None)
+    starts the server command (i.e. gunicorn app:app) from the repository root and waits until it answers
+    returns the process and the base url of the server
+'''
+def start_server(command, port, env=None):
+  # in its own process group, stop_server signals the workers as well
+  server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, start_new_session=True)
+  base_url = 'http://127.0.0.1:{}'.format(port)
+  for _ in range(300):
+    if server.poll() is not None:
+      raise RuntimeError('{} exited with status {}'.format(command[2], server.returncode))
+    try:
+      urllib.request.urlopen(base_url + '/', timeout=1).read()
+      return server, base_url
+    except OSError:
+      time.sleep(0.1)
+  stop_server(server)
+  raise RuntimeError('{} did not start'.format(command[2]))
+
+'''
+stop_server(server)
+    stops a server started by start_server and its workers
+'''
+def stop_server(server):
+  os.killpg(server.pid, signal.SIGTERM)
+  server.wait()
+
+'''
+report(results)
+    prints the results as JSON
+'''
+def report(results):
+  print(json.dumps(results, indent=2, sort_keys=True, default=str))
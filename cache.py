@@ -0,0 +1,135 @@
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import wraps
+from flask import request, current_app, g
+
+'''
+CacheBackend
+Storage interface of the response cache
+  a backend shared between processes (i.e. redis, memcached) makes the invalidations visible to every worker
+  get(key) returns the stored value or None
+  set(key, value, ttl) stores value for at most ttl seconds
+  get_counter(key) returns the counter value, 0 if it was never incremented
+  incr(key) atomically increments the counter and returns its new value
+'''
+class CacheBackend(ABC):
+  @abstractmethod
+  def get(self, key):
+    pass
+
+  @abstractmethod
+  def set(self, key, value, ttl):
+    pass
+
+  @abstractmethod
+  def get_counter(self, key):
+    pass
+
+  @abstractmethod
+  def incr(self, key):
+    pass
+
+'''
+LocalCacheBackend
+In process LRU backend, the default one
+  the counters are local to the process, so other workers only see their writes after max staleness
+'''
+class LocalCacheBackend(CacheBackend):
+  def __init__(self, maxsize=256):
+    self.maxsize = maxsize
+    self._entries = OrderedDict()
+    self._counters = {}
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+
+      expires_at, value = entry
+      if time.monotonic() >= expires_at:
+        del self._entries[key]
+        return None
+
+      self._entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl):
+    with self._lock:
+      self._entries[key] = (time.monotonic() + ttl, value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+
+  def get_counter(self, key):
+    return self._counters.get(key, 0)
+
+  def incr(self, key):
+    with self._lock:
+      self._counters[key] = self._counters.get(key, 0) + 1
+      return self._counters[key]
+
+'''
+ResponseCache
+Caches successful GET responses keyed by route, query parameters and the version of the tables they read
+  it is not keyed by caller, so it must run after requires_auth
+  invalidate(*tables) bumps the versions of the tables after a write
+  entries are dropped after RESPONSE_CACHE_MAX_STALENESS seconds in any case
+'''
+class ResponseCache:
+  def init_app(self, app, backend=None):
+    if backend is None:
+      backend = app.config.get('RESPONSE_CACHE_BACKEND') or \
+        LocalCacheBackend(app.config.get('RESPONSE_CACHE_SIZE', 256))
+    app.extensions['response_cache'] = backend
+
+  @property
+  def backend(self):
+    return current_app.extensions['response_cache']
+
+  @staticmethod
+  def version_key(table):
+    return 'version:' + table
+
+  def key(self, tables):
+    args = '&'.join(f'{name}={value}' for name, value in sorted(request.args.items(multi=True)))
+    versions = ','.join(str(self.backend.get_counter(self.version_key(table))) for table in tables)
+    return f'response:{request.path}?{args}@{versions}'
+
+  def invalidate(self, *tables):
+    for table in tables:
+      self.backend.incr(self.version_key(table))
+
+  def cached(self, *tables):
+    def cached_decorator(f):
+      @wraps(f)
+      def wrapper(*args, **kwargs):
+        if not current_app.config.get('RESPONSE_CACHE_ENABLED', True):
+          return f(*args, **kwargs)
+
+        key = self.key(tables)
+        entry = self.backend.get(key)
+        if entry is not None:
+          body, status, mimetype, etag = entry
+          response = current_app.response_class(body, status=status, mimetype=mimetype)
+          if etag:
+            # the etag of the cached body, which may be older than the current one
+            response.headers['ETag'] = etag
+          return response
+
+        response = current_app.make_response(f(*args, **kwargs))
+        if response.status_code == 200:
+          if 'etag' in g and 'ETag' not in response.headers:
+            # etag computed by the conditional decorator for this body
+            response.set_etag(g.etag)
+          self.backend.set(key,
+            (response.get_data(), response.status_code, response.mimetype, response.headers.get('ETag')),
+            current_app.config.get('RESPONSE_CACHE_MAX_STALENESS', 30))
+        return response
+      return wrapper
+    return cached_decorator
+
+response_cache = ResponseCache()
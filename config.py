@@ -1,5 +1,7 @@
 import os
-SECRET_KEY = os.urandom(32)
+from pool import TimedQueuePool
+# Set SECRET_KEY so every worker (and every restart) signs with the same key, a random one is only valid in its process
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -9,3 +11,79 @@ DEBUG = True
 # Connect to the database
 SQLALCHEMY_DATABASE_URI = os.environ["DATABASE_URL"]
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+# Create the missing tables when the app is created, turn it off where the schema is managed by the migrations
+# (python manage.py db upgrade) so creating the app does no database I/O
+DB_CREATE_ALL = os.environ.get('DB_CREATE_ALL', 'true').lower() == 'true'
+
+# Connection pool of the database, SQLite files keep the default pool of a connection per checkout
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+# seconds before a connection is replaced, -1 keeps them forever
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# test the connections on checkout, so the ones broken by a failover are replaced instead of failing a request
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+# milliseconds before PostgreSQL cancels a statement, 0 disables it
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+
+# Threads running the requests of the ASGI entry point (asgi.py), one per pool connection by default
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', DB_POOL_SIZE + DB_MAX_OVERFLOW))
+
+SQLALCHEMY_ENGINE_OPTIONS = {}
+if not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+  SQLALCHEMY_ENGINE_OPTIONS = {
+    'poolclass': TimedQueuePool,
+    'pool_size': DB_POOL_SIZE,
+    'max_overflow': DB_MAX_OVERFLOW,
+    'pool_timeout': DB_POOL_TIMEOUT,
+    'pool_recycle': DB_POOL_RECYCLE,
+    'pool_pre_ping': DB_POOL_PRE_PING
+  }
+if SQLALCHEMY_DATABASE_URI.startswith('postgres') and DB_STATEMENT_TIMEOUT:
+  SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'}
+
+# Per request SQL recorder of debug and test setups, sets the X-Debug-Queries header and logs the SQL shapes
+# run more than QUERY_REPEAT_THRESHOLD times in a request
+QUERY_RECORDER_ENABLED = os.environ.get('QUERY_RECORDER_ENABLED', 'false').lower() == 'true'
+QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 5))
+
+# Addresses allowed to call the internal endpoints (i.e. /internal/pool)
+INTERNAL_ADDRESSES = [address.strip() for address in
+  os.environ.get('INTERNAL_ADDRESSES', '127.0.0.1,::1').split(',') if address.strip()]
+
+# Pagination of the list endpoints
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 20))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 100))
+
+# Response cache of the list endpoints
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+RESPONSE_CACHE_MAX_STALENESS = int(os.environ.get('RESPONSE_CACHE_MAX_STALENESS', 30))
+
+# Maximum number of records of the batch endpoints
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 5000))
+
+# Rows read at a time by the export endpoints
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))
+
+# Results of the search endpoint
+SEARCH_LIMIT = int(os.environ.get('SEARCH_LIMIT', 10))
+MAX_SEARCH_LIMIT = int(os.environ.get('MAX_SEARCH_LIMIT', 50))
+
+# Co-star graph of /actors/<id>/costars and /actors/<id>/path/<id>, kept in memory by each process and synced
+# with the link changes, the queries are answered by the database while it is built or when it is disabled
+GRAPH_INDEX_ENABLED = os.environ.get('GRAPH_INDEX_ENABLED', 'true').lower() == 'true'
+# seconds between two full rebuilds, which also compact the links changed since the last one
+GRAPH_REBUILD_INTERVAL = int(os.environ.get('GRAPH_REBUILD_INTERVAL', 3600))
+# changed links kept beside the compact arrays before a rebuild is started
+GRAPH_OVERLAY_LIMIT = int(os.environ.get('GRAPH_OVERLAY_LIMIT', 100000))
+# degrees of separation searched by the path endpoint
+GRAPH_MAX_DEPTH = int(os.environ.get('GRAPH_MAX_DEPTH', 6))
+COSTARS_LIMIT = int(os.environ.get('COSTARS_LIMIT', 20))
+MAX_COSTARS_LIMIT = int(os.environ.get('MAX_COSTARS_LIMIT', 100))
+
+# Encoder of the JSON responses, 'orjson' (the default, 'stdlib' when it is not installed) or 'stdlib'
+JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'orjson')
+# Encode the datetimes as RFC 1123 strings (i.e. 'Fri, 15 May 2020 00:00:00 GMT'), the format of the responses
+# before the JSON providers, instead of ISO-8601
+JSON_LEGACY_DATES = os.environ.get('JSON_LEGACY_DATES', 'false').lower() == 'true'
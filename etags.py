@@ -0,0 +1,42 @@
+import zlib
+from functools import wraps
+from flask import request, current_app, g
+
+from models import table_versions
+
+'''
+make_etag(versions) method
+  @INPUTS
+    versions: tuple of the versions of the tables the response reads
+  returns a strong etag of the route, the query parameters and the versions
+'''
+def make_etag(versions):
+  args = '&'.join(f'{name}={value}' for name, value in sorted(request.args.items(multi=True)))
+  query_hash = zlib.crc32(f'{request.path}?{args}'.encode('utf-8'))
+  return '{}-{:08x}'.format('.'.join(str(version) for version in versions), query_hash)
+
+'''
+@conditional(*tables) decorator method
+  @INPUTS
+    tables: names of the tables the response reads
+  it should respond with a 304 if If-None-Match matches the current etag, before loading any row
+  it should set the ETag header of the successful responses that don't have one already
+  the etag is also stored in g.etag so the response cache keeps it with the body
+'''
+def conditional(*tables):
+  def conditional_decorator(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+      etag = make_etag(table_versions(tables))
+      if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+      g.etag = etag
+      response = current_app.make_response(f(*args, **kwargs))
+      if response.status_code == 200 and 'ETag' not in response.headers:
+        response.set_etag(etag)
+      return response
+    return wrapper
+  return conditional_decorator
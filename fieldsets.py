@@ -0,0 +1,38 @@
+from flask import request, abort
+
+from models import RELATIONS
+
+'''
+fieldset_params(model) method
+  @INPUTS
+    model: Actor or Movie
+  it should read the fields (i.e. 'id,name') and include (i.e. 'movies') query parameters
+  it should respond with a 400 error if they name an unknown field or relation
+  fields defaults to all the model fields
+  include defaults to all the relations when fields is not given, and to none otherwise
+  returns the tuple (fields, include)
+'''
+def fieldset_params(model):
+  relations = tuple(RELATIONS[model])
+
+  fields = model.FIELDS
+  if 'fields' in request.args:
+    fields = parse_list(request.args['fields'], model.FIELDS)
+
+  include = relations if 'fields' not in request.args else ()
+  if 'include' in request.args:
+    include = parse_list(request.args['include'], relations)
+
+  return fields, include
+
+'''
+parse_list(value, allowed) method
+  splits a comma separated query parameter
+  it should respond with a 400 error if any item is not in allowed
+'''
+def parse_list(value, allowed):
+  items = [item.strip() for item in value.split(',') if item.strip()]
+  if any(item not in allowed for item in items):
+    abort(400)
+  # keep the order of allowed and drop duplicates
+  return tuple(item for item in allowed if item in items)
@@ -0,0 +1,136 @@
+import datetime
+from flask import request, abort
+from sqlalchemy import tuple_
+
+from models import Actor, Movie, parse_int, parse_datetime
+
+'''
+Filters accepted by the list endpoints
+  maps each query parameter to (field, operator), the release_year values are years (i.e. 2015)
+'''
+FILTERS = {
+  Actor: {
+    'age': ('age', 'eq'),
+    'age_min': ('age', 'min'),
+    'age_max': ('age', 'max'),
+    'gender': ('gender', 'eq')
+  },
+  Movie: {
+    'release_year': ('release_year', 'eq'),
+    'release_year_min': ('release_year', 'min'),
+    'release_year_max': ('release_year', 'max')
+  }
+}
+
+'''
+Sort keys accepted by the list endpoints, in order of preference when ?sort= is not given
+  maps each key to the filtered fields its index can serve, any other filter would sort every matching row
+  a leading '-' sorts in descending order (i.e. '-age'), ties are ordered by id
+'''
+SORTS = {
+  Actor: {
+    # primary key
+    'id': (),
+    # ix_actor_age_id, and ix_actor_gender_age_id when the gender is given
+    'age': ('age', 'gender'),
+    # ix_actor_name_id
+    'name': ()
+  },
+  Movie: {
+    # primary key
+    'id': (),
+    # ix_movie_release_year_id
+    'release_year': ('release_year',)
+  }
+}
+
+'''
+filter_params(model) method
+  @INPUTS
+    model: Actor or Movie
+  it should read the filters of FILTERS and the sort (i.e. '-age') query parameters
+  it should respond with a 400 error if a value is invalid, the sort key is unknown
+    or its index can't serve the filters
+  sort defaults to the first key of SORTS able to serve the filters, id without filters
+  returns the tuple (criteria, sort) where criteria is the list of SQL filters
+'''
+def filter_params(model):
+  criteria = []
+  filtered = set()
+  for name, (field, operator) in FILTERS[model].items():
+    if name in request.args:
+      criteria.append(filter_criterion(getattr(model, field), operator, request.args[name]))
+      filtered.add(field)
+
+  sort = request.args.get('sort')
+  if sort is None:
+    sort = next((key for key, served in SORTS[model].items() if filtered.issubset(served)), None)
+
+  served = SORTS[model].get((sort or '').lstrip('-'))
+  if served is None or not filtered.issubset(served):
+    abort(400)
+
+  return criteria, sort
+
+'''
+filter_criterion(column, operator, value)
+    returns the SQL filter of a query parameter value
+    it should respond with a 400 error if the value is invalid
+'''
+def filter_criterion(column, operator, value):
+  try:
+    if column.key == 'release_year':
+      # the years are matched as [January 1st, January 1st of the next year) ranges
+      year = parse_int(value, column.key)
+      low, high = datetime.datetime(year, 1, 1), datetime.datetime(year + 1, 1, 1)
+    elif column.key == 'age':
+      low = high = parse_int(value, column.key)
+    elif value:
+      low = high = value
+    else:
+      raise ValueError(f'{column.key} is required.')
+  except ValueError:
+    abort(400)
+
+  if column.key == 'release_year':
+    if operator == 'eq':
+      return (column >= low) & (column < high)
+    return column >= low if operator == 'min' else column < high
+
+  if operator == 'eq':
+    return column == low
+  return column >= low if operator == 'min' else column <= high
+
+'''
+sort_page(query, model, sort, after)
+    orders the query by the sort key and id, and keeps the rows after the cursor position
+    after is the id, or the (value, id) position for the other sort keys, as returned by page_params
+    it should respond with a 400 error if the cursor value doesn't fit the sort key
+'''
+def sort_page(query, model, sort, after):
+  descending = sort.startswith('-')
+  column = getattr(model, sort.lstrip('-'))
+
+  if column is model.id:
+    if after is not None:
+      query = query.filter(model.id < after if descending else model.id > after)
+    return query.order_by(model.id.desc() if descending else model.id)
+
+  if after is not None:
+    value, last_id = after
+    try:
+      if column.key == 'release_year':
+        value = parse_datetime(value, column.key)
+      elif column.key == 'age':
+        value = parse_int(value, column.key)
+      elif not isinstance(value, str):
+        raise ValueError(f'{column.key} must be a string.')
+    except ValueError:
+      abort(400)
+
+    position = tuple_(column, model.id)
+    query = query.filter(position < tuple_(value, last_id) if descending else position > tuple_(value, last_id))
+
+  if descending:
+    return query.order_by(column.desc(), model.id.desc())
+  return query.order_by(column, model.id)
@@ -0,0 +1,437 @@
+import time
+import heapq
+import threading
+from array import array
+from collections import Counter
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, Actor, Movie, LinkChange, ALL_LINKS, RELATIONS, BULK_CHUNK_SIZE, movies, prune_link_changes
+
+# seconds a seq missing below the last one read is read again at each sync, the longest a write transaction is
+# expected to stay open: the seqs are taken in insert order and committed out of order by concurrent writes, and
+# the ones of rolled back writes never show up
+SYNC_GAP_TIMEOUT = 600
+# seqs below the last one at a build searched for the changes of the writes not committed yet, a few batches
+SYNC_GAP_WINDOW = 20000
+# changed rows over which a sync rebuilds the graph rather than reloading their links
+SYNC_LIMIT = 10000
+
+# the field of the actors and movies in the responses
+LABELS = {Actor: 'name', Movie: 'title'}
+
+'''
+compact(pairs)
+    returns the (offsets, targets) arrays of (key, value) pairs sorted by key
+    the values of key k are targets[offsets[k]:offsets[k + 1]]
+'''
+def compact(pairs):
+  offsets = array('q', [0])
+  targets = array('i')
+  for key, value in pairs:
+    while len(offsets) <= key:
+      offsets.append(len(targets))
+    targets.append(value)
+  offsets.append(len(targets))
+  return offsets, targets
+
+'''
+invert(offsets, targets)
+    returns the (offsets, targets) arrays of the reverse relation of the compact arrays, with a counting sort
+'''
+def invert(offsets, targets):
+  starts = array('q', bytes(8 * (max(targets, default=-1) + 2)))
+  for target in targets:
+    starts[target + 1] += 1
+  for key in range(1, len(starts)):
+    starts[key] += starts[key - 1]
+
+  positions = array('q', starts)
+  keys = array('i', bytes(4 * len(targets)))
+  for key in range(len(offsets) - 1):
+    for index in range(offsets[key], offsets[key + 1]):
+      target = targets[index]
+      keys[positions[target]] = key
+      positions[target] += 1
+  return starts, keys
+
+'''
+neighbors(offsets, targets, key)
+    returns the values of key in the compact arrays
+'''
+def neighbors(offsets, targets, key):
+  if key + 1 >= len(offsets):
+    return ()
+  return targets[offsets[key]:offsets[key + 1]]
+
+'''
+include(sets, key, value)
+    adds value to the frozenset of key in the {key: frozenset} dictionary, as a new frozenset
+'''
+def include(sets, key, value):
+  sets[key] = sets.get(key, frozenset()) | {value}
+
+'''
+discard(sets, key, value)
+    removes value from the frozenset of key in the {key: frozenset} dictionary, and the key once empty
+'''
+def discard(sets, key, value):
+  values = sets[key] - {value}
+  if values:
+    sets[key] = values
+  else:
+    del sets[key]
+
+'''
+CostarGraph
+Links between the actors and the movies in compact integer arrays, in both directions
+  the links changed since the arrays were built are kept beside them, as added and removed links of each row
+  the overlays hold frozensets that are replaced, never changed, so a copy() shares them and the arrays
+'''
+class CostarGraph:
+  def __init__(self, links):
+    # (actor_id, movie_id) sorted by actor, the movie side is sorted in memory so both come from one snapshot
+    self.actor_offsets, self.actor_movies = compact(links)
+    self.movie_offsets, self.movie_actors = invert(self.actor_offsets, self.actor_movies)
+    self.added_movies, self.added_actors = {}, {}
+    self.removed_movies, self.removed_actors = {}, {}
+    self.links = len(self.actor_movies)
+    self.changes = 0
+
+  '''
+  copy()
+      returns a graph sharing the arrays and the sets of this one, the changes made to either are not seen by
+      the other
+  '''
+  def copy(self):
+    graph = object.__new__(CostarGraph)
+    graph.__dict__.update(self.__dict__)
+    graph.added_movies, graph.added_actors = dict(self.added_movies), dict(self.added_actors)
+    graph.removed_movies, graph.removed_actors = dict(self.removed_movies), dict(self.removed_actors)
+    return graph
+
+  def movies_of(self, actor_id):
+    linked = neighbors(self.actor_offsets, self.actor_movies, actor_id)
+    if actor_id in self.removed_movies:
+      linked = [movie_id for movie_id in linked if movie_id not in self.removed_movies[actor_id]]
+    if actor_id in self.added_movies:
+      return list(linked) + list(self.added_movies[actor_id])
+    return linked
+
+  def actors_of(self, movie_id):
+    linked = neighbors(self.movie_offsets, self.movie_actors, movie_id)
+    if movie_id in self.removed_actors:
+      linked = [actor_id for actor_id in linked if actor_id not in self.removed_actors[movie_id]]
+    if movie_id in self.added_actors:
+      return list(linked) + list(self.added_actors[movie_id])
+    return linked
+
+  def link(self, movie_id, actor_id):
+    if movie_id in self.removed_movies.get(actor_id, ()):
+      discard(self.removed_movies, actor_id, movie_id)
+      discard(self.removed_actors, movie_id, actor_id)
+    else:
+      include(self.added_movies, actor_id, movie_id)
+      include(self.added_actors, movie_id, actor_id)
+    self.links += 1
+    self.changes += 1
+
+  def unlink(self, movie_id, actor_id):
+    if movie_id in self.added_movies.get(actor_id, ()):
+      discard(self.added_movies, actor_id, movie_id)
+      discard(self.added_actors, movie_id, actor_id)
+    else:
+      include(self.removed_movies, actor_id, movie_id)
+      include(self.removed_actors, movie_id, actor_id)
+    self.links -= 1
+    self.changes += 1
+
+  '''
+  relink(model, row_id, linked)
+      sets the links of an actor or a movie row to the linked ids of the other side
+  '''
+  def relink(self, model, row_id, linked):
+    if model is Actor:
+      current = set(self.movies_of(row_id))
+      for movie_id in current - linked:
+        self.unlink(movie_id, row_id)
+      for movie_id in linked - current:
+        self.link(movie_id, row_id)
+    else:
+      current = set(self.actors_of(row_id))
+      for actor_id in current - linked:
+        self.unlink(row_id, actor_id)
+      for actor_id in linked - current:
+        self.link(row_id, actor_id)
+
+  '''
+  costars(actor_id)
+      returns the {actor_id: shared movies} of the actors who played in a movie with the actor
+  '''
+  def costars(self, actor_id):
+    counts = Counter()
+    for movie_id in self.movies_of(actor_id):
+      counts.update(self.actors_of(movie_id))
+    counts.pop(actor_id, None)
+    return counts
+
+  '''
+  expand(frontier, expanded)
+      yields the (actor_id, movie_id, costar_id) links of the frontier actors to their co-stars, through the
+      movies not in the expanded set, which are added to it
+  '''
+  def expand(self, frontier, expanded):
+    for actor_id in frontier:
+      for movie_id in self.movies_of(actor_id):
+        if movie_id not in expanded:
+          expanded.add(movie_id)
+          for costar_id in self.actors_of(movie_id):
+            if costar_id != actor_id:
+              yield actor_id, movie_id, costar_id
+
+'''
+shortest_path(expand, source, target, max_depth)
+    returns (actors, movies), the actor ids of a shortest chain of co-stars from source to target and the movies
+    linking each one to the next, or None when they are more than max_depth links apart
+    a bidirectional breadth first search, expand(frontier, expanded) yields the (actor_id, movie_id, costar_id)
+    links of the frontier actors, the smaller of the two frontiers is expanded a whole level at a time
+    each side expands a movie once, all its actors are reached the first time
+'''
+def shortest_path(expand, source, target, max_depth):
+  if source == target:
+    return [source], []
+
+  # actor -> (actor towards the start of the side, movie, depth) of the actors reached by each side
+  visited = [{source: (None, None, 0)}, {target: (None, None, 0)}]
+  frontiers = [[source], [target]]
+  expanded = [set(), set()]
+  depths = [0, 0]
+  for _ in range(max_depth):
+    side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+    seen, other = visited[side], visited[1 - side]
+    depths[side] += 1
+
+    frontier, meeting = [], None
+    for actor_id, movie_id, costar_id in expand(frontiers[side], expanded[side]):
+      if costar_id in seen:
+        continue
+      seen[costar_id] = (actor_id, movie_id, depths[side])
+      frontier.append(costar_id)
+      # the level is finished, the actor closest to the other start gives the shortest chain
+      if costar_id in other and (meeting is None or other[costar_id][2] < other[meeting][2]):
+        meeting = costar_id
+    if meeting is not None:
+      return join_path(visited, meeting)
+    if not frontier:
+      return None
+    frontiers[side] = frontier
+  return None
+
+'''
+join_path(visited, meeting)
+    returns the (actors, movies) of the chain through the meeting actor of both sides of a search
+'''
+def join_path(visited, meeting):
+  actors, movie_ids = [meeting], []
+  actor_id = meeting
+  while visited[0][actor_id][0] is not None:
+    actor_id, movie_id, _ = visited[0][actor_id]
+    actors.insert(0, actor_id)
+    movie_ids.insert(0, movie_id)
+  actor_id = meeting
+  while visited[1][actor_id][0] is not None:
+    actor_id, movie_id, _ = visited[1][actor_id]
+    actors.append(actor_id)
+    movie_ids.append(movie_id)
+  return actors, movie_ids
+
+'''
+database_expand(frontier, expanded)
+    the expand of shortest_path answered by the database, a self join of the movies table per level
+'''
+def database_expand(frontier, expanded):
+  starts, costars = movies.alias('starts'), movies.alias('costars')
+  level = set()
+  for start in range(0, len(frontier), BULK_CHUNK_SIZE):
+    for actor_id, movie_id, costar_id in db.session.execute(
+        db.select([starts.c.actor_id, starts.c.movie_id, costars.c.actor_id])
+        .select_from(starts.join(costars, costars.c.movie_id == starts.c.movie_id))
+        .where(starts.c.actor_id.in_(frontier[start:start + BULK_CHUNK_SIZE]))
+        .where(costars.c.actor_id != starts.c.actor_id)):
+      if movie_id not in expanded:
+        level.add(movie_id)
+        yield actor_id, movie_id, costar_id
+  expanded.update(level)
+
+'''
+database_costars(actor_id, limit)
+    returns the (total, costars) of find_costars answered by the database with a single query
+'''
+def database_costars(actor_id, limit):
+  starts, costars = movies.alias('starts'), movies.alias('costars')
+  shared = func.count()
+  rows = db.session.execute(db.select([costars.c.actor_id, shared, func.count().over()])
+    .select_from(starts.join(costars, costars.c.movie_id == starts.c.movie_id))
+    .where(starts.c.actor_id == actor_id)
+    .where(costars.c.actor_id != actor_id)
+    .group_by(costars.c.actor_id)
+    .order_by(shared.desc(), costars.c.actor_id)
+    .limit(limit)).fetchall()
+  return (rows[0][2] if rows else 0), [(costar_id, count) for costar_id, count, _ in rows]
+
+'''
+GraphIndex
+Co-star graph of a process, built by a background thread and synced with the link changes before each query
+  a sync applies the changes to a copy of the graph and replaces it under the lock, the searches run on the
+  graph they got outside of it
+  missing holds the {seq: monotonic time} of the seqs below the last one read that were not in the log yet
+'''
+class GraphIndex:
+  def __init__(self, app):
+    self.app = app
+    self.lock = threading.RLock()
+    self.graph = None
+    self.seq = 0
+    self.missing = {}
+    self.built_at = None
+    self.builder = None
+
+  '''
+  build()
+      replaces the graph by a new one loaded from the movies table, with its own connection
+  '''
+  def build(self):
+    with self.app.app_context(), db.engine.connect() as connection:
+      seq = connection.execute(db.select([func.max(LinkChange.seq)])).scalar() or 0
+      # the changes of the writes not committed yet are not in the links either, they are read by the syncs
+      logged = {row.seq for row in connection.execute(db.select([LinkChange.seq])
+        .where(LinkChange.seq > seq - SYNC_GAP_WINDOW))}
+      now = time.monotonic()
+      missing = {gap: now for gap in range(max(seq - SYNC_GAP_WINDOW, 0) + 1, seq + 1) if gap not in logged}
+      links = connection.execution_options(stream_results=True).execute(
+        db.select([movies.c.actor_id, movies.c.movie_id]).order_by(movies.c.actor_id, movies.c.movie_id))
+      graph = CostarGraph(links)
+      # the older changes are dropped, a process that still needs them rebuilds its graph instead
+      prune_link_changes(connection)
+
+    with self.lock:
+      self.graph, self.seq, self.missing, self.built_at = graph, seq, missing, now
+
+  def start_build(self):
+    if self.builder is None or not self.builder.is_alive():
+      self.builder = threading.Thread(target=self.build, name='costar-graph', daemon=True)
+      self.builder.start()
+
+  '''
+  synced()
+      returns the graph with the link changes logged since the last sync applied, or None while it is built
+      to be called under the lock, the graph is rebuilt in the background once it is GRAPH_REBUILD_INTERVAL
+      old or holds more than GRAPH_OVERLAY_LIMIT changed links
+      the seqs missing below the last one read are read again until they show up or for SYNC_GAP_TIMEOUT
+  '''
+  def synced(self):
+    if self.graph is None:
+      self.start_build()
+      return None
+    if time.monotonic() - self.built_at > self.app.config['GRAPH_REBUILD_INTERVAL'] or \
+        self.graph.changes > self.app.config['GRAPH_OVERLAY_LIMIT']:
+      self.start_build()
+
+    now = time.monotonic()
+    self.missing = {seq: since for seq, since in self.missing.items() if now - since <= SYNC_GAP_TIMEOUT}
+    first, last = db.session.query(func.min(LinkChange.seq), func.max(LinkChange.seq)).one()
+    if (last is None or last <= self.seq) and not self.missing:
+      return self.graph
+
+    columns = (LinkChange.seq, LinkChange.kind, LinkChange.entity_id)
+    changes = db.session.query(*columns).filter(LinkChange.seq > self.seq).all()
+    missing = sorted(self.missing)
+    for start in range(0, len(missing), BULK_CHUNK_SIZE):
+      changes += db.session.query(*columns).filter(LinkChange.seq.in_(missing[start:start + BULK_CHUNK_SIZE]))
+    if (first is not None and first > self.seq + 1) or len(changes) > SYNC_LIMIT or \
+        any(kind == ALL_LINKS for _, kind, _ in changes):
+      self.graph = None
+      self.start_build()
+      return None
+
+    changed = {Actor: set(), Movie: set()}
+    for seq, kind, entity_id in changes:
+      self.missing.pop(seq, None)
+      for model in changed:
+        if kind == model.__tablename__:
+          changed[model].add(entity_id)
+    last = max(self.seq, last or 0)
+    read = {seq for seq, _, _ in changes}
+    self.missing.update((seq, now) for seq in range(self.seq + 1, last + 1) if seq not in read)
+    if changes:
+      self.graph = self.reload(self.graph.copy(), changed)
+    self.seq = last
+    return self.graph
+
+  '''
+  reload(graph, changed)
+      returns the graph with the rows of {model: ids} relinked to their links in the movies table, with a query
+      per BULK_CHUNK_SIZE ids
+  '''
+  def reload(self, graph, changed):
+    for model, ids in changed.items():
+      owner, related, _, _ = RELATIONS[model][next(iter(RELATIONS[model]))]
+      ids = sorted(ids)
+      for start in range(0, len(ids), BULK_CHUNK_SIZE):
+        linked = {row_id: set() for row_id in ids[start:start + BULK_CHUNK_SIZE]}
+        for row_id, related_id in db.session.execute(db.select([owner, related]).where(owner.in_(list(linked)))):
+          linked[row_id].add(related_id)
+        for row_id, related_ids in linked.items():
+          graph.relink(model, row_id, related_ids)
+    return graph
+
+# creates the GraphIndex of each app once
+graph_index_lock = threading.Lock()
+
+'''
+graph_index()
+    returns the co-star graph index of the current app
+'''
+def graph_index():
+  if 'costar_graph' not in current_app.extensions:
+    with graph_index_lock:
+      current_app.extensions.setdefault('costar_graph', GraphIndex(current_app._get_current_object()))
+  return current_app.extensions['costar_graph']
+
+'''
+find_costars(actor_id, limit)
+    returns (total, costars), the number of actors who played in a movie with the actor and up to limit
+    (actor_id, shared movies) of them, most shared movies first
+    answered by the co-star graph, or by the database while it is built or when GRAPH_INDEX_ENABLED is off
+'''
+def find_costars(actor_id, limit):
+  if current_app.config['GRAPH_INDEX_ENABLED']:
+    index = graph_index()
+    with index.lock:
+      graph = index.synced()
+    if graph is not None:
+      counts = graph.costars(actor_id)
+      return len(counts), heapq.nsmallest(limit, counts.items(), key=lambda item: (-item[1], item[0]))
+  return database_costars(actor_id, limit)
+
+'''
+find_path(source, target, max_depth)
+    returns the shortest_path (actors, movies) between two actors, or None when they are further apart
+    answered by the co-star graph, or by the database while it is built or when GRAPH_INDEX_ENABLED is off
+'''
+def find_path(source, target, max_depth):
+  if current_app.config['GRAPH_INDEX_ENABLED']:
+    index = graph_index()
+    with index.lock:
+      graph = index.synced()
+    if graph is not None:
+      return shortest_path(graph.expand, source, target, max_depth)
+  return shortest_path(database_expand, source, target, max_depth)
+
+'''
+labels(model, ids)
+    returns the {id: name} of the actors or {id: title} of the movies of the ids that exist
+'''
+def labels(model, ids):
+  field = getattr(model, LABELS[model])
+  return dict(db.session.query(model.id, field).filter(model.id.in_(list(ids))))
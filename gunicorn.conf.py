@@ -0,0 +1,19 @@
+import os
+import shutil
+import tempfile
+
+# the workers write their metrics to files in this directory and /metrics aggregates them
+# it is set, and emptied of the metrics of a previous run, before --preload imports the app
+directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir')
+if directory:
+  shutil.rmtree(directory, ignore_errors=True)
+  os.makedirs(directory)
+else:
+  directory = tempfile.mkdtemp(prefix='capstone-metrics-')
+# prometheus_client reads the lower case name before 0.10 and the upper case one since
+os.environ['prometheus_multiproc_dir'] = os.environ['PROMETHEUS_MULTIPROC_DIR'] = directory
+
+
+def child_exit(server, worker):
+  from prometheus_client import multiprocess
+  multiprocess.mark_process_dead(worker.pid)
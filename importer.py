@@ -0,0 +1,194 @@
+import io
+import csv
+import json
+import time
+from sqlalchemy import text
+
+from models import db, parse_int, parse_datetime, touch, rebuild_stats, log_link_changes, ALL_LINKS
+
+# staging table and typed columns of each kind of file
+STAGING = {
+  'actors': ('staging_actor', (('id', 'INTEGER'), ('name', 'TEXT'), ('age', 'INTEGER'), ('gender', 'TEXT'))),
+  'movies': ('staging_movie', (('id', 'INTEGER'), ('title', 'TEXT'), ('release_year', 'TIMESTAMP'))),
+  'links': ('staging_link', (('movie_id', 'INTEGER'), ('actor_id', 'INTEGER')))
+}
+
+'''
+MERGES
+SQL run after the staging tables are loaded
+  the last line of a duplicated id wins, links to unknown actors or movies are skipped
+'''
+MERGES = {
+  'actors': '''
+    INSERT INTO "Actor" (id, name, age, gender)
+    SELECT s.id, s.name, s.age, s.gender FROM staging_actor s
+    WHERE s.line = (SELECT max(d.line) FROM staging_actor d WHERE d.id = s.id)
+    ON CONFLICT (id) DO UPDATE SET name = excluded.name, age = excluded.age, gender = excluded.gender
+  ''',
+  'movies': '''
+    INSERT INTO "Movie" (id, title, release_year)
+    SELECT s.id, s.title, s.release_year FROM staging_movie s
+    WHERE s.line = (SELECT max(d.line) FROM staging_movie d WHERE d.id = s.id)
+    ON CONFLICT (id) DO UPDATE SET title = excluded.title, release_year = excluded.release_year
+  ''',
+  'links': '''
+    INSERT INTO movies (movie_id, actor_id)
+    SELECT DISTINCT s.movie_id, s.actor_id FROM staging_link s
+    WHERE EXISTS (SELECT 1 FROM "Movie" m WHERE m.id = s.movie_id)
+      AND EXISTS (SELECT 1 FROM "Actor" a WHERE a.id = s.actor_id)
+    ON CONFLICT (movie_id, actor_id) DO NOTHING
+  '''
+}
+
+UNRESOLVED_LINKS = '''
+  SELECT count(*) FROM staging_link s
+  WHERE NOT EXISTS (SELECT 1 FROM "Movie" m WHERE m.id = s.movie_id)
+    OR NOT EXISTS (SELECT 1 FROM "Actor" a WHERE a.id = s.actor_id)
+'''
+
+'''
+read_records(path)
+    yields the records of a CSV file with a header line, or of a NDJSON file (.ndjson, .jsonl)
+'''
+def read_records(path):
+  with open(path, newline='') as source:
+    if path.endswith(('.ndjson', '.jsonl')):
+      for line in source:
+        if line.strip():
+          yield json.loads(line)
+    else:
+      yield from csv.DictReader(source)
+
+'''
+parse_record(kind, record)
+    returns the tuple of the staging columns of a record, raises ValueError if it is invalid
+'''
+def parse_record(kind, record):
+  values = []
+  for column, column_type in STAGING[kind][1]:
+    value = record.get(column)
+    if column_type == 'INTEGER':
+      value = parse_int(value, column)
+    elif column_type == 'TIMESTAMP':
+      value = parse_datetime(value, column)
+    elif not isinstance(value, str) or not value:
+      raise ValueError(f'{column} is required.')
+    values.append(value)
+  return tuple(values)
+
+'''
+Importer
+Bulk loads actors, movies and their links into staging tables and merges them in a single transaction
+  PostgreSQL staging tables are loaded with COPY, other databases (SQLite) with executemany
+  progress(message) is called after every chunk with the rows and rows/sec loaded so far
+'''
+class Importer:
+  def __init__(self, connection, chunk_size=10000, progress=print):
+    self.connection = connection
+    self.chunk_size = chunk_size
+    self.progress = progress
+    self.copy = connection.dialect.name == 'postgresql'
+    self.stats = {}
+
+  def create_staging(self, kind):
+    table, columns = STAGING[kind]
+    definition = ', '.join(f'{column} {column_type} NOT NULL' for column, column_type in columns)
+    suffix = ' ON COMMIT DROP' if self.copy else ''
+    self.connection.execute(text(f'CREATE TEMP TABLE {table} (line INTEGER NOT NULL, {definition}){suffix}'))
+
+  def load_chunk(self, kind, rows):
+    table, columns = STAGING[kind]
+    names = ['line'] + [column for column, _ in columns]
+
+    if self.copy:
+      buffer = io.StringIO()
+      writer = csv.writer(buffer)
+      for row in rows:
+        writer.writerow(value.isoformat() if hasattr(value, 'isoformat') else value for value in row)
+      buffer.seek(0)
+      cursor = self.connection.connection.cursor()
+      cursor.copy_expert(f'COPY {table} ({", ".join(names)}) FROM STDIN WITH (FORMAT csv)', buffer)
+      cursor.close()
+    else:
+      placeholders = ', '.join(':' + name for name in names)
+      self.connection.execute(text(f'INSERT INTO {table} ({", ".join(names)}) VALUES ({placeholders})'),
+        [dict(zip(names, row)) for row in rows])
+
+  def stage(self, kind, path):
+    self.create_staging(kind)
+    stats = self.stats[kind] = {'read': 0, 'rejected': 0}
+    start = time.perf_counter()
+
+    rows = []
+    for line, record in enumerate(read_records(path), 1):
+      stats['read'] += 1
+      try:
+        rows.append((line,) + parse_record(kind, record))
+      except (ValueError, AttributeError):
+        stats['rejected'] += 1
+
+      if len(rows) >= self.chunk_size:
+        self.load_chunk(kind, rows)
+        rows = []
+        self.report(kind, start)
+
+    if rows:
+      self.load_chunk(kind, rows)
+    self.report(kind, start)
+
+    self.connection.execute(text(f'CREATE INDEX ix_{STAGING[kind][0]} ON {STAGING[kind][0]} '
+      f'({STAGING[kind][1][0][0]}, line)'))
+
+  def report(self, kind, start):
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    read = self.stats[kind]['read']
+    self.progress(f'{kind}: {read} rows staged, {read / elapsed:.0f} rows/sec')
+
+  def merge(self, kind):
+    if kind == 'links':
+      self.stats[kind]['unresolved'] = self.connection.execute(text(UNRESOLVED_LINKS)).scalar()
+    self.stats[kind]['merged'] = self.connection.execute(text(MERGES[kind])).rowcount
+
+  def reset_sequences(self):
+    if self.copy:
+      for table in ('Actor', 'Movie'):
+        self.connection.execute(text(
+          f'SELECT setval(pg_get_serial_sequence(\'"{table}"\', \'id\'), coalesce(max(id), 1)) FROM "{table}"'))
+
+  def drop_staging(self):
+    if not self.copy:
+      for kind in self.stats:
+        self.connection.execute(text(f'DROP TABLE {STAGING[kind][0]}'))
+
+'''
+import_catalog(actors=None, movies=None, links=None, chunk_size=10000, progress=print)
+    imports the actors (id,name,age,gender), movies (id,title,release_year) and links (movie_id,actor_id) files
+    existing ids are updated, everything is committed in a single transaction or not at all
+    returns the read, rejected, merged (and unresolved links) counters of each file
+'''
+def import_catalog(actors=None, movies=None, links=None, chunk_size=10000, progress=print):
+  files = [(kind, path) for kind, path in (('actors', actors), ('movies', movies), ('links', links)) if path]
+  start = time.perf_counter()
+
+  importer = Importer(db.session.connection(), chunk_size, progress)
+  try:
+    for kind, path in files:
+      importer.stage(kind, path)
+    for kind, _ in files:
+      importer.merge(kind)
+    importer.reset_sequences()
+    importer.drop_staging()
+    # the merges update existing rows in place, the stats are recomputed rather than adjusted and the co-star
+    # graphs are rebuilt
+    rebuild_stats()
+    log_link_changes(ALL_LINKS)
+    touch('Actor', 'Movie', 'movies')
+    db.session.commit()
+  except:
+    db.session.rollback()
+    raise
+
+  elapsed = time.perf_counter() - start
+  rows = sum(stats['read'] for stats in importer.stats.values())
+  progress(f'imported {rows} rows in {elapsed:.1f}s, {rows / max(elapsed, 1e-9):.0f} rows/sec')
+  return importer.stats
@@ -1,4 +1,4 @@
-from flask_script import Manager
+from flask_script import Manager, Command, Option
 from flask_migrate import Migrate, MigrateCommand
 
 from app import app
@@ -10,5 +10,70 @@ manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
 
+'''
+ImportCommand
+python manage.py import --actors actors.csv --movies movies.csv --links links.csv
+  bulk imports actors, movies and their links from CSV or NDJSON files, then prints the counters of each kind
+'''
+class ImportCommand(Command):
+  help = description = 'Bulk import actors, movies and their links from CSV or NDJSON files'
+
+  option_list = (
+    Option('--actors', help='file with id,name,age,gender columns'),
+    Option('--movies', help='file with id,title,release_year columns'),
+    Option('--links', help='file with movie_id,actor_id columns'),
+    Option('--chunk-size', dest='chunk_size', type=int, default=10000, help='rows sent to the database at a time')
+  )
+
+  def run(self, actors, movies, links, chunk_size):
+    from importer import import_catalog
+
+    stats = import_catalog(actors, movies, links, chunk_size)
+    for kind, counters in stats.items():
+      print(kind, ', '.join(f'{name}: {value}' for name, value in counters.items()))
+
+
+manager.add_command('import', ImportCommand())
+
+
+'''
+RebuildStatsCommand
+python manage.py rebuild-stats
+  recomputes the catalog stats of GET /stats from the actors, movies and links
+'''
+class RebuildStatsCommand(Command):
+  help = description = 'Recompute the catalog statistics of GET /stats from the actors, movies and links'
+
+  def run(self):
+    from models import rebuild_stats, stored_stats
+
+    rebuild_stats()
+    db.session.commit()
+    print(f'rebuilt {len(stored_stats())} catalog stats')
+
+'''
+CheckStatsCommand
+python manage.py check-stats
+  compares the catalog stats of GET /stats to a full recomputation, prints the differing buckets and exits with 1
+  if there are any
+'''
+class CheckStatsCommand(Command):
+  help = description = \
+    'Compare the catalog statistics of GET /stats to a full recomputation, exits with 1 if they differ'
+
+  def run(self):
+    from models import check_stats
+
+    differences = check_stats()
+    for (name, bucket), (stored, computed) in sorted(differences.items()):
+      print(f'{name} {bucket}: stored {stored}, computed {computed}')
+    print(f'{len(differences)} catalog stats differ')
+    return 1 if differences else 0
+
+
+manager.add_command('rebuild-stats', RebuildStatsCommand())
+manager.add_command('check-stats', CheckStatsCommand())
+
+
 if __name__ == '__main__':
     manager.run()
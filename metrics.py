@@ -0,0 +1,101 @@
+import os
+import time
+from contextlib import contextmanager
+from flask import request, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, generate_latest, \
+  CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+
+from queries import record_statement
+
+# the stages timed inside each request
+STAGES = ('auth', 'db', 'serialize')
+
+REQUEST_DURATION = Histogram('capstone_request_duration_seconds', 'Duration of the requests',
+  ['route', 'method'])
+STAGE_DURATION = Histogram('capstone_request_stage_duration_seconds', 'Time spent in each stage of the requests',
+  ['route', 'stage'])
+REQUESTS = Counter('capstone_requests_total', 'Requests served', ['route', 'method', 'status'])
+IN_FLIGHT = Gauge('capstone_requests_in_flight', 'Requests being served', ['route'], multiprocess_mode='livesum')
+
+'''
+multiprocess_dir()
+    returns the directory shared by the gunicorn workers to aggregate their metrics, None in a single process
+'''
+def multiprocess_dir():
+  return os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir')
+
+'''
+route()
+    returns the url rule of the request (i.e. '/actors/<int:actor_id>'), so the ids don't create new series
+'''
+def route():
+  return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+'''
+stage(name)
+    context manager (or decorator) adding the time spent inside it to the name stage of the current request
+    the SQL executed inside it is only counted in the db stage
+'''
+@contextmanager
+def stage(name):
+  stages = g.metrics_stages if has_request_context() and 'metrics_stages' in g else None
+  start = time.perf_counter()
+  db_start = stages['db'] if stages is not None else 0.0
+  try:
+    yield
+  finally:
+    if stages is not None:
+      stages[name] += time.perf_counter() - start - (stages['db'] - db_start)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  conn.info['metrics_start'] = time.perf_counter()
+
+# the only timing of the statements, also fed to the query recorders of queries.py
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  seconds = time.perf_counter() - conn.info.pop('metrics_start')
+  if has_request_context() and 'metrics_stages' in g:
+    g.metrics_stages['db'] += seconds
+  record_statement(statement, seconds)
+
+'''
+Metrics
+Records the duration, the auth, db and serialize stage timings and the status codes of every request per route
+  with gunicorn, the metrics of every worker are aggregated from prometheus_multiproc_dir (see gunicorn.conf.py)
+'''
+class Metrics:
+  def init_app(self, app):
+    app.before_request(self.before_request)
+    app.after_request(self.after_request)
+    app.teardown_request(self.teardown_request)
+
+  def before_request(self):
+    g.metrics_start = time.perf_counter()
+    g.metrics_stages = dict.fromkeys(STAGES, 0.0)
+    g.metrics_route = route()
+    IN_FLIGHT.labels(g.metrics_route).inc()
+
+  def after_request(self, response):
+    if 'metrics_start' in g:
+      REQUEST_DURATION.labels(g.metrics_route, request.method).observe(time.perf_counter() - g.metrics_start)
+      for name, seconds in g.metrics_stages.items():
+        STAGE_DURATION.labels(g.metrics_route, name).observe(seconds)
+      REQUESTS.labels(g.metrics_route, request.method, str(response.status_code)).inc()
+    return response
+
+  def teardown_request(self, error=None):
+    if 'metrics_route' in g:
+      IN_FLIGHT.labels(g.metrics_route).dec()
+
+  def exposition(self):
+    registry = REGISTRY
+    if multiprocess_dir():
+      registry = CollectorRegistry()
+      multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+metrics = Metrics()
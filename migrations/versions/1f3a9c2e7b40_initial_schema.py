@@ -0,0 +1,47 @@
+"""initial schema: Actor, Movie and the movies association
+
+Revision ID: 1f3a9c2e7b40
+Revises: 
+Create Date: 2026-10-18 19:20:12.804417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f3a9c2e7b40'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the tables as they were before the migrations, the later revisions add their indexes and cascades
+    op.create_table('Actor',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('age', sa.Integer(), nullable=False),
+        sa.Column('gender', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('Movie',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('release_year', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # named like PostgreSQL names them, 3002549f0959 replaces them by these names
+    op.create_table('movies',
+        sa.Column('movie_id', sa.Integer(), nullable=False),
+        sa.Column('actor_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['movie_id'], ['Movie.id'], name='movies_movie_id_fkey'),
+        sa.ForeignKeyConstraint(['actor_id'], ['Actor.id'], name='movies_actor_id_fkey'),
+        sa.PrimaryKeyConstraint('movie_id', 'actor_id')
+    )
+
+
+def downgrade():
+    op.drop_table('movies')
+    op.drop_table('Movie')
+    op.drop_table('Actor')
@@ -0,0 +1,44 @@
+"""cascade association deletes
+
+Revision ID: 3002549f0959
+Revises: f506fd5db506
+Create Date: 2026-10-18 15:12:47.208351
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3002549f0959'
+down_revision = 'f506fd5db506'
+branch_labels = None
+depends_on = None
+
+# constraint, column, referenced table
+FOREIGN_KEYS = [
+    ('movies_movie_id_fkey', 'movie_id', 'Movie'),
+    ('movies_actor_id_fkey', 'actor_id', 'Actor'),
+]
+
+
+def replace_foreign_keys(on_delete):
+    # NOT VALID swaps the constraints without scanning the table, the ACCESS EXCLUSIVE lock of DROP CONSTRAINT
+    # is only held until this transaction commits
+    for name, column, table in FOREIGN_KEYS:
+        op.execute(f'ALTER TABLE movies DROP CONSTRAINT {name}, '
+                   f'ADD CONSTRAINT {name} FOREIGN KEY ({column}) REFERENCES "{table}" (id){on_delete} NOT VALID')
+
+    # the transaction of the migrations is committed before the block, so the existing rows are checked by
+    # VALIDATE CONSTRAINT under its SHARE UPDATE EXCLUSIVE lock, which doesn't block the reads and writes
+    with op.get_context().autocommit_block():
+        for name, _, _ in FOREIGN_KEYS:
+            op.execute(f'ALTER TABLE movies VALIDATE CONSTRAINT {name}')
+
+
+def upgrade():
+    replace_foreign_keys(' ON DELETE CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys('')
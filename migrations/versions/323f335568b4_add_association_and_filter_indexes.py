@@ -0,0 +1,38 @@
+"""add association and filter indexes
+
+Revision ID: 323f335568b4
+Revises: b804995374a1
+Create Date: 2026-10-18 11:40:05.127391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '323f335568b4'
+down_revision = 'b804995374a1'
+branch_labels = None
+depends_on = None
+
+# name, table, columns
+INDEXES = [
+    ('ix_movies_actor_id_movie_id', 'movies', ['actor_id', 'movie_id']),
+    ('ix_actor_name_id', 'Actor', ['name', 'id']),
+    ('ix_actor_age_id', 'Actor', ['age', 'id']),
+    ('ix_actor_gender_age_id', 'Actor', ['gender', 'age', 'id']),
+    ('ix_movie_release_year_id', 'Movie', ['release_year', 'id']),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY doesn't lock the tables, but can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
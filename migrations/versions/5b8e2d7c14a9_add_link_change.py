@@ -0,0 +1,30 @@
+"""add link_change log of the co-star graphs
+
+Revision ID: 5b8e2d7c14a9
+Revises: 9c1d7e4f2a63
+Create Date: 2026-10-18 18:05:31.276114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e2d7c14a9'
+down_revision = '9c1d7e4f2a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # starts empty, the co-star graphs are built from the movies table and only read the changes made after
+    op.create_table('link_change',
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('seq')
+    )
+
+
+def downgrade():
+    op.drop_table('link_change')
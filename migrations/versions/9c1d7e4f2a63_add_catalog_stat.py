@@ -0,0 +1,37 @@
+"""add catalog_stat summary counters
+
+Revision ID: 9c1d7e4f2a63
+Revises: 3002549f0959
+Create Date: 2026-10-18 16:40:18.553902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1d7e4f2a63'
+down_revision = '3002549f0959'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('catalog_stat',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('bucket', sa.String(), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name', 'bucket')
+    )
+    # the counters of the existing catalog, the writes keep them up to date from now on
+    op.execute('''INSERT INTO catalog_stat (name, bucket, value)
+        SELECT 'actors', gender || ':' || (age / 10 * 10), count(*) FROM "Actor" GROUP BY gender, age / 10 * 10''')
+    op.execute('''INSERT INTO catalog_stat (name, bucket, value)
+        SELECT 'movies', CAST(CAST(extract(year FROM release_year) AS integer) AS varchar), count(*) FROM "Movie"
+        GROUP BY extract(year FROM release_year)''')
+    op.execute('''INSERT INTO catalog_stat (name, bucket, value)
+        SELECT 'links', '', count(*) FROM movies HAVING count(*) > 0''')
+
+
+def downgrade():
+    op.drop_table('catalog_stat')
@@ -0,0 +1,33 @@
+"""add table_version change counters
+
+Revision ID: b804995374a1
+Revises: 1f3a9c2e7b40
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b804995374a1'
+down_revision = '1f3a9c2e7b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_version = op.create_table('table_version',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table_version, [
+        {'name': 'Actor', 'version': 0},
+        {'name': 'Movie', 'version': 0},
+        {'name': 'movies', 'version': 0}
+    ])
+
+
+def downgrade():
+    op.drop_table('table_version')
@@ -0,0 +1,43 @@
+"""add search indexes
+
+Revision ID: f506fd5db506
+Revises: 323f335568b4
+Create Date: 2026-10-18 13:05:22.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f506fd5db506'
+down_revision = '323f335568b4'
+branch_labels = None
+depends_on = None
+
+# name, table, column
+INDEXES = [
+    ('ix_actor_name', 'Actor', 'name'),
+    ('ix_movie_title', 'Movie', 'title'),
+]
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # CREATE INDEX CONCURRENTLY doesn't lock the tables, but can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, column in INDEXES:
+            # prefix queries: lower(column) LIKE 'q%'
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}_prefix '
+                       f'ON "{table}" (lower({column}) text_pattern_ops)')
+            # fuzzy queries: column % 'q'
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}_trgm '
+                       f'ON "{table}" USING gin ({column} gin_trgm_ops)')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(INDEXES):
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}_trgm')
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}_prefix')
@@ -1,30 +1,157 @@
 import os
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, create_engine
+import sqlite3
+import datetime
+import itertools
+from collections import Counter
+from flask import current_app, has_app_context
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, create_engine, event, literal, text, func, \
+  extract
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, attributes
 from flask_sqlalchemy import SQLAlchemy
+from dateutil import parser as date_parser
 import json
 
+from metrics import stage
+
 # database_name = "capstone"
 # database_path = "postgresql://{}/{}".format(os.environ['DATABASE_URL'], database_name)
 
 db = SQLAlchemy()
 
+# rows per multi-row INSERT statement
+BULK_CHUNK_SIZE = 400
+
+# operations of the relations in the PATCH endpoints
+LINK_OPERATIONS = ('add', 'remove', 'replace')
+
+'''
+enable_sqlite_foreign_keys
+    SQLite only enforces the foreign keys, and so the cascades, when enabled on each connection
+'''
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  if isinstance(dbapi_connection, sqlite3.Connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys = ON')
+    cursor.close()
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    the missing tables are only created when DB_CREATE_ALL, otherwise no connection is opened
 '''
 def setup_db(app):
   # app.config["SQLALCHEMY_DATABASE_URI"] = database_path
   app.config.from_object('config')
   db.app = app
   db.init_app(app)
-  db.create_all()
+  if app.config['DB_CREATE_ALL']:
+    db.create_all()
+
+'''
+TableVersion
+Change counter of each table, bumped in the same transaction as every write
+  used to derive the ETags of the list endpoints without loading their rows
+'''
+class TableVersion(db.Model):
+  __tablename__ = 'table_version'
+  TABLES = ('Actor', 'Movie', 'movies')
+
+  name = Column(String, primary_key=True)
+  version = Column(Integer, nullable=False, default=0)
+
+@event.listens_for(TableVersion.__table__, 'after_create')
+def insert_table_versions(target, connection, **kw):
+  connection.execute(target.insert(), [{'name': table, 'version': 0} for table in TableVersion.TABLES])
+
+'''
+touch(*tables)
+    bumps the versions of the tables in the current transaction
+'''
+def touch(*tables):
+  db.session.execute(TableVersion.__table__.update()
+    .where(TableVersion.name.in_(tables))
+    .values(version=TableVersion.version + 1))
+
+'''
+table_versions(tables)
+    returns the tuple of the current versions of the tables with a single query
+'''
+def table_versions(tables):
+  versions = dict(db.session.query(TableVersion.name, TableVersion.version)
+    .filter(TableVersion.name.in_(tables)))
+  return tuple(versions.get(table, 0) for table in tables)
+
+'''
+CatalogStat
+Summary counters of the catalog served by GET /stats, changed in the same transaction as every write
+  ('actors', 'F:20') counts the actors of a gender in an age band (20 to 29), ('movies', '1995') the movies
+  released in a year and ('links', '') the links between actors and movies
+'''
+class CatalogStat(db.Model):
+  __tablename__ = 'catalog_stat'
+
+  name = Column(String, primary_key=True)
+  bucket = Column(String, primary_key=True)
+  value = Column(Integer, nullable=False, default=0)
+
+'''
+LinkChange
+Log of the actors and movies whose links changed, written in the same transaction as every write
+  ('Actor', 12) means the links of actor 12 changed, (ALL_LINKS, None) that all of them may have (i.e. an import)
+  the co-star graph of each process reloads the links of the rows logged after its last sync (graph.py)
+'''
+class LinkChange(db.Model):
+  __tablename__ = 'link_change'
+
+  seq = Column(Integer, primary_key=True)
+  kind = Column(String, nullable=False)
+  entity_id = Column(Integer)
+
+# kind of the link changes that invalidate every link
+ALL_LINKS = '*'
+# link changes kept in the log, a co-star graph that lags further behind rebuilds itself
+CHANGE_RETENTION = 100000
+# calls of log_link_changes by a process between two prunings of the log
+CHANGE_PRUNE_INTERVAL = 100
+
+_link_change_logs = itertools.count()
+
+'''
+log_link_changes(kind, ids=(None,), session=None)
+    logs the links of the ids rows of the kind table ('Actor' or 'Movie') as changed, with a single statement
+    nothing is logged when GRAPH_INDEX_ENABLED is off, as no co-star graph reads the log
+    every CHANGE_PRUNE_INTERVAL calls the log is pruned to its last CHANGE_RETENTION changes
+'''
+def log_link_changes(kind, ids=(None,), session=None):
+  if has_app_context() and not current_app.config.get('GRAPH_INDEX_ENABLED', True):
+    return
+  rows = [{'kind': kind, 'entity_id': row_id} for row_id in ids]
+  if rows:
+    session = session or db.session
+    session.execute(LinkChange.__table__.insert(), rows)
+    if next(_link_change_logs) % CHANGE_PRUNE_INTERVAL == 0:
+      prune_link_changes(session)
+
+'''
+prune_link_changes(bind=None, retention=CHANGE_RETENTION)
+    deletes the link changes older than the last retention ones, with the session or connection bind
+'''
+def prune_link_changes(bind=None, retention=CHANGE_RETENTION):
+  last = db.select([func.max(LinkChange.seq)]).as_scalar()
+  (bind or db.session).execute(LinkChange.__table__.delete().where(LinkChange.seq <= last - retention))
 
 '''
 Movies and Actors table relationship
+  the links of a deleted actor or movie are deleted by the database (ON DELETE CASCADE), without loading them
 '''
 movies = db.Table('movies',
-  db.Column('movie_id', Integer, ForeignKey('Movie.id'), primary_key=True),
-  db.Column('actor_id', Integer, ForeignKey('Actor.id'), primary_key=True)
+  db.Column('movie_id', Integer, ForeignKey('Movie.id', ondelete='CASCADE'), primary_key=True),
+  db.Column('actor_id', Integer, ForeignKey('Actor.id', ondelete='CASCADE'), primary_key=True),
+  # the primary key serves the lookups by movie, this one the lookups by actor
+  db.Index('ix_movies_actor_id_movie_id', 'actor_id', 'movie_id')
 )
 
 '''
@@ -33,12 +160,20 @@ Entity for persons that acts in movies
 '''
 class Actor(db.Model):  
   __tablename__ = 'Actor'
+  # the search indexes need the pg_trgm extension and are only created by migration f506fd5db506
+  __table_args__ = (
+    db.Index('ix_actor_name_id', 'name', 'id'),
+    db.Index('ix_actor_age_id', 'age', 'id'),
+    db.Index('ix_actor_gender_age_id', 'gender', 'age', 'id')
+  )
+  FIELDS = ('id', 'name', 'age', 'gender')
 
   id = Column(Integer, primary_key=True)
   name = Column(String, nullable=False)
   age = Column(Integer, nullable=False)
   gender = Column(String, nullable=False)
-  movies = db.relationship('Movie', secondary=movies, backref=db.backref('actors'), lazy=True)
+  movies = db.relationship('Movie', secondary=movies, backref=db.backref('actors', passive_deletes=True), lazy=True,
+    passive_deletes=True)
 
   def __init__(self, name, age, gender, movie=[]):
     self.name = name
@@ -46,6 +181,25 @@ class Actor(db.Model):
     self.gender = gender
     self.movies = movie 
 
+  '''
+  parse(record)
+      returns the column values of an actor in the request format
+      raises ValueError if the record is invalid
+  '''
+  @staticmethod
+  def parse(record):
+    if not isinstance(record, dict):
+      raise ValueError('Actor must be an object.')
+
+    name = record.get('name')
+    gender = record.get('gender')
+    if not isinstance(name, str) or not name:
+      raise ValueError('Actor name is required.')
+    if not isinstance(gender, str) or not gender:
+      raise ValueError('Actor gender is required.')
+    return {'name': name, 'age': parse_int(record.get('age'), 'Actor age'), 'gender': gender}
+
+  @stage('serialize')
   def format(self):
     movies_data = [movie.title for movie in self.movies]
     return {
@@ -57,14 +211,17 @@ class Actor(db.Model):
 
   def insert(self):
     db.session.add(self)
+    touch('Actor', 'movies')
     db.session.commit()
   
   def update(self):
+    touch('Actor', 'movies')
     db.session.commit()
 
   def delete(self):
     # myparent.children.remove(somechild)
     db.session.delete(self)
+    touch('Actor', 'movies')
     db.session.commit()
 
 '''
@@ -73,6 +230,10 @@ Entity with title and release year
 '''
 class Movie(db.Model):  
   __tablename__ = 'Movie'
+  __table_args__ = (
+    db.Index('ix_movie_release_year_id', 'release_year', 'id'),
+  )
+  FIELDS = ('id', 'title', 'release_year')
 
   id = Column(Integer, primary_key=True)
   title = Column(String, nullable=False)
@@ -83,6 +244,22 @@ class Movie(db.Model):
     self.release_year = release_year
     self.actors = actors
 
+  '''
+  parse(record)
+      returns the column values of a movie in the request format
+      raises ValueError if the record is invalid
+  '''
+  @staticmethod
+  def parse(record):
+    if not isinstance(record, dict):
+      raise ValueError('Movie must be an object.')
+
+    title = record.get('title')
+    if not isinstance(title, str) or not title:
+      raise ValueError('Movie title is required.')
+    return {'title': title, 'release_year': parse_datetime(record.get('release_year'), 'Movie release_year')}
+
+  @stage('serialize')
   def format(self):
     actors_data = [actor.name for actor in self.actors]
     return {
@@ -93,11 +270,491 @@ class Movie(db.Model):
 
   def insert(self):
     db.session.add(self)
+    touch('Movie', 'movies')
     db.session.commit()
   
   def update(self):
+    touch('Movie', 'movies')
     db.session.commit()
 
   def delete(self):
     db.session.delete(self)
+    touch('Movie', 'movies')
     db.session.commit()
+
+'''
+Relations that can be expanded in the list endpoints
+  maps each relation to (owner column, related column, related model, related field) over the movies table
+'''
+RELATIONS = {
+  Actor: {'movies': (movies.c.actor_id, movies.c.movie_id, Movie, 'title')},
+  Movie: {'actors': (movies.c.movie_id, movies.c.actor_id, Actor, 'name')}
+}
+
+'''
+select_fields(model, fields)
+    returns a column only query of the given fields, the id is always selected
+'''
+def select_fields(model, fields):
+  columns = [model.id] + [getattr(model, field) for field in dict.fromkeys(fields) if field != 'id']
+  return db.session.query(*columns)
+
+'''
+load_related(model, relation, ids)
+    loads the related titles/names of the ids rows with a single query
+    returns a dictionary {id: [related values]}
+'''
+def load_related(model, relation, ids):
+  owner, related, target, field = RELATIONS[model][relation]
+  related_data = {row_id: [] for row_id in ids}
+  if not ids:
+    return related_data
+
+  rows = db.session.query(owner, getattr(target, field)) \
+    .join(target, target.id == related) \
+    .filter(owner.in_(ids)) \
+    .order_by(owner, target.id)
+
+  for row_id, value in rows:
+    related_data[row_id].append(value)
+  return related_data
+
+'''
+format_rows(model, rows, fields, include)
+    builds the formatted dictionaries of rows returned by select_fields without instantiating the model
+    with the given fields and the included relations
+'''
+def format_rows(model, rows, fields, include):
+  ids = [row.id for row in rows]
+  related_data = {relation: load_related(model, relation, ids) for relation in include}
+
+  formatted = []
+  with stage('serialize'):
+    for row in rows:
+      data = {field: getattr(row, field) for field in fields}
+      for relation in include:
+        data[relation] = related_data[relation][row.id]
+      formatted.append(data)
+  return formatted
+
+'''
+export_chunks(model, after=None, chunk_size=1000)
+    yields lists of at most chunk_size formatted rows with an id greater than after, ordered by id
+    the rows are read from a server side cursor and their relations are loaded once per chunk
+'''
+def export_chunks(model, after=None, chunk_size=1000):
+  relations = tuple(RELATIONS[model])
+  query = select_fields(model, model.FIELDS).order_by(model.id)
+  if after is not None:
+    query = query.filter(model.id > after)
+
+  connection = db.engine.connect().execution_options(stream_results=True)
+  try:
+    result = connection.execute(query.statement)
+    while True:
+      rows = result.fetchmany(chunk_size)
+      if not rows:
+        break
+      yield format_rows(model, rows, model.FIELDS, relations)
+  finally:
+    connection.close()
+
+'''
+parse_int(value, name)
+    returns value as an integer, raises ValueError if it is not one
+'''
+def parse_int(value, name):
+  if isinstance(value, bool):
+    raise ValueError(f'{name} must be an integer.')
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    raise ValueError(f'{name} must be an integer.')
+
+'''
+parse_datetime(value, name)
+    returns a naive UTC datetime from an ISO 8601 or RFC 1123 (as returned by the API) string
+    raises ValueError if it is not a date
+'''
+def parse_datetime(value, name):
+  if isinstance(value, datetime.datetime):
+    parsed = value
+  else:
+    try:
+      parsed = date_parser.parse(value)
+    except (TypeError, ValueError, OverflowError):
+      raise ValueError(f'{name} must be a date.')
+
+  if parsed.tzinfo is not None:
+    parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+  return parsed
+
+'''
+parse_ids(value, name)
+    returns the list of distinct ids of a relation in the request format, None meaning no ids
+    raises ValueError if it is not a list of integers
+'''
+def parse_ids(value, name):
+  if value is None:
+    return []
+  if not isinstance(value, list):
+    raise ValueError(f'{name} must be a list of ids.')
+  return list(dict.fromkeys(parse_int(item, name) for item in value))
+
+'''
+existing_ids(model, ids)
+    returns the set of ids that exist in the model table, with one query per chunk of ids
+'''
+def existing_ids(model, ids):
+  ids = list(ids)
+  found = set()
+  for start in range(0, len(ids), BULK_CHUNK_SIZE):
+    chunk = ids[start:start + BULK_CHUNK_SIZE]
+    found.update(row_id for row_id, in db.session.query(model.id).filter(model.id.in_(chunk)))
+  return found
+
+'''
+insert_rows(table, rows)
+    inserts rows with multi-row INSERT ... RETURNING statements and returns their ids in order
+    SQLite can't return the ids of a multi-row INSERT, so rows are inserted one by one there
+'''
+def insert_rows(table, rows):
+  if db.engine.dialect.name != 'postgresql':
+    return [db.session.execute(table.insert().values(row)).inserted_primary_key[0] for row in rows]
+
+  ids = []
+  for start in range(0, len(rows), BULK_CHUNK_SIZE):
+    result = db.session.execute(table.insert().values(rows[start:start + BULK_CHUNK_SIZE]).returning(table.c.id))
+    ids.extend(row_id for row_id, in result)
+  return ids
+
+'''
+insert_links(links)
+    inserts (movie_id, actor_id) rows in the movies table with multi-row INSERT statements
+'''
+def insert_links(links):
+  for start in range(0, len(links), BULK_CHUNK_SIZE):
+    db.session.execute(movies.insert().values([
+      {'movie_id': movie_id, 'actor_id': actor_id} for movie_id, actor_id in links[start:start + BULK_CHUNK_SIZE]
+    ]))
+
+'''
+bulk_insert(model, records)
+    validates records in the request format (i.e. {'name': ..., 'movies': [1, 2]}) and inserts
+    the valid ones and their links with multi-row statements in a single transaction
+    returns (created, errors) where created is a list of (index, id) and errors a list of (index, message)
+'''
+def bulk_insert(model, records):
+  relation = next(iter(RELATIONS[model]))
+  owner, related, target, _ = RELATIONS[model][relation]
+
+  parsed = []
+  errors = []
+  for index, record in enumerate(records):
+    try:
+      values = model.parse(record)
+      related_ids = parse_ids(record.get(relation), relation.capitalize())
+    except ValueError as e:
+      errors.append((index, str(e)))
+      continue
+    parsed.append((index, values, related_ids))
+
+  # one validation pass over all the referenced ids
+  known_ids = existing_ids(target, {related_id for _, _, related_ids in parsed for related_id in related_ids})
+
+  valid = []
+  for index, values, related_ids in parsed:
+    unknown_ids = [related_id for related_id in related_ids if related_id not in known_ids]
+    if unknown_ids:
+      errors.append((index, 'Unknown {} ids: {}.'.format(relation, unknown_ids)))
+    else:
+      valid.append((index, values, related_ids))
+
+  if not valid:
+    return [], sorted(errors)
+
+  ids = insert_rows(model.__table__, [values for _, values, _ in valid])
+
+  links = []
+  for row_id, (_, _, related_ids) in zip(ids, valid):
+    for related_id in related_ids:
+      links.append((row_id, related_id) if owner is movies.c.movie_id else (related_id, row_id))
+  insert_links(links)
+  log_link_changes(model.__tablename__, [row_id for row_id, (_, _, related_ids) in zip(ids, valid) if related_ids])
+
+  deltas = Counter(stat_key(model, [values[column] for column in STAT_COLUMNS[model]]) for _, values, _ in valid)
+  deltas[('links', '')] += len(links)
+  count_stats(deltas)
+  touch(model.__tablename__, 'movies')
+  db.session.commit()
+
+  return [(index, row_id) for row_id, (index, _, _) in zip(ids, valid)], sorted(errors)
+
+'''
+parse_link_operations(value, name)
+    returns the {operation: ids} of a relation in the PATCH format, either a list of ids to add (i.e. [1, 2])
+    or an object with 'add' and 'remove' lists or a single 'replace' list (i.e. {'add': [3], 'remove': [1]})
+    raises ValueError if it is invalid
+'''
+def parse_link_operations(value, name):
+  if isinstance(value, list):
+    return {'add': parse_ids(value, name)}
+  if not isinstance(value, dict) or not value or not set(value) <= set(LINK_OPERATIONS):
+    raise ValueError(f'{name} must be a list of ids or an object with add, remove or replace lists.')
+  if 'replace' in value and len(value) > 1:
+    raise ValueError(f'{name} replace can not be combined with add or remove.')
+
+  operations = {operation: parse_ids(ids, name) for operation, ids in value.items()}
+  if set(operations.get('add', ())) & set(operations.get('remove', ())):
+    raise ValueError(f'{name} can not be added and removed at once.')
+  return operations
+
+'''
+insert_ignore(table)
+    returns an INSERT statement of the table that skips the rows already present instead of failing
+'''
+def insert_ignore(table):
+  if db.engine.dialect.name == 'postgresql':
+    return postgresql.insert(table).on_conflict_do_nothing()
+  return table.insert().prefix_with('OR IGNORE')
+
+'''
+update_links(model, row_id, operations)
+    applies the operations of parse_link_operations to the links of a model row with at most one DELETE and
+    one INSERT ... SELECT on the movies table, the links already present and the unknown ids are skipped
+    neither side of the relation is loaded, the row is logged as a link change when its links changed,
+    the caller commits
+'''
+def update_links(model, row_id, operations):
+  relation = next(iter(RELATIONS[model]))
+  owner, related, target, _ = RELATIONS[model][relation]
+
+  unlinked = linked = 0
+  removed = movies.delete().where(owner == row_id)
+  if 'replace' in operations:
+    added = operations['replace']
+    if added:
+      removed = removed.where(~related.in_(added))
+    unlinked = db.session.execute(removed).rowcount
+  else:
+    added = operations.get('add', [])
+    if operations.get('remove'):
+      unlinked = db.session.execute(removed.where(related.in_(operations['remove']))).rowcount
+
+  if added:
+    linked = db.session.execute(insert_ignore(movies).from_select([owner.name, related.name],
+      db.select([literal(row_id), target.id]).where(target.id.in_(added)))).rowcount
+  count_stats({('links', ''): linked - unlinked})
+  if linked or unlinked:
+    log_link_changes(model.__tablename__, [row_id])
+
+'''
+delete_rows(model, ids)
+    deletes the rows of the ids that exist, their links go with them by ON DELETE CASCADE
+    returns the deleted ids, the rows and their links are counted out of the catalog stats first
+'''
+def delete_rows(model, ids):
+  table = model.__table__
+  deleted = []
+  deltas = Counter()
+  for start in range(0, len(ids), BULK_CHUNK_SIZE):
+    chunk = ids[start:start + BULK_CHUNK_SIZE]
+    found, chunk_deltas = row_stats(model, chunk)
+    if found:
+      db.session.execute(table.delete().where(table.c.id.in_(found)))
+      deleted.extend(row_id for row_id in chunk if row_id in found)
+      deltas.update(chunk_deltas)
+
+  if deleted:
+    count_stats(deltas)
+    log_link_changes(model.__tablename__, deleted)
+    touch(model.__tablename__, 'movies')
+  db.session.commit()
+  return deleted
+
+# the catalog stat counters changed by an actor or a movie row, from its column values
+STAT_COLUMNS = {
+  Actor: ('age', 'gender'),
+  Movie: ('release_year',)
+}
+
+# adds the deltas to the counters, the new buckets are created at 0 first
+UPSERT_STAT = text('INSERT INTO catalog_stat (name, bucket, value) VALUES (:name, :bucket, :value) '
+  'ON CONFLICT (name, bucket) DO UPDATE SET value = catalog_stat.value + excluded.value')
+
+'''
+stat_key(model, values)
+    returns the (name, bucket) catalog stat counting a row of the model with the STAT_COLUMNS values
+'''
+def stat_key(model, values):
+  if model is Actor:
+    age, gender = values
+    return ('actors', '{}:{}'.format(gender, parse_int(age, 'Actor age') // 10 * 10))
+  release_year, = values
+  return ('movies', str(parse_datetime(release_year, 'Movie release_year').year))
+
+'''
+count_stats(deltas, session=None)
+    adds the {(name, bucket): delta} counts to the catalog stats with a single statement, in the current
+    transaction, the buckets are sorted so concurrent writes lock their rows in the same order
+'''
+def count_stats(deltas, session=None):
+  rows = [{'name': name, 'bucket': bucket, 'value': delta} for (name, bucket), delta in sorted(deltas.items()) if delta]
+  if rows:
+    (session or db.session).execute(UPSERT_STAT, rows)
+
+'''
+row_stats(model, ids, session=None)
+    returns (found, deltas) where found is the set of the ids that exist and deltas the {(name, bucket): -count}
+    of deleting them and their links, with two queries
+    the rows are locked (FOR UPDATE on PostgreSQL), so a concurrent delete of the same ids waits
+'''
+def row_stats(model, ids, session=None):
+  session = session or db.session
+  owner, _, _, _ = RELATIONS[model][next(iter(RELATIONS[model]))]
+  columns = [model.id] + [getattr(model, column) for column in STAT_COLUMNS[model]]
+
+  found = set()
+  deltas = Counter()
+  for row_id, *values in session.execute(db.select(columns).where(model.id.in_(ids)).with_for_update()):
+    found.add(row_id)
+    deltas[stat_key(model, values)] -= 1
+  if found:
+    deltas[('links', '')] -= session.execute(
+      db.select([func.count()]).select_from(movies).where(owner.in_(found))).scalar()
+  return found, deltas
+
+@event.listens_for(Session, 'before_flush')
+def count_session_stats(session, flush_context, instances):
+  # the ORM writes (i.e. PATCH /actors/<id>, Actor.insert()), the bulk statements count their own changes
+  deltas = Counter()
+
+  def committed(obj):
+    values = []
+    for column in STAT_COLUMNS[type(obj)]:
+      history = attributes.get_history(obj, column)
+      values.append((history.deleted or history.unchanged or [getattr(obj, column)])[0])
+    return stat_key(type(obj), values)
+
+  def current(obj):
+    return stat_key(type(obj), [getattr(obj, column) for column in STAT_COLUMNS[type(obj)]])
+
+  added, removed = set(), set()
+  for obj in session.new:
+    if type(obj) in STAT_COLUMNS:
+      deltas[current(obj)] += 1
+  for obj in session.dirty:
+    if type(obj) in STAT_COLUMNS and obj not in session.deleted and session.is_modified(obj):
+      deltas[committed(obj)] -= 1
+      deltas[current(obj)] += 1
+  for obj in list(session.new) + list(session.dirty):
+    # both sides of a link change can be in the history, the pairs count it once
+    # the collections that are not loaded are not loaded for it, their side is in the other one's history
+    if type(obj) is Actor:
+      history = attributes.get_history(obj, 'movies', attributes.PASSIVE_NO_INITIALIZE)
+      added.update((id(movie), id(obj)) for movie in history.added or ())
+      removed.update((id(movie), id(obj)) for movie in history.deleted or ())
+    elif type(obj) is Movie:
+      history = attributes.get_history(obj, 'actors', attributes.PASSIVE_NO_INITIALIZE)
+      added.update((id(obj), id(actor)) for actor in history.added or ())
+      removed.update((id(obj), id(actor)) for actor in history.deleted or ())
+  deltas[('links', '')] += len(added) - len(removed)
+
+  for model in STAT_COLUMNS:
+    ids = [obj.id for obj in session.deleted if type(obj) is model]
+    if ids:
+      deltas.update(row_stats(model, ids, session)[1])
+  count_stats(deltas, session)
+
+@event.listens_for(Session, 'after_flush')
+def log_session_link_changes(session, flush_context):
+  # the ids of the new rows are only known after the flush, the histories are still the flushed ones
+  changed = {Actor: set(), Movie: set()}
+  for obj in list(session.new) + list(session.dirty):
+    if type(obj) in changed:
+      relation = 'movies' if type(obj) is Actor else 'actors'
+      history = attributes.get_history(obj, relation, attributes.PASSIVE_NO_INITIALIZE)
+      if history.added or history.deleted:
+        changed[type(obj)].add(obj.id)
+  for obj in session.deleted:
+    if type(obj) in changed:
+      changed[type(obj)].add(obj.id)
+  for model, ids in changed.items():
+    log_link_changes(model.__tablename__, sorted(ids), session)
+
+'''
+compute_stats()
+    returns the {(name, bucket): count} catalog stats computed from the Actor, Movie and movies tables
+'''
+def compute_stats():
+  counts = {}
+  band = Actor.age / 10 * 10
+  for gender, age_band, count in db.session.query(Actor.gender, band, func.count()).group_by(Actor.gender, band):
+    counts[('actors', f'{gender}:{int(age_band)}')] = count
+  year = extract('year', Movie.release_year)
+  for release_year, count in db.session.query(year, func.count()).group_by(year):
+    counts[('movies', str(int(release_year)))] = count
+  links = db.session.query(func.count()).select_from(movies).scalar()
+  if links:
+    counts[('links', '')] = links
+  return counts
+
+'''
+stored_stats()
+    returns the {(name, bucket): count} catalog stats of the summary table, without the empty buckets
+'''
+def stored_stats():
+  return {(name, bucket): value for name, bucket, value
+    in db.session.query(CatalogStat.name, CatalogStat.bucket, CatalogStat.value) if value}
+
+'''
+rebuild_stats()
+    replaces the catalog stats by a full recomputation, in the current transaction
+    on PostgreSQL the table is locked first, so the writes in progress are counted once
+'''
+def rebuild_stats():
+  if db.engine.dialect.name == 'postgresql':
+    db.session.execute('LOCK TABLE catalog_stat IN EXCLUSIVE MODE')
+  db.session.execute(CatalogStat.__table__.delete())
+  count_stats(compute_stats())
+
+'''
+check_stats()
+    compares the catalog stats to a full recomputation from a single snapshot
+    returns the {(name, bucket): (stored, computed)} of the buckets that differ
+'''
+def check_stats():
+  if db.engine.dialect.name == 'postgresql':
+    db.session.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+  stored, computed = stored_stats(), compute_stats()
+  db.session.rollback()
+  return {key: (stored.get(key, 0), computed.get(key, 0)) for key in set(stored) | set(computed)
+    if stored.get(key, 0) != computed.get(key, 0)}
+
+'''
+catalog_stats()
+    returns the GET /stats summary of the catalog, read from the catalog stats with a single query
+'''
+def catalog_stats():
+  stats = stored_stats()
+  actors = []
+  for (name, bucket), count in stats.items():
+    if name == 'actors':
+      gender, age_band = bucket.rsplit(':', 1)
+      actors.append({'gender': gender, 'age_min': int(age_band), 'age_max': int(age_band) + 9, 'count': count})
+  movies_by_year = [{'release_year': int(bucket), 'count': count}
+    for (name, bucket), count in stats.items() if name == 'movies']
+  total_movies = sum(item['count'] for item in movies_by_year)
+
+  return {
+    'actors': {
+      'total': sum(item['count'] for item in actors),
+      'by_gender_and_age': sorted(actors, key=lambda item: (item['gender'], item['age_min']))
+    },
+    'movies': {
+      'total': total_movies,
+      'by_release_year': sorted(movies_by_year, key=lambda item: item['release_year'])
+    },
+    'links': stats.get(('links', ''), 0),
+    'average_cast_size': stats.get(('links', ''), 0) / total_movies if total_movies else 0.0
+  }
@@ -0,0 +1,85 @@
+import json
+import datetime
+import base64
+from flask import request, abort, current_app
+
+'''
+encode_cursor(last_id, sort='id', value=None) method
+  @INPUTS
+    last_id: id of the last row of the page
+    sort: sort key of the page (i.e. '-age')
+    value: sort key value of the last row, for the other sort keys than id
+  returns an opaque, url safe cursor pointing right after last_id
+'''
+def encode_cursor(last_id, sort='id', value=None):
+  data = {'id': last_id}
+  if sort != 'id':
+    data['sort'] = sort
+  if sort.lstrip('-') != 'id':
+    data['value'] = value.isoformat() if isinstance(value, datetime.datetime) else value
+  data = json.dumps(data, separators=(',', ':')).encode('utf-8')
+  return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+'''
+decode_cursor(cursor, sort='id') method
+  @INPUTS
+    cursor: a cursor created by encode_cursor
+    sort: sort key of the requested page
+  it should respond with a 400 error if the cursor is malformed or was created for another sort key
+  returns the id the cursor points after, or the (value, id) position for the other sort keys than id
+'''
+def decode_cursor(cursor, sort='id'):
+  try:
+    data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    data = json.loads(data.decode('utf-8'))
+    last_id = data['id']
+    cursor_sort = data.get('sort', 'id')
+  except Exception:
+    abort(400)
+
+  if not isinstance(last_id, int) or cursor_sort != sort:
+    abort(400)
+  if sort.lstrip('-') == 'id':
+    return last_id
+  if 'value' not in data:
+    abort(400)
+  return data['value'], last_id
+
+'''
+page_params(sort='id') method
+  @INPUTS
+    sort: sort key of the requested page
+  it should read the limit, after (an id, only when sorting by id) and cursor (a next_cursor) query parameters
+  it should respond with a 400 error if they are invalid
+  limit defaults to PAGE_SIZE and is capped to MAX_PAGE_SIZE
+  returns the tuple (limit, after) where after is None for the first page
+'''
+def page_params(sort='id'):
+  limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+  if limit is None or limit < 1:
+    abort(400)
+  limit = min(limit, current_app.config['MAX_PAGE_SIZE'])
+
+  after = None
+  if 'cursor' in request.args:
+    after = decode_cursor(request.args['cursor'], sort)
+  elif 'after' in request.args:
+    after = request.args.get('after', type=int)
+    if after is None or sort.lstrip('-') != 'id':
+      abort(400)
+
+  return limit, after
+
+'''
+split_page(rows, limit, sort='id') method
+  @INPUTS
+    rows: up to limit + 1 rows ordered by the sort key
+    limit: page size
+    sort: sort key of the rows, they must have its field
+  returns the tuple (page, next_cursor) where next_cursor is None on the last page
+'''
+def split_page(rows, limit, sort='id'):
+  if len(rows) > limit:
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].id, sort, getattr(rows[-1], sort.lstrip('-')))
+  return rows, None
@@ -0,0 +1,69 @@
+import time
+import bisect
+import threading
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+# upper bounds, in seconds, of the checkout wait time histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+'''
+TimedQueuePool
+QueuePool that records how long the checkouts wait for a connection and how many of them time out
+  the wait includes opening a new connection when the pool or its overflow grows
+'''
+class TimedQueuePool(QueuePool):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.wait_counts = [0] * (len(WAIT_BUCKETS) + 1)
+    self.wait_sum = 0.0
+    self.timeouts = 0
+    self._stats_lock = threading.Lock()
+
+  def _do_get(self):
+    start = time.perf_counter()
+    try:
+      return super()._do_get()
+    except exc.TimeoutError:
+      with self._stats_lock:
+        self.timeouts += 1
+      raise
+    finally:
+      self.record_wait(time.perf_counter() - start)
+
+  def record_wait(self, seconds):
+    with self._stats_lock:
+      self.wait_counts[bisect.bisect_left(WAIT_BUCKETS, seconds)] += 1
+      self.wait_sum += seconds
+
+  def wait_histogram(self):
+    with self._stats_lock:
+      counts, wait_sum = list(self.wait_counts), self.wait_sum
+
+    buckets, total = {}, 0
+    for bound, count in zip(WAIT_BUCKETS + ('+Inf',), counts):
+      total += count
+      buckets[str(bound)] = total
+    return {'buckets': buckets, 'count': total, 'sum': wait_sum}
+
+'''
+pool_stats(pool)
+    returns the live statistics of an engine pool
+    the sizes are only known for a QueuePool, the wait histogram for a TimedQueuePool
+'''
+def pool_stats(pool):
+  stats = {'class': type(pool).__name__}
+  if isinstance(pool, QueuePool):
+    stats.update({
+      'size': pool.size(),
+      'checked_in': pool.checkedin(),
+      'checked_out': pool.checkedout(),
+      # the overflow counter starts at -size while the pool is not full
+      'overflow': max(pool.overflow(), 0),
+      'max_overflow': pool._max_overflow,
+      'timeout': pool.timeout()
+    })
+  if isinstance(pool, TimedQueuePool):
+    stats['timeouts'] = pool.timeouts
+    stats['wait'] = pool.wait_histogram()
+  return stats
@@ -0,0 +1,121 @@
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, request, current_app
+
+# literals, bound parameters, IN lists and multi-row VALUES are folded so one SQL shape has one fingerprint
+FINGERPRINT_RULES = (
+  (re.compile(r"'(?:[^']|'')*'"), '?'),
+  (re.compile(r'%\(\w+\)s|%s'), '?'),
+  (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+  (re.compile(r'\s+'), ' '),
+  (re.compile(r'\(\?(?:, \?)*\)'), '(?)'),
+  (re.compile(r'\(\?\)(?:, \(\?\))+'), '(?)')
+)
+
+_active = threading.local()
+
+'''
+fingerprint(statement)
+    returns the shape of a SQL statement, without its literals and parameters
+'''
+def fingerprint(statement):
+  for pattern, replacement in FINGERPRINT_RULES:
+    statement = pattern.sub(replacement, statement)
+  return statement.strip()
+
+'''
+QueryRecorder
+Records the statements executed while it is active, with their fingerprint and duration
+  repeated(threshold) returns the {fingerprint: count} of the shapes executed more than threshold times,
+  the usual sign of a query issued in a loop (N+1)
+'''
+class QueryRecorder:
+  def __init__(self):
+    self.statements = []
+
+  def record(self, statement, seconds):
+    self.statements.append((fingerprint(statement), seconds))
+
+  @property
+  def count(self):
+    return len(self.statements)
+
+  @property
+  def duration(self):
+    return sum(seconds for _, seconds in self.statements)
+
+  def fingerprints(self):
+    return Counter(shape for shape, _ in self.statements)
+
+  def repeated(self, threshold):
+    return {shape: count for shape, count in self.fingerprints().items() if count > threshold}
+
+  def header(self):
+    max_repeats = max(self.fingerprints().values(), default=0)
+    return f'count={self.count}; time_ms={self.duration * 1000:.2f}; max_repeats={max_repeats}'
+
+'''
+start_recording() and stop_recording(recorder)
+    start and stop a QueryRecorder of the statements executed by the current thread
+'''
+def start_recording():
+  recorder = QueryRecorder()
+  _active.__dict__.setdefault('recorders', []).append(recorder)
+  return recorder
+
+def stop_recording(recorder):
+  _active.recorders.remove(recorder)
+
+'''
+record_queries()
+    context manager returning a QueryRecorder of the statements executed by the current thread inside it
+'''
+@contextmanager
+def record_queries():
+  recorder = start_recording()
+  try:
+    yield recorder
+  finally:
+    stop_recording(recorder)
+
+'''
+record_statement(statement, seconds)
+    records an executed statement in the active QueryRecorders of the current thread
+    called by the cursor execution listeners of metrics.py, which time every statement once
+'''
+def record_statement(statement, seconds):
+  for recorder in getattr(_active, 'recorders', ()):
+    recorder.record(statement, seconds)
+
+'''
+QueryLog
+Records the statements of every request when QUERY_RECORDER_ENABLED (debug and test setups)
+  the X-Debug-Queries response header carries the statement count, the DB time and the most repeated shape count
+  a warning is logged when one shape runs more than QUERY_REPEAT_THRESHOLD times in a request
+'''
+class QueryLog:
+  def init_app(self, app):
+    app.before_request(self.before_request)
+    app.after_request(self.after_request)
+    app.teardown_request(self.teardown_request)
+
+  def before_request(self):
+    if current_app.config.get('QUERY_RECORDER_ENABLED'):
+      g.query_recorder = start_recording()
+
+  def after_request(self, response):
+    if 'query_recorder' in g:
+      recorder = g.query_recorder
+      response.headers['X-Debug-Queries'] = recorder.header()
+      for shape, count in recorder.repeated(current_app.config.get('QUERY_REPEAT_THRESHOLD', 5)).items():
+        current_app.logger.warning('possible N+1 query, %s %s ran %d times: %s', request.method, request.path, count,
+          shape)
+    return response
+
+  def teardown_request(self, error=None):
+    if 'query_recorder' in g:
+      stop_recording(g.pop('query_recorder'))
+
+query_log = QueryLog()
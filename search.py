@@ -0,0 +1,113 @@
+import re
+import bisect
+from collections import Counter
+from flask import current_app
+from sqlalchemy import func, or_, desc
+
+from models import db, Actor, Movie, table_versions
+
+# the searched field of each model
+SEARCH_FIELDS = {Actor: 'name', Movie: 'title'}
+
+# minimum similarity of a fuzzy match, the pg_trgm default
+SIMILARITY_THRESHOLD = 0.3
+
+# escape character of the LIKE patterns, a backslash would need escaping in PostgreSQL literals
+LIKE_ESCAPE = '/'
+
+'''
+trigrams(value)
+    returns the set of trigrams of value the way pg_trgm computes them
+'''
+def trigrams(value):
+  grams = set()
+  for word in re.findall(r'\w+', value.lower()):
+    padded = '  ' + word + ' '
+    grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+  return grams
+
+'''
+escape_like(value)
+    escapes the LIKE wildcards of value with LIKE_ESCAPE
+'''
+def escape_like(value):
+  return value.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+'''
+SearchIndex
+In process prefix and trigram index of one field, used when the database has no pg_trgm (SQLite)
+  prefix matches come from a sorted list, fuzzy matches from an inverted index of trigrams
+'''
+class SearchIndex:
+  def __init__(self, rows):
+    self.values = {}
+    self.sorted = []
+    self.postings = {}
+    self.sizes = {}
+    for row_id, value in rows:
+      self.values[row_id] = value
+      self.sorted.append((value.lower(), row_id))
+      grams = trigrams(value)
+      self.sizes[row_id] = len(grams)
+      for gram in grams:
+        self.postings.setdefault(gram, []).append(row_id)
+    self.sorted.sort()
+
+  def prefix(self, q, limit):
+    q = q.lower()
+    matches = []
+    for value, row_id in self.sorted[bisect.bisect_left(self.sorted, (q,)):]:
+      if not value.startswith(q) or len(matches) == limit:
+        break
+      matches.append(row_id)
+    return matches
+
+  def similarities(self, q):
+    grams = trigrams(q)
+    shared = Counter(row_id for gram in grams for row_id in self.postings.get(gram, ()))
+    return {row_id: count / (len(grams) + self.sizes[row_id] - count) for row_id, count in shared.items()}
+
+  def search(self, q, limit):
+    similarities = self.similarities(q)
+    prefix = set(self.prefix(q, limit))
+    ranked = sorted(
+      (row_id for row_id in prefix | set(similarities)
+        if row_id in prefix or similarities[row_id] >= SIMILARITY_THRESHOLD),
+      key=lambda row_id: (row_id not in prefix, -similarities.get(row_id, 0), row_id))
+    return [(row_id, self.values[row_id], similarities.get(row_id, 0)) for row_id in ranked[:limit]]
+
+'''
+search_index(model)
+    returns the in process index of the model, rebuilt when the table version changed
+'''
+def search_index(model):
+  indexes = current_app.extensions.setdefault('search_indexes', {})
+  version = table_versions((model.__tablename__,))
+  if model not in indexes or indexes[model][0] != version:
+    field = getattr(model, SEARCH_FIELDS[model])
+    indexes[model] = (version, SearchIndex(db.session.query(model.id, field)))
+  return indexes[model][1]
+
+'''
+search_query(model, q, limit)
+    returns the PostgreSQL query of search_model, served by the prefix and trigram indexes
+'''
+def search_query(model, q, limit):
+  field = getattr(model, SEARCH_FIELDS[model])
+  prefix = func.lower(field).like(escape_like(q.lower()) + '%', escape=LIKE_ESCAPE)
+  similarity = func.similarity(field, q)
+  # pg_trgm's similarity operator, doubled so psycopg2 doesn't read it as a parameter placeholder
+  return db.session.query(model.id, field, similarity) \
+    .filter(or_(prefix, field.op('%%')(q))) \
+    .order_by(desc(prefix), desc(similarity), model.id) \
+    .limit(limit)
+
+'''
+search_model(model, q, limit)
+    returns up to limit (id, value, score) of the model ranked by prefix match and then by similarity
+    PostgreSQL answers from the prefix and trigram indexes, other databases from the in process index
+'''
+def search_model(model, q, limit):
+  if db.engine.dialect.name != 'postgresql':
+    return search_index(model).search(q, limit)
+  return [(row_id, value, score) for row_id, value, score in search_query(model, q, limit)]
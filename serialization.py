@@ -0,0 +1,118 @@
+import json
+import datetime
+from abc import ABC, abstractmethod
+from flask import current_app
+from werkzeug.http import http_date
+
+from metrics import stage
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+'''
+JSONProvider
+Encoder of the JSON response bodies, straight to bytes
+  the datetimes are ISO-8601 strings (i.e. '2020-05-15T00:00:00'), or RFC 1123 ones with legacy_dates
+  (i.e. 'Fri, 15 May 2020 00:00:00 GMT', the format of Flask's encoder)
+  dumps(obj, pretty=False) returns the encoded obj, indented by 2 spaces when pretty
+'''
+class JSONProvider(ABC):
+  def __init__(self, sort_keys=True, legacy_dates=False):
+    self.sort_keys = sort_keys
+    self.legacy_dates = legacy_dates
+
+  @abstractmethod
+  def dumps(self, obj, pretty=False):
+    pass
+
+  def default(self, o):
+    if isinstance(o, datetime.datetime):
+      return http_date(o.utctimetuple()) if self.legacy_dates else o.isoformat()
+    if isinstance(o, datetime.date):
+      return http_date(o.timetuple()) if self.legacy_dates else o.isoformat()
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+'''
+StdlibJSONProvider
+Provider of the json module, used when orjson is not installed
+'''
+class StdlibJSONProvider(JSONProvider):
+  def dumps(self, obj, pretty=False):
+    if pretty:
+      text = json.dumps(obj, default=self.default, sort_keys=self.sort_keys, indent=2, separators=(', ', ': '))
+    else:
+      text = json.dumps(obj, default=self.default, sort_keys=self.sort_keys, separators=(',', ':'))
+    return text.encode('utf-8')
+
+'''
+OrjsonJSONProvider
+Provider of orjson, which encodes the dicts, lists and datetimes in C
+  with legacy_dates the datetimes are passed to default instead
+'''
+class OrjsonJSONProvider(JSONProvider):
+  def __init__(self, sort_keys=True, legacy_dates=False):
+    super().__init__(sort_keys, legacy_dates)
+    self.option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+      self.option |= orjson.OPT_SORT_KEYS
+    if legacy_dates:
+      self.option |= orjson.OPT_PASSTHROUGH_DATETIME
+
+  def dumps(self, obj, pretty=False):
+    option = self.option | orjson.OPT_INDENT_2 if pretty else self.option
+    return orjson.dumps(obj, default=self.default, option=option)
+
+# the built-in providers of JSON_PROVIDER
+PROVIDERS = {
+  'orjson': OrjsonJSONProvider,
+  'stdlib': StdlibJSONProvider
+}
+
+'''
+JSONResponses
+Encodes the JSON responses of the app with its JSON provider
+  JSON_PROVIDER is a JSONProvider or the name of a built-in one, 'orjson' falls back to 'stdlib' when orjson
+  is not installed
+'''
+class JSONResponses:
+  def init_app(self, app, provider=None):
+    if provider is None:
+      provider = app.config.get('JSON_PROVIDER', 'orjson')
+    if isinstance(provider, str):
+      name = 'stdlib' if provider == 'orjson' and orjson is None else provider
+      provider = PROVIDERS[name](app.config.get('JSON_SORT_KEYS', True), app.config.get('JSON_LEGACY_DATES', False))
+    app.extensions['json_provider'] = provider
+
+  @property
+  def provider(self):
+    return current_app.extensions['json_provider']
+
+  def dumps(self, obj, pretty=False):
+    with stage('serialize'):
+      return self.provider.dumps(obj, pretty)
+
+  '''
+  dumps_lines(objs)
+      returns the objs encoded as newline delimited JSON, timed once in the serialize stage
+  '''
+  def dumps_lines(self, objs):
+    provider = self.provider
+    with stage('serialize'):
+      return b''.join(provider.dumps(obj) + b'\n' for obj in objs)
+
+  '''
+  jsonify(*args, **kwargs)
+      flask.jsonify with the provider of the app, the body is set as bytes
+  '''
+  def jsonify(self, *args, **kwargs):
+    if args and kwargs:
+      raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    data = args[0] if len(args) == 1 else args or kwargs
+    pretty = current_app.config['JSONIFY_PRETTYPRINT_REGULAR'] or current_app.debug
+    return current_app.response_class(self.dumps(data, pretty) + b'\n',
+      mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+json_responses = JSONResponses()
+jsonify = json_responses.jsonify
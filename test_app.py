@@ -1,11 +1,35 @@
 import os
 import unittest
 import json
+import time
+import threading
+import datetime
+import asyncio
+import tempfile
+import subprocess
+import sys
+from unittest import mock
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import exc, create_engine, func
+from sqlalchemy.dialects.postgresql import psycopg2
+from jose import jwt
+from jose.utils import base64url_encode
+from Crypto.PublicKey import RSA
 
 from app import create_app
-from models import setup_db, Actor, Movie
-from auth import AuthError, requires_auth
+from models import db, setup_db, Actor, Movie, LinkChange, movies as movies_table, count_stats, check_stats, \
+  rebuild_stats, log_link_changes, prune_link_changes
+import auth
+from auth import AuthError, requires_auth, JWKSKeyStore, TokenCache, VerifiedToken
+from cache import CacheBackend, response_cache
+from importer import import_catalog
+from search import SearchIndex, search_query
+from graph import CostarGraph, shortest_path, graph_index, find_costars, find_path, database_costars, \
+  database_expand
+from pool import TimedQueuePool, pool_stats
+from queries import record_queries, fingerprint
+from asgi import ThreadPoolWsgiToAsgi
+from serialization import JSONProvider, StdlibJSONProvider, OrjsonJSONProvider, orjson
 
 CASTING_ASSISTANT = os.getenv('CASTING_ASSISTANT')
 CASTING_DIRECTOR = os.getenv('CASTING_DIRECTOR')
@@ -45,6 +69,20 @@ class CasptoneTestCase(unittest.TestCase):
     """Executed after reach test"""
     pass
 
+  def get_recording_queries(self, path, token):
+    """GET path and return the response with the QueryRecorder of the SQL statements it executed"""
+    with record_queries() as recorder:
+      res = self.client().get(path,
+        headers={
+          'Authorization': 'Bearer {}'.format(token)
+        })
+    return res, recorder
+
+  def assertNoRepeatedQueries(self, recorder, threshold=2):
+    """Fail if a SQL shape ran more than threshold times, the sign of a query in a loop (N+1)"""
+    repeated = recorder.repeated(threshold)
+    self.assertFalse(repeated, 'SQL run more than {} times: {}'.format(threshold, repeated))
+
   """
   Tests for successful operation and for expected errors.
   """
@@ -70,6 +108,303 @@ class CasptoneTestCase(unittest.TestCase):
     self.assertEqual(data['success'], True)
     self.assertTrue(len(data['movies']))
 
+  def test_get_actors_pages_with_cursor(self):
+    headers = {'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)}
+    res = self.client().get('/actors?limit=1', headers=headers)
+    first_page = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(len(first_page['actors']), 1)
+    self.assertTrue(first_page['next_cursor'])
+
+    res = self.client().get('/actors?limit=1&cursor={}'.format(first_page['next_cursor']), headers=headers)
+    second_page = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertGreater(second_page['actors'][0]['id'], first_page['actors'][0]['id'])
+
+  def test_get_movies_after_id(self):
+    res = self.client().get('/movies?after=1',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertTrue(all(movie['id'] > 1 for movie in data['movies']))
+
+  def test_400_get_actors_with_malformed_cursor(self):
+    res = self.client().get('/actors?cursor=not-a-cursor',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 400)
+    self.assertEqual(data['success'], False)
+
+  def test_get_actors_filtered_by_gender_and_age_range(self):
+    res = self.client().get('/actors?gender=F&age_min=20&age_max=30',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+    data = json.loads(res.data)
+    ages = [actor['age'] for actor in data['actors']]
+
+    self.assertEqual(res.status_code, 200)
+    self.assertTrue(len(data['actors']))
+    self.assertTrue(all(actor['gender'] == 'F' and 20 <= actor['age'] <= 30 for actor in data['actors']))
+    self.assertEqual(ages, sorted(ages))
+
+  def test_get_movies_filtered_by_release_years(self):
+    res = self.client().get('/movies?release_year_min=2001&release_year_max=2003&fields=id,release_year',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertTrue(len(data['movies']))
+    self.assertTrue(all(2001 <= int(movie['release_year'][:4]) <= 2003 for movie in data['movies']))
+
+  def test_release_year_format(self):
+    res, _ = self.get_recording_queries('/movies?limit=1', CASTING_ASSISTANT)
+    release_year = json.loads(res.data)['movies'][0]['release_year']
+
+    self.assertEqual(datetime.datetime.fromisoformat(release_year).isoformat(), release_year)
+
+    with mock.patch('config.JSON_LEGACY_DATES', True):
+      app = create_app()
+    res = app.test_client().get('/movies?limit=1',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+
+    self.assertTrue(json.loads(res.data)['movies'][0]['release_year'].endswith(' GMT'))
+
+  def test_get_actors_pages_sorted_by_descending_age(self):
+    headers = {'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)}
+    res = self.client().get('/actors?sort=-age&fields=age&limit=1', headers=headers)
+    first_page = json.loads(res.data)
+
+    res = self.client().get('/actors?sort=-age&fields=age&limit=1&cursor={}'.format(first_page['next_cursor']),
+      headers=headers)
+    second_page = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertGreaterEqual(first_page['actors'][0]['age'], second_page['actors'][0]['age'])
+
+    res = self.client().get('/actors?sort=age&cursor={}'.format(first_page['next_cursor']), headers=headers)
+    self.assertEqual(res.status_code, 400)
+
+  def test_400_get_actors_with_unindexed_sort(self):
+    res = self.client().get('/actors?gender=F&sort=name',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 400)
+    self.assertEqual(data['success'], False)
+
+  def test_400_get_movies_with_invalid_filter(self):
+    res = self.client().get('/movies?release_year=recent',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 400)
+    self.assertEqual(data['success'], False)
+
+  def test_get_pool_stats_from_local_address(self):
+    res = self.client().get('/internal/pool')
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(data['success'], True)
+    self.assertIn('class', data['pool'])
+
+  def test_403_get_pool_stats_from_remote_address(self):
+    res = self.client().get('/internal/pool', environ_base={'REMOTE_ADDR': '203.0.113.7'})
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 403)
+    self.assertEqual(data['success'], False)
+
+  def test_get_metrics_records_route_and_stages(self):
+    self.client().get('/movies',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+    res = self.client().get('/metrics')
+    body = res.data.decode('utf-8')
+
+    self.assertEqual(res.status_code, 200)
+    self.assertIn('capstone_request_duration_seconds_count{method="GET",route="/movies"}', body)
+    for stage in ('auth', 'db', 'serialize'):
+      self.assertIn('capstone_request_stage_duration_seconds_count{route="/movies",stage="%s"}' % stage, body)
+    self.assertIn('capstone_requests_total{method="GET",route="/movies",status="200"}', body)
+
+  def test_403_get_metrics_from_remote_address(self):
+    res = self.client().get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'})
+    self.assertEqual(res.status_code, 403)
+
+  def test_get_actors_statement_count_does_not_grow_with_rows(self):
+    res, one_row_queries = self.get_recording_queries('/actors?limit=1', CASTING_ASSISTANT)
+    self.assertEqual(res.status_code, 200)
+
+    res, queries = self.get_recording_queries('/actors?limit=3', CASTING_ASSISTANT)
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(len(json.loads(res.data)['actors']), 3)
+    self.assertEqual(queries.count, 3)
+    self.assertEqual(one_row_queries.count, 3)
+    self.assertNoRepeatedQueries(queries)
+
+  def test_get_movies_statement_count_does_not_grow_with_rows(self):
+    res, one_row_queries = self.get_recording_queries('/movies?limit=1', CASTING_ASSISTANT)
+    self.assertEqual(res.status_code, 200)
+
+    res, queries = self.get_recording_queries('/movies?limit=3', CASTING_ASSISTANT)
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(len(json.loads(res.data)['movies']), 3)
+    self.assertEqual(queries.count, 3)
+    self.assertEqual(one_row_queries.count, 3)
+    self.assertNoRepeatedQueries(queries)
+
+  def test_debug_queries_header(self):
+    self.app.config['QUERY_RECORDER_ENABLED'] = True
+    res = self.client().get('/movies?limit=2',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+
+    self.assertEqual(res.status_code, 200)
+    self.assertTrue(res.headers['X-Debug-Queries'].startswith('count=3; time_ms='))
+    self.assertTrue(res.headers['X-Debug-Queries'].endswith('max_repeats=1'))
+
+  def test_get_actors_sparse_fieldset_skips_relations(self):
+    res, queries = self.get_recording_queries('/actors?fields=id,name', CASTING_ASSISTANT)
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(set(data['actors'][0]), {'id', 'name'})
+    self.assertEqual(queries.count, 2)
+
+  def test_get_movies_sparse_fieldset_with_include(self):
+    res = self.client().get('/movies?fields=title&include=actors',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(set(data['movies'][0]), {'title', 'actors'})
+
+  def test_400_get_actors_with_unknown_field(self):
+    res = self.client().get('/actors?fields=id,salary',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 400)
+    self.assertEqual(data['success'], False)
+
+  def test_304_get_actors_if_none_match(self):
+    headers = {'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)}
+    res = self.client().get('/actors', headers=headers)
+    etag = res.headers['ETag']
+
+    headers['If-None-Match'] = etag
+    res = self.client().get('/actors', headers=headers)
+    self.assertEqual(res.status_code, 304)
+    self.assertEqual(res.headers['ETag'], etag)
+    self.assertEqual(res.data, b'')
+
+  def test_etag_changes_after_write(self):
+    res = self.client().get('/movies?fields=id',
+      headers={
+        'Authorization': 'Bearer {}'.format(EXECUTIVE_PRODUCER)
+      })
+    etag = res.headers['ETag']
+    movie_id = json.loads(res.data)['movies'][0]['id']
+
+    self.client().patch('/movies/{}'.format(movie_id),
+      headers={
+        'Authorization': 'Bearer {}'.format(EXECUTIVE_PRODUCER)
+      },
+      json={'title': 'Renamed'}
+    )
+    res = self.client().get('/movies?fields=id',
+      headers={
+        'Authorization': 'Bearer {}'.format(EXECUTIVE_PRODUCER),
+        'If-None-Match': etag
+      })
+
+    self.assertEqual(res.status_code, 200)
+    self.assertNotEqual(res.headers['ETag'], etag)
+
+  def test_export_actors_streams_ndjson(self):
+    headers = {'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)}
+    res = self.client().get('/actors/export', headers=headers)
+    lines = [json.loads(line) for line in res.data.decode('utf-8').splitlines()]
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(res.mimetype, 'application/x-ndjson')
+    self.assertEqual(len(lines), Actor.query.count())
+    self.assertEqual([actor['id'] for actor in lines], sorted(actor['id'] for actor in lines))
+
+    page = json.loads(self.client().get('/actors?limit=1', headers=headers).data)['actors']
+    self.assertEqual(lines[0], page[0])
+
+  def test_export_movies_resumes_after_id(self):
+    headers = {'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)}
+    first_id = Movie.query.order_by(Movie.id).first().id
+    res = self.client().get('/movies/export?after={}'.format(first_id), headers=headers)
+    lines = [json.loads(line) for line in res.data.decode('utf-8').splitlines()]
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(len(lines), Movie.query.count() - 1)
+    self.assertTrue(all(movie['id'] > first_id for movie in lines))
+
+  def test_search_actors_and_movies_by_prefix(self):
+    actor = Actor.query.order_by(Actor.id).first()
+    movie = Movie.query.order_by(Movie.id).first()
+
+    res = self.client().get('/search?q={}'.format(actor.name[:4]),
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertIn(actor.id, [match['id'] for match in data['actors']])
+
+    res = self.client().get('/search?q={}&limit=1'.format(movie.title),
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(len(data['movies']), 1)
+    self.assertEqual(data['movies'][0]['title'].lower()[:len(movie.title)], movie.title.lower())
+
+  def test_search_query_escapes_similarity_operator_for_psycopg2(self):
+    with self.app.app_context():
+      sql = str(search_query(Actor, 'Manuela', 10).statement.compile(dialect=psycopg2.dialect()))
+
+    self.assertIn('"Actor".name %% %(', sql)
+
+  def test_400_search_without_query(self):
+    res = self.client().get('/search',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+
+    self.assertEqual(res.status_code, 400)
+
   def test_404_get_actors_without_auth(self):
     res = self.client().get('/authors')
     data = json.loads(res.data)
@@ -91,6 +426,47 @@ class CasptoneTestCase(unittest.TestCase):
     self.assertEqual(data['success'], True)
     self.assertTrue(len(data['actors']))
 
+  def post_recording_queries(self, path, body):
+    """POST body to path and return the response with the QueryRecorder of the SQL statements it executed"""
+    with record_queries() as recorder:
+      res = self.client().post(path,
+        headers={
+          'Authorization': 'Bearer {}'.format(EXECUTIVE_PRODUCER)
+        },
+        json=body
+      )
+    return res, recorder
+
+  def test_create_actor_statement_count_independent_of_movies(self):
+    with self.app.app_context():
+      movies = [Movie(title='Cast {}'.format(i), release_year=datetime.datetime(2000, 1, 1)) for i in range(8)]
+      db.session.add_all(movies)
+      db.session.commit()
+      movie_ids = [movie.id for movie in movies]
+
+    counts = []
+    for linked in (movie_ids[:1], movie_ids):
+      res, recorder = self.post_recording_queries('/actors',
+        dict(self.new_actor, movies=linked))
+      data = json.loads(res.data)
+
+      self.assertEqual(res.status_code, 200)
+      self.assertEqual(len(data['actors'][0]['movies']), len(linked))
+      counts.append(recorder.count)
+
+    # id validation, actor and links inserts, catalog stats, link changes, table versions, then the created actor
+    # and its movies
+    self.assertEqual(counts, [8, 8])
+
+  def test_422_create_actor_with_unknown_movies(self):
+    res, recorder = self.post_recording_queries('/actors', dict(self.new_actor, movies=[100000, 100001]))
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 422)
+    self.assertEqual(data['success'], False)
+    self.assertEqual(data['message'], 'Unknown movies ids: [100000, 100001].')
+    self.assertEqual(recorder.count, 1)
+
   def test_401_create_new_actor_casting_assistant(self):
     res = self.client().post('/actors',
       headers={
@@ -130,6 +506,56 @@ class CasptoneTestCase(unittest.TestCase):
     self.assertEqual(data['success'], False)
     self.assertEqual(data['message'], 'Permissions not found.')
 
+  def test_create_actors_batch_casting_director(self):
+    res = self.client().post('/actors/batch',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_DIRECTOR)
+      },
+      json={'actors': [
+        {'name': 'Batch Actor', 'age': 30, 'gender': 'F', 'movies': []},
+        {'name': 'Batch Actor', 'age': 'thirty', 'gender': 'F'},
+        {'name': 'Batch Actor', 'age': 31, 'gender': 'M', 'movies': [999999]}
+      ]}
+    )
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(data['success'], True)
+    self.assertEqual([item['index'] for item in data['created']], [0])
+    self.assertEqual([item['index'] for item in data['errors']], [1, 2])
+    self.assertIsNotNone(Actor.query.get(data['created'][0]['id']))
+
+  def test_create_movies_batch_links_actors(self):
+    actor_id = Actor.query.order_by(Actor.id).first().id
+    res = self.client().post('/movies/batch',
+      headers={
+        'Authorization': 'Bearer {}'.format(EXECUTIVE_PRODUCER)
+      },
+      json={'movies': [
+        {'title': 'Batch Movie 1', 'release_year': '2020-05-15', 'actors': [actor_id]},
+        {'title': 'Batch Movie 2', 'release_year': 'Fri, 15 May 2020 00:00:00 GMT', 'actors': [actor_id]}
+      ]}
+    )
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(data['errors'], [])
+    for item in data['created']:
+      self.assertEqual(Movie.query.get(item['id']).format()['actors'], [Actor.query.get(actor_id).name])
+
+  def test_422_create_movies_batch_without_valid_movies(self):
+    res = self.client().post('/movies/batch',
+      headers={
+        'Authorization': 'Bearer {}'.format(EXECUTIVE_PRODUCER)
+      },
+      json={'movies': [{'title': 'No release year'}]}
+    )
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 422)
+    self.assertEqual(data['success'], False)
+    self.assertEqual(len(data['errors']), 1)
+
   def test_update_actor_casting_director(self):
     res = self.client().patch('/actors/3',
       headers={
@@ -144,6 +570,64 @@ class CasptoneTestCase(unittest.TestCase):
     self.assertEqual(data['success'], True)
     self.assertEqual(actor.format()['age'], 10)
 
+  def create_linked_actor(self, movie_count):
+    """Create an actor linked to the first of movie_count new movies and return (actor id, movie ids)"""
+    with self.app.app_context():
+      movies = [Movie(title='Linked {}'.format(i), release_year=datetime.datetime(2000, 1, 1))
+        for i in range(movie_count)]
+      actor = Actor(name='Linked Actor', age=30, gender='F', movie=movies[:1])
+      db.session.add_all([actor] + movies)
+      db.session.commit()
+      return actor.id, [movie.id for movie in movies]
+
+  def patch_actor_movies(self, actor_id, movies):
+    with record_queries() as recorder:
+      res = self.client().patch('/actors/{}'.format(actor_id),
+        headers={
+          'Authorization': 'Bearer {}'.format(CASTING_DIRECTOR)
+        },
+        json={'movies': movies}
+      )
+    with self.app.app_context():
+      linked = sorted(movie.id for movie in Actor.query.get(actor_id).movies)
+    return res, recorder, linked
+
+  def test_update_actor_adds_existing_links_once(self):
+    actor_id, movie_ids = self.create_linked_actor(3)
+    res, recorder, linked = self.patch_actor_movies(actor_id, movie_ids + [100000])
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(linked, movie_ids)
+    self.assertNoRepeatedQueries(recorder)
+    self.assertEqual(len([shape for shape in recorder.fingerprints() if 'INTO movies' in shape]), 1)
+
+  def test_update_actor_adds_and_removes_links(self):
+    actor_id, movie_ids = self.create_linked_actor(3)
+    res, _, linked = self.patch_actor_movies(actor_id, {'add': movie_ids[1:], 'remove': movie_ids[:1]})
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(linked, movie_ids[1:])
+
+  def test_update_actor_replaces_links(self):
+    actor_id, movie_ids = self.create_linked_actor(3)
+    res, _, linked = self.patch_actor_movies(actor_id, {'replace': movie_ids[2:]})
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(linked, movie_ids[2:])
+    self.assertEqual(data['actors'][0]['movies'], ['Linked 2'])
+
+    res, _, linked = self.patch_actor_movies(actor_id, {'replace': []})
+    self.assertEqual(linked, [])
+
+  def test_400_update_actor_with_invalid_link_operations(self):
+    actor_id, movie_ids = self.create_linked_actor(2)
+    for movies in ({'replace': movie_ids, 'add': movie_ids}, {'move': movie_ids}, {'add': movie_ids[:1], 'remove': movie_ids[:1]}):
+      res, _, linked = self.patch_actor_movies(actor_id, movies)
+
+      self.assertEqual(res.status_code, 400)
+      self.assertEqual(linked, movie_ids[:1])
+
   def test_400_update_actor_executive_producer_with_unexistent_actor(self):
     res = self.client().patch('/actors/100000',
       headers={
@@ -238,6 +722,222 @@ class CasptoneTestCase(unittest.TestCase):
     self.assertEqual(data['success'], False)
     self.assertEqual(data['message'], 'Unprocessable')
 
+  def delete_recording_queries(self, path):
+    """DELETE path and return the response with the QueryRecorder of the SQL statements it executed"""
+    with record_queries() as recorder:
+      res = self.client().delete(path,
+        headers={
+          'Authorization': 'Bearer {}'.format(EXECUTIVE_PRODUCER)
+        })
+    return res, recorder
+
+  def count_links(self, actor_ids):
+    with self.app.app_context():
+      return db.session.query(movies_table).filter(movies_table.c.actor_id.in_(actor_ids)).count()
+
+  def test_delete_actor_cascades_links_in_database(self):
+    actor_id, movie_ids = self.create_linked_actor(6)
+    self.patch_actor_movies(actor_id, movie_ids)
+    res, recorder = self.delete_recording_queries('/actors/{}'.format(actor_id))
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(self.count_links([actor_id]), 0)
+    # the links are neither loaded nor deleted by the app, only counted out of the catalog stats
+    self.assertFalse([shape for shape in recorder.fingerprints()
+      if shape.startswith('DELETE FROM movies') or '"Movie"' in shape])
+
+  def test_delete_actors_by_ids(self):
+    actor_ids = [self.create_linked_actor(2)[0] for _ in range(3)]
+    res, recorder = self.delete_recording_queries('/actors?ids={},100000'.format(','.join(map(str, actor_ids))))
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(data['deleted'], actor_ids)
+    self.assertEqual(self.count_links(actor_ids), 0)
+    with self.app.app_context():
+      self.assertEqual(Actor.query.filter(Actor.id.in_(actor_ids)).count(), 0)
+    self.assertNoRepeatedQueries(recorder, threshold=1)
+
+  def test_400_delete_actors_with_invalid_ids(self):
+    for path in ('/actors', '/actors?ids=', '/actors?ids=1,a'):
+      res, _ = self.delete_recording_queries(path)
+
+      self.assertEqual(res.status_code, 400)
+
+  def test_422_delete_movies_with_unknown_ids(self):
+    res, _ = self.delete_recording_queries('/movies?ids=100000,100001')
+
+    self.assertEqual(res.status_code, 422)
+
+  def test_stats_stay_consistent_through_writes(self):
+    actor_id, movie_ids = self.create_linked_actor(3)
+    self.patch_actor_movies(actor_id, {'replace': movie_ids[1:]})
+    self.client().patch('/actors/{}'.format(actor_id),
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_DIRECTOR)
+      },
+      json={'age': 71, 'gender': 'M'}
+    )
+    self.post_recording_queries('/actors', dict(self.new_actor, movies=movie_ids))
+    self.delete_recording_queries('/movies?ids={}'.format(movie_ids[0]))
+
+    with self.app.app_context():
+      self.assertEqual(check_stats(), {})
+
+  def test_get_stats(self):
+    res, recorder = self.get_recording_queries('/stats', EXECUTIVE_PRODUCER)
+    data = json.loads(res.data)
+
+    with self.app.app_context():
+      actors, movies = Actor.query.count(), Movie.query.count()
+      links = db.session.query(movies_table).count()
+      in_band = Actor.query.filter(Actor.gender == 'F', Actor.age >= 20, Actor.age < 30).count()
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(data['actors']['total'], actors)
+    self.assertIn({'gender': 'F', 'age_min': 20, 'age_max': 29, 'count': in_band}, data['actors']['by_gender_and_age'])
+    self.assertEqual(data['movies']['total'], movies)
+    self.assertEqual(data['links'], links)
+    self.assertAlmostEqual(data['average_cast_size'], links / movies)
+    self.assertEqual(recorder.count, 1)
+
+  def test_rebuild_stats_repairs_drift(self):
+    with self.app.app_context():
+      count_stats({('links', ''): 5, ('movies', '1800'): 1})
+      db.session.commit()
+      self.assertEqual(set(check_stats()), {('links', ''), ('movies', '1800')})
+
+      rebuild_stats()
+      db.session.commit()
+      self.assertEqual(check_stats(), {})
+
+  def create_costars(self):
+    """Create actors A, B, C and movies shared by A and B (two of them) and by B and C, return their ids"""
+    with self.app.app_context():
+      a, b, c = [Actor(name='Costar {}'.format(name), age=40, gender='M') for name in 'ABC']
+      first, second, third = [Movie(title='Costars {}'.format(i), release_year=datetime.datetime(2001, 1, 1),
+        actors=actors) for i, actors in enumerate(([a, b], [b, c], [a, b]))]
+      db.session.add_all([a, b, c, first, second, third])
+      db.session.commit()
+      return [a.id, b.id, c.id], [first.id, second.id, third.id]
+
+  def test_get_costars(self):
+    (a, b, c), _ = self.create_costars()
+    res = self.client().get('/actors/{}/costars'.format(b),
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(data['total'], 2)
+    self.assertEqual(data['costars'], [
+      {'id': a, 'name': 'Costar A', 'shared_movies': 2},
+      {'id': c, 'name': 'Costar C', 'shared_movies': 1}
+    ])
+
+  def test_404_get_costars_of_unknown_actor(self):
+    res = self.client().get('/actors/100000/costars',
+      headers={
+        'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)
+      })
+
+    self.assertEqual(res.status_code, 404)
+
+  def test_get_path_between_actors(self):
+    (a, b, c), (first, second, third) = self.create_costars()
+    res = self.client().get('/actors/{}/path/{}'.format(a, c),
+      headers={
+        'Authorization': 'Bearer {}'.format(EXECUTIVE_PRODUCER)
+      })
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(data['degrees'], 2)
+    self.assertEqual([actor['id'] for actor in data['path']], [a, b, c])
+    self.assertIn(data['path'][0]['movie']['id'], (first, third))
+    self.assertEqual(data['path'][1]['movie'], {'id': second, 'title': 'Costars 1'})
+    self.assertIsNone(data['path'][2]['movie'])
+
+    res = self.client().get('/actors/{}/path/{}?max_depth=1'.format(a, c),
+      headers={
+        'Authorization': 'Bearer {}'.format(EXECUTIVE_PRODUCER)
+      })
+    data = json.loads(res.data)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertIsNone(data['path'])
+
+  def test_costar_graph_follows_writes(self):
+    (a, b, c), (first, second, third) = self.create_costars()
+    with self.app.app_context():
+      index = graph_index()
+      index.build()
+
+    # c joins a movie of a, then b leaves the movie shared with c, and a is deleted
+    self.patch_actor_movies(c, [first])
+    self.client().patch('/movies/{}'.format(second),
+      headers={
+        'Authorization': 'Bearer {}'.format(EXECUTIVE_PRODUCER)
+      },
+      json={'actors': {'remove': [b]}}
+    )
+    with self.app.app_context():
+      with index.lock:
+        self.assertIsNotNone(index.synced())
+      self.assertEqual(find_costars(c, 10), database_costars(c, 10))
+      self.assertEqual(find_costars(c, 10), (2, [(a, 1), (b, 1)]))
+      self.assertEqual(find_path(c, b, 6), ([c, b], [first]))
+
+    self.delete_recording_queries('/actors?ids={}'.format(a))
+    with self.app.app_context():
+      with index.lock:
+        graph = index.synced()
+      self.assertEqual(graph.costars(b), {c: 1})
+      self.assertEqual(list(graph.movies_of(a)), [])
+      self.assertEqual(shortest_path(graph.expand, b, c, 6), shortest_path(database_expand, b, c, 6))
+
+  def test_link_changes_not_logged_with_graph_index_disabled(self):
+    (a, b, c), (first, second, third) = self.create_costars()
+    self.app.config['GRAPH_INDEX_ENABLED'] = False
+    with self.app.app_context():
+      logged = LinkChange.query.count()
+
+    self.patch_actor_movies(c, [first])
+    self.delete_recording_queries('/actors?ids={}'.format(a))
+    with self.app.app_context():
+      self.assertEqual(LinkChange.query.count(), logged)
+
+  def test_prune_link_changes_keeps_the_last_ones(self):
+    with self.app.app_context():
+      log_link_changes('Actor', range(1, 6))
+      last = db.session.query(func.max(LinkChange.seq)).scalar()
+      prune_link_changes(retention=2)
+      db.session.commit()
+
+      self.assertEqual([seq for seq, in db.session.query(LinkChange.seq)], [last - 1, last])
+
+  def test_costar_graph_reads_changes_committed_out_of_order(self):
+    (a, b, c), (first, second, third) = self.create_costars()
+    with self.app.app_context():
+      index = graph_index()
+      index.build()
+      seq = index.seq
+
+      # the change of seq + 1 is committed after the one of seq + 2 was read
+      db.session.execute(movies_table.insert(), [{'movie_id': first, 'actor_id': c}])
+      db.session.execute(LinkChange.__table__.insert(), [{'seq': seq + 2, 'kind': 'Movie', 'entity_id': third}])
+      rebuild_stats()
+      db.session.commit()
+      with index.lock:
+        self.assertIn(seq + 1, index.synced() and index.missing)
+      db.session.execute(LinkChange.__table__.insert(), [{'seq': seq + 1, 'kind': 'Actor', 'entity_id': c}])
+      db.session.commit()
+      with index.lock:
+        graph = index.synced()
+      self.assertEqual(index.missing, {})
+      self.assertEqual(graph.costars(c), {a: 1, b: 2})
+
   def test_405_if_actor_creation_not_allowed_executive_producer(self):
     res = self.client().post('/actors/45',
       headers={
@@ -251,6 +951,566 @@ class CasptoneTestCase(unittest.TestCase):
     self.assertEqual(data['success'], False)
     self.assertEqual(data['message'], 'Method not allowed')
 
+
+def generate_signing_key(kid):
+  '''
+  generate_signing_key(kid)
+    returns the private key in PEM format and its public JWK
+  '''
+  key = RSA.generate(2048)
+
+  def encode_int(value):
+    return base64url_encode(value.to_bytes((value.bit_length() + 7) // 8, 'big')).decode('utf-8')
+
+  public_jwk = {
+    'kty': 'RSA',
+    'kid': kid,
+    'use': 'sig',
+    'alg': 'RS256',
+    'n': encode_int(key.n),
+    'e': encode_int(key.e)
+  }
+  return key.export_key('PEM').decode('utf-8'), public_jwk
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+  """This class represents the JWKS key store test case"""
+
+  @classmethod
+  def setUpClass(cls):
+    cls.private_key, cls.public_jwk = generate_signing_key('test-key')
+    cls.rotated_private_key, cls.rotated_public_jwk = generate_signing_key('rotated-key')
+
+  def setUp(self):
+    self.jwks_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    self.write_jwks([self.public_jwk])
+    self.store = JWKSKeyStore('file://' + self.jwks_file.name, ttl=600, min_refetch_interval=600)
+
+  def tearDown(self):
+    os.unlink(self.jwks_file.name)
+
+  def write_jwks(self, keys):
+    with open(self.jwks_file.name, 'w') as jwks_file:
+      json.dump({'keys': keys}, jwks_file)
+
+  def sign(self, private_key, kid, **claims):
+    payload = {
+      'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+      'aud': auth.API_AUDIENCE,
+      'permissions': ['get:actors']
+    }
+    payload.update(claims)
+    return jwt.encode(payload, private_key, algorithm='RS256', headers={'kid': kid})
+
+  def test_keys_are_fetched_once(self):
+    fetches = []
+    fetch = self.store.fetch
+    self.store.fetch = lambda: fetches.append(1) or fetch()
+
+    self.assertIsNotNone(self.store.get_key('test-key'))
+    self.assertIsNotNone(self.store.get_key('test-key'))
+    self.assertEqual(len(fetches), 1)
+
+  def test_unknown_kid_refetch_is_rate_limited(self):
+    self.assertIsNone(self.store.get_key('rotated-key'))
+
+    self.write_jwks([self.public_jwk, self.rotated_public_jwk])
+    self.assertIsNone(self.store.get_key('rotated-key'))
+
+    self.store.min_refetch_interval = 0
+    self.assertIsNotNone(self.store.get_key('rotated-key'))
+
+  def test_concurrent_unknown_kid_refetches_once(self):
+    self.assertIsNone(self.store.get_key('rotated-key'))
+    self.write_jwks([self.public_jwk, self.rotated_public_jwk])
+    self.store._attempted_at -= self.store.min_refetch_interval
+
+    fetches = []
+    fetch = self.store.fetch
+    self.store.fetch = lambda: fetches.append(1) or time.sleep(0.05) or fetch()
+    keys = []
+    threads = [threading.Thread(target=lambda: keys.append(self.store.get_key('rotated-key'))) for _ in range(8)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(len(fetches), 1)
+    self.assertTrue(all(key is not None for key in keys))
+    self.assertEqual(len(keys), 8)
+
+  def test_last_good_keys_served_if_refresh_fails(self):
+    self.assertIsNotNone(self.store.get_key('test-key'))
+
+    self.store.url = 'file:///nonexistent/jwks.json'
+    self.assertFalse(self.store.refresh())
+    self.assertIsNotNone(self.store.get_key('test-key'))
+
+  def test_verify_decode_jwt_with_local_jwks(self):
+    store = auth.jwks_store
+    auth.jwks_store = self.store
+    try:
+      token = self.sign(self.private_key, 'test-key')
+      payload = auth.verify_decode_jwt(token)
+      self.assertEqual(payload['permissions'], ['get:actors'])
+
+      forged = self.sign(self.rotated_private_key, 'test-key')
+      with self.assertRaises(AuthError):
+        auth.verify_decode_jwt(forged)
+    finally:
+      auth.jwks_store = store
+
+  def test_alg_must_be_one_of_the_algorithms(self):
+    store = auth.jwks_store
+    auth.jwks_store = self.store
+    try:
+      # signed with RS256 but naming a substring of "['RS256']"
+      token = jwt.encode({'iss': 'https://' + auth.AUTH0_DOMAIN + '/', 'aud': auth.API_AUDIENCE}, self.private_key,
+        algorithm='RS256', headers={'kid': 'test-key', 'alg': 'RS'})
+      with self.assertRaises(AuthError) as context:
+        auth.verify_decode_jwt(token)
+      self.assertEqual(context.exception.error['code'], 'invalid_header')
+    finally:
+      auth.jwks_store = store
+
+  def test_parse_algorithms(self):
+    for value in ("['RS256']", '[RS256]', 'RS256', "['RS256', 'RS512']", 'RS256,RS512'):
+      self.assertEqual(auth.parse_algorithms(value)[0], 'RS256')
+    self.assertEqual(auth.parse_algorithms("['RS256', 'RS512']"), ['RS256', 'RS512'])
+
+
+class TokenCacheTestCase(unittest.TestCase):
+  """This class represents the verified token cache test case"""
+
+  def setUp(self):
+    self.cache = TokenCache(maxsize=2)
+    self.expires_at = int(time.time()) + 3600
+
+  def verified(self, *permissions, exp=None):
+    return VerifiedToken({'permissions': list(permissions), 'exp': exp or self.expires_at})
+
+  def test_hit_and_miss_counters(self):
+    self.assertIsNone(self.cache.get('token-a'))
+    self.cache.put('token-a', self.verified('get:actors'))
+
+    entry = self.cache.get('token-a')
+    self.assertEqual(entry.permissions, frozenset(['get:actors']))
+    self.assertEqual(self.cache.stats()['hits'], 1)
+    self.assertEqual(self.cache.stats()['misses'], 1)
+
+  def test_least_recently_used_entry_is_evicted(self):
+    self.cache.put('token-a', self.verified())
+    self.cache.put('token-b', self.verified())
+    self.cache.get('token-a')
+    self.cache.put('token-c', self.verified())
+
+    self.assertIsNotNone(self.cache.get('token-a'))
+    self.assertIsNone(self.cache.get('token-b'))
+    self.assertEqual(self.cache.stats()['evictions'], 1)
+
+  def test_entry_expires_at_token_exp(self):
+    entry = self.verified(exp=int(time.time()) + 1)
+    self.cache.put('token-a', entry)
+    entry.expires_at = int(time.time()) - 1
+
+    self.assertIsNone(self.cache.get('token-a'))
+    self.assertEqual(self.cache.stats()['expirations'], 1)
+
+  def test_requires_auth_verifies_a_token_once(self):
+    calls = []
+    verify_decode_jwt = auth.verify_decode_jwt
+    token_cache = auth.token_cache
+    auth.verify_decode_jwt = lambda token: calls.append(token) or {
+      'permissions': ['get:actors'],
+      'exp': self.expires_at
+    }
+    auth.token_cache = TokenCache(maxsize=2)
+
+    @requires_auth('get:actors')
+    def view(payload):
+      return payload['permissions']
+
+    try:
+      app = create_app()
+      for _ in range(3):
+        with app.test_request_context(headers={'Authorization': 'Bearer cached-token'}):
+          self.assertEqual(view(), ['get:actors'])
+
+      self.assertEqual(len(calls), 1)
+      self.assertEqual(auth.token_cache.stats()['hits'], 2)
+    finally:
+      auth.verify_decode_jwt = verify_decode_jwt
+      auth.token_cache = token_cache
+
+
+class FakeSharedCacheBackend(CacheBackend):
+  """Dictionary backed stand-in of a cache shared between processes"""
+
+  def __init__(self):
+    self.entries = {}
+    self.counters = {}
+
+  def get(self, key):
+    return self.entries.get(key)
+
+  def set(self, key, value, ttl):
+    self.entries[key] = value
+
+  def get_counter(self, key):
+    return self.counters.get(key, 0)
+
+  def incr(self, key):
+    self.counters[key] = self.counters.get(key, 0) + 1
+    return self.counters[key]
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+  """This class represents the response cache test case"""
+
+  def setUp(self):
+    self.backend = FakeSharedCacheBackend()
+    # two workers sharing the cache backend
+    self.app = create_app()
+    self.other_app = create_app()
+    response_cache.init_app(self.app, self.backend)
+    response_cache.init_app(self.other_app, self.backend)
+    self.headers = {'Authorization': 'Bearer {}'.format(CASTING_DIRECTOR)}
+
+  def test_get_actors_is_served_from_cache(self):
+    first = self.app.test_client().get('/actors?fields=id,age', headers=self.headers)
+
+    with record_queries() as recorder:
+      second = self.other_app.test_client().get('/actors?fields=id,age', headers=self.headers)
+
+    self.assertEqual(second.status_code, 200)
+    self.assertEqual(second.data, first.data)
+    # only the table versions of the etag are read
+    self.assertEqual(recorder.count, 1)
+    self.assertNotIn('"Actor"', recorder.statements[0][0])
+
+  def test_write_invalidates_cached_list(self):
+    res = self.app.test_client().get('/actors?fields=id,age', headers=self.headers)
+    actor = json.loads(res.data)['actors'][0]
+
+    res = self.other_app.test_client().patch('/actors/{}'.format(actor['id']),
+      headers=self.headers,
+      json={'age': actor['age'] + 1}
+    )
+    self.assertEqual(res.status_code, 200)
+
+    res = self.app.test_client().get('/actors?fields=id,age', headers=self.headers)
+    self.assertEqual(json.loads(res.data)['actors'][0]['age'], actor['age'] + 1)
+
+  def test_incomplete_backend_fails_when_created(self):
+    class CounterlessBackend(CacheBackend):
+      def get(self, key):
+        return None
+
+      def set(self, key, value, ttl):
+        pass
+
+    with self.assertRaises(TypeError):
+      CounterlessBackend()
+
+
+class ImportCatalogTestCase(unittest.TestCase):
+  """This class represents the bulk import test case"""
+
+  def setUp(self):
+    self.app = create_app()
+    self.directory = tempfile.mkdtemp()
+
+  def write(self, name, content):
+    path = os.path.join(self.directory, name)
+    with open(path, 'w') as import_file:
+      import_file.write(content)
+    return path
+
+  def test_import_merges_actors_movies_and_links(self):
+    actors = self.write('actors.csv',
+      'id,name,age,gender\n'
+      '900001,Imported Actor,30,F\n'
+      '900002,Invalid Actor,thirty,F\n'
+      '900001,Imported Actor Renamed,31,F\n')
+    movies = self.write('movies.ndjson',
+      '{"id": 900001, "title": "Imported Movie", "release_year": "2020-05-15"}\n')
+    links = self.write('links.csv',
+      'movie_id,actor_id\n'
+      '900001,900001\n'
+      '900001,999999\n')
+
+    with self.app.app_context():
+      stats = import_catalog(actors, movies, links, chunk_size=2, progress=lambda message: None)
+
+      self.assertEqual(stats['actors']['rejected'], 1)
+      self.assertEqual(stats['links']['unresolved'], 1)
+      actor = Actor.query.get(900001)
+      self.assertEqual(actor.name, 'Imported Actor Renamed')
+      self.assertEqual(actor.format()['movies'], ['Imported Movie'])
+
+
+class SearchIndexTestCase(unittest.TestCase):
+  """This class represents the in process search index test case"""
+
+  def setUp(self):
+    self.index = SearchIndex([
+      (1, 'Manuela Mercado'),
+      (2, 'Manuel Garcia'),
+      (3, 'Emma Stone'),
+      (4, 'Mercedes Ruehl')
+    ])
+
+  def test_prefix_matches_rank_first(self):
+    matches = self.index.search('manuel', 10)
+    self.assertEqual([row_id for row_id, _, _ in matches][:2], [2, 1])
+
+  def test_fuzzy_match_with_typo(self):
+    matches = self.index.search('Manuela Mercao', 10)
+    self.assertEqual(matches[0][0], 1)
+    self.assertNotIn(3, [row_id for row_id, _, _ in matches])
+
+  def test_limit(self):
+    self.assertEqual(len(self.index.search('m', 1)), 1)
+
+class CostarGraphTestCase(unittest.TestCase):
+  """This class represents the in process co-star graph test case"""
+
+  def setUp(self):
+    # movie 10: actors 1, 2 - movie 11: 2, 3 - movie 12: 3, 4 - movie 13: 1, 4, 5 - actor 6 in no movie
+    self.graph = CostarGraph([(1, 10), (1, 13), (2, 10), (2, 11), (3, 11), (3, 12), (4, 12), (4, 13), (5, 13)])
+
+  def test_both_directions(self):
+    self.assertEqual(list(self.graph.movies_of(4)), [12, 13])
+    self.assertEqual(list(self.graph.actors_of(13)), [1, 4, 5])
+    self.assertEqual(list(self.graph.movies_of(6)), [])
+
+  def test_costars(self):
+    self.assertEqual(self.graph.costars(1), {2: 1, 4: 1, 5: 1})
+
+  def test_shortest_path(self):
+    self.assertEqual(shortest_path(self.graph.expand, 2, 5, 6), ([2, 1, 5], [10, 13]))
+    self.assertEqual(len(shortest_path(self.graph.expand, 2, 4, 6)[1]), 2)
+    self.assertEqual(shortest_path(self.graph.expand, 3, 3, 6), ([3], []))
+    self.assertIsNone(shortest_path(self.graph.expand, 2, 5, 1))
+    self.assertIsNone(shortest_path(self.graph.expand, 1, 6, 6))
+
+  def test_relink(self):
+    self.graph.relink(Actor, 5, {10})
+    self.graph.relink(Movie, 12, {3})
+
+    self.assertEqual(sorted(self.graph.actors_of(10)), [1, 2, 5])
+    self.assertEqual(list(self.graph.actors_of(13)), [1, 4])
+    self.assertEqual(list(self.graph.movies_of(4)), [13])
+    self.assertEqual(self.graph.links, 8)
+    self.assertEqual(shortest_path(self.graph.expand, 5, 4, 6), ([5, 1, 4], [10, 13]))
+
+  def test_copy_does_not_see_later_changes(self):
+    graph = self.graph.copy()
+    graph.relink(Actor, 5, {10})
+    self.graph.relink(Actor, 1, set())
+
+    self.assertEqual(list(self.graph.movies_of(5)), [13])
+    self.assertEqual(sorted(graph.movies_of(1)), [10, 13])
+    self.assertEqual(sorted(graph.actors_of(10)), [1, 2, 5])
+    self.assertEqual(graph.links, 9)
+
+class JSONProviderTestCase(unittest.TestCase):
+  """This class represents the JSON providers test case"""
+
+  def setUp(self):
+    self.data = {
+      'success': True,
+      'movies': [{'title': 'Manuela Mercado', 'release_year': datetime.datetime(2020, 5, 15), 'actors': ['Á', 'B']}],
+      'stats': {1: 2}
+    }
+    self.providers = [StdlibJSONProvider]
+    if orjson is not None:
+      self.providers.append(OrjsonJSONProvider)
+
+  def test_iso_dates(self):
+    for provider in self.providers:
+      body = provider().dumps(self.data)
+
+      self.assertIsInstance(body, bytes)
+      self.assertEqual(json.loads(body)['movies'][0]['release_year'], '2020-05-15T00:00:00')
+      self.assertEqual(json.loads(body)['stats'], {'1': 2})
+
+  def test_legacy_dates(self):
+    for provider in self.providers:
+      body = provider(legacy_dates=True).dumps(self.data)
+
+      self.assertEqual(json.loads(body)['movies'][0]['release_year'], 'Fri, 15 May 2020 00:00:00 GMT')
+
+  def test_providers_agree(self):
+    for pretty in (False, True):
+      decoded = [json.loads(provider().dumps(self.data, pretty)) for provider in self.providers]
+      self.assertTrue(all(value == decoded[0] for value in decoded))
+      self.assertEqual(list(decoded[0]), ['movies', 'stats', 'success'])
+
+    self.assertIn(b'\n  "movies"', self.providers[-1]().dumps(self.data, pretty=True))
+
+  def test_provider_without_dumps_fails_when_created(self):
+    class DefaultOnlyProvider(JSONProvider):
+      pass
+
+    with self.assertRaises(TypeError):
+      DefaultOnlyProvider()
+
+class QueryRecorderTestCase(unittest.TestCase):
+  """This class represents the SQL query recorder test case"""
+
+  def setUp(self):
+    self.app = create_app()
+
+  def test_fingerprint_folds_parameters_and_in_lists(self):
+    self.assertEqual(fingerprint("SELECT id FROM t WHERE id IN (?, ?, ?) AND name = 'x' LIMIT 21"),
+      'SELECT id FROM t WHERE id IN (?) AND name = ? LIMIT ?')
+    self.assertEqual(fingerprint('INSERT INTO t (a, b) VALUES (%(a_m0)s, %(b_m0)s), (%(a_m1)s, %(b_m1)s)'),
+      'INSERT INTO t (a, b) VALUES (?)')
+
+  def test_detects_query_in_loop(self):
+    with self.app.app_context():
+      ids = [movie.id for movie in Movie.query.limit(3)]
+      with record_queries() as recorder:
+        for movie_id in ids:
+          Movie.query.get(movie_id)
+        Actor.query.first()
+
+    self.assertEqual(recorder.count, len(ids) + 1)
+    self.assertEqual(list(recorder.repeated(len(ids) - 1).values()), [len(ids)])
+    self.assertGreater(recorder.duration, 0)
+
+class ASGITestCase(unittest.TestCase):
+  """This class represents the ASGI entry point test case"""
+
+  def setUp(self):
+    self.app = create_app()
+    self.asgi_app = ThreadPoolWsgiToAsgi(self.app, 2)
+
+  def tearDown(self):
+    self.asgi_app.executor.shutdown()
+
+  def request(self, method, path, query_string=b'', headers=(), body=b'', disconnect_after=None):
+    """Send a request to the ASGI app and return (status, headers, body), the client leaves after
+    disconnect_after body messages"""
+    scope = {
+      'type': 'http',
+      'http_version': '1.1',
+      'method': method,
+      'path': path,
+      'query_string': query_string,
+      'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+      'client': ('127.0.0.1', 50000),
+      'server': ('localhost', 80)
+    }
+    messages = []
+    requests = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+      if requests:
+        return requests.pop(0)
+      while len(messages) <= (disconnect_after or float('inf')):
+        await asyncio.sleep(0.001)
+      return {'type': 'http.disconnect'}
+
+    async def send(message):
+      messages.append(message)
+
+    asyncio.run(self.asgi_app(scope, receive, send))
+    response_headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in messages[0]['headers']}
+    return messages[0]['status'], response_headers, b''.join(message.get('body', b'') for message in messages[1:])
+
+  def test_get_actors_same_as_wsgi(self):
+    headers = {'Authorization': 'Bearer {}'.format(CASTING_ASSISTANT)}
+    expected = self.app.test_client().get('/actors?limit=2', headers=headers)
+    status, response_headers, body = self.request('GET', '/actors', b'limit=2', headers.items())
+
+    self.assertEqual(status, 200)
+    self.assertEqual(json.loads(body), json.loads(expected.data))
+    self.assertEqual(response_headers['etag'], expected.headers['ETag'])
+
+  def test_error_handlers_same_as_wsgi(self):
+    status, _, body = self.request('DELETE', '/actors/1')
+
+    self.assertEqual(status, 401)
+    self.assertEqual(json.loads(body), {'success': False, 'error': 401, 'message': 'Not authorized'})
+
+  def test_request_body(self):
+    status, _, body = self.request('POST', '/actors/batch',
+      headers=[('Authorization', 'Bearer {}'.format(EXECUTIVE_PRODUCER)), ('Content-Type', 'application/json')],
+      body=json.dumps({'actors': [{'name': 'ASGI Actor', 'age': 30, 'gender': 'F'}]}).encode('utf-8'))
+
+    self.assertEqual(status, 200)
+    self.assertEqual(len(json.loads(body)['created']), 1)
+
+  def test_export_stops_when_client_disconnects(self):
+    self.app.config['EXPORT_CHUNK_SIZE'] = 1
+    headers = [('Authorization', 'Bearer {}'.format(CASTING_ASSISTANT))]
+    with self.app.app_context():
+      actors = Actor.query.count()
+    _, _, body = self.request('GET', '/actors/export', headers=headers)
+    _, _, partial = self.request('GET', '/actors/export', headers=headers, disconnect_after=2)
+
+    self.assertEqual(len(body.splitlines()), actors)
+    self.assertLess(len(partial.splitlines()), actors)
+
+class TimedQueuePoolTestCase(unittest.TestCase):
+  """This class represents the timed connection pool test case"""
+
+  def setUp(self):
+    self.engine = create_engine('sqlite://', poolclass=TimedQueuePool, pool_size=1, max_overflow=0,
+      pool_timeout=0.05, connect_args={'check_same_thread': False})
+
+  def tearDown(self):
+    self.engine.dispose()
+
+  def test_records_checkout_waits(self):
+    with self.engine.connect() as connection:
+      connection.execute('SELECT 1')
+    stats = pool_stats(self.engine.pool)
+
+    self.assertEqual(stats['wait']['count'], 1)
+    self.assertEqual(stats['wait']['buckets']['+Inf'], 1)
+    self.assertEqual(stats['checked_out'], 0)
+    self.assertEqual(stats['timeouts'], 0)
+
+  def test_counts_exhaustion_timeouts(self):
+    connection = self.engine.connect()
+    try:
+      with self.assertRaises(exc.TimeoutError):
+        self.engine.connect()
+      stats = pool_stats(self.engine.pool)
+    finally:
+      connection.close()
+
+    self.assertEqual(stats['checked_out'], 1)
+    self.assertEqual(stats['timeouts'], 1)
+    self.assertGreaterEqual(stats['wait']['sum'], 0.05)
+
+class StartupTestCase(unittest.TestCase):
+  """This class represents the app startup test case"""
+
+  def test_import_creates_no_app(self):
+    # in a fresh interpreter, the other tests have already created the module app
+    output = subprocess.run([sys.executable, '-c',
+      "import sys, app; print('app' in vars(app), 'alembic' in sys.modules)"],
+      cwd=os.path.dirname(os.path.abspath(__file__)), check=True, stdout=subprocess.PIPE).stdout
+
+    self.assertEqual(output.split(), [b'False', b'False'])
+
+  def test_create_app_without_create_all_runs_no_sql(self):
+    with mock.patch('config.DB_CREATE_ALL', False), record_queries() as recorder:
+      app = create_app()
+
+    self.assertEqual(recorder.count, 0)
+    self.assertFalse(app.config['DB_CREATE_ALL'])
+
+  def test_create_app_with_create_all_creates_tables(self):
+    with mock.patch('config.DB_CREATE_ALL', True), record_queries() as recorder:
+      create_app()
+
+    self.assertGreater(recorder.count, 0)
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
   unittest.main()